@@ -1,4 +1,128 @@
-from bert_score import score
+import os
+import json
+import sqlite3
+import hashlib
+import argparse
+from bert_score import BERTScorer
+
+# ✅ BERTScore 평가 엔진
+#   - 모델은 프로세스당 한 번만 로드 (get_scorer)
+#   - 길이가 비슷한 쌍끼리 묶어(length bucketing) 큰 배치로 채점
+#   - (모델, 정답, 후보) 해시 기준으로 점수를 캐시 → 재실행 시 새 출력만 채점
+#   - torch 스레드를 CPU 코어 수만큼 사용
+#
+# 데이터셋 JSONL 한 줄 예시:
+#   {"id": "q1", "question": "선루프 초기화 방법", "reference": "...", "candidates": {"haiku": "...", "sonnet": "..."}}
+#
+# 사용 예)
+#   python AI_score_evaluete.py --dataset eval.jsonl --out summary.json
+
+CACHE_PATH = os.getenv("BERTSCORE_CACHE", "bertscore_cache.sqlite")
+_scorers = {}
+
+
+def get_scorer(lang="ko", model_type=None):
+    key = (lang, model_type)
+    if key not in _scorers:
+        import torch
+        torch.set_num_threads(os.cpu_count() or 1)
+        _scorers[key] = BERTScorer(lang=lang, model_type=model_type)
+    return _scorers[key]
+
+
+# ------------------------ 점수 캐시 ------------------------
+class ScoreCache:
+    def __init__(self, path=CACHE_PATH):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS scores (key TEXT PRIMARY KEY, p REAL, r REAL, f1 REAL)"
+        )
+
+    @staticmethod
+    def make_key(model_name, reference, candidate):
+        return hashlib.sha256(f"{model_name}\0{reference}\0{candidate}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys):
+        found = {}
+        for i in range(0, len(keys), 500):
+            part = keys[i:i + 500]
+            rows = self.conn.execute(
+                f"SELECT key, p, r, f1 FROM scores WHERE key IN ({','.join('?' * len(part))})", part
+            ).fetchall()
+            found.update({k: (p, r, f1) for k, p, r, f1 in rows})
+        return found
+
+    def put_many(self, items):
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?)", items)
+
+
+# ------------------------ 배치 채점 ------------------------
+def score_pairs(pairs, lang="ko", model_type=None, batch_size=64, cache=None):
+    """pairs: [(candidate, reference)] → [(P, R, F1)] (입력 순서 유지)"""
+    scorer = get_scorer(lang, model_type)
+    model_name = scorer.model_type
+    keys = [ScoreCache.make_key(model_name, ref, cand) for cand, ref in pairs]
+    results = cache.get_many(keys) if cache else {}
+
+    todo = [i for i, key in enumerate(keys) if key not in results]
+    # 길이 순으로 정렬해 패딩 낭비를 줄임
+    todo.sort(key=lambda i: len(pairs[i][0]) + len(pairs[i][1]))
+
+    bucket = batch_size * 8
+    for start in range(0, len(todo), bucket):
+        idx = todo[start:start + bucket]
+        cands = [pairs[i][0] for i in idx]
+        refs = [pairs[i][1] for i in idx]
+        P, R, F1 = scorer.score(cands, refs, batch_size=batch_size)
+        new_items = []
+        for j, i in enumerate(idx):
+            score = (round(P[j].item(), 4), round(R[j].item(), 4), round(F1[j].item(), 4))
+            results[keys[i]] = score
+            new_items.append((keys[i], *score))
+        if cache:
+            cache.put_many(new_items)
+        print(f"채점 진행: {min(start + bucket, len(todo))}/{len(todo)} (캐시 적중 {len(pairs) - len(todo)})")
+
+    return [results[key] for key in keys]
+
+
+def evaluate_dataset(path, lang="ko", model_type=None, batch_size=64, use_cache=True):
+    rows = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                rows.append(json.loads(line))
+
+    pairs, owners = [], []
+    for row in rows:
+        for system, answer in row.get("candidates", {}).items():
+            pairs.append((answer, row["reference"]))
+            owners.append((row.get("id"), system))
+
+    cache = ScoreCache() if use_cache else None
+    scores = score_pairs(pairs, lang, model_type, batch_size, cache)
+
+    # 시스템별 요약
+    summary = {}
+    for (row_id, system), (p, r, f1) in zip(owners, scores):
+        s = summary.setdefault(system, {"count": 0, "precision": 0.0, "recall": 0.0, "f1": 0.0})
+        s["count"] += 1
+        s["precision"] += p
+        s["recall"] += r
+        s["f1"] += f1
+    for s in summary.values():
+        for k in ("precision", "recall", "f1"):
+            s[k] = round(s[k] / s["count"], 4)
+    return summary
+
+
+def print_summary(summary):
+    print(f"{'system':<24}{'count':>8}{'precision':>12}{'recall':>10}{'f1':>10}")
+    for system, s in sorted(summary.items(), key=lambda kv: kv[1]["f1"], reverse=True):
+        print(f"{system:<24}{s['count']:>8}{s['precision']:>12.4f}{s['recall']:>10.4f}{s['f1']:>10.4f}")
+
 
 def evaluate_bert_score(lang="ko"):
     #원본
@@ -17,14 +141,32 @@ def evaluate_bert_score(lang="ko"):
     #references = ["HDA는 고속도로 주행 보조 시스템으로, 차량의 속도와 차간거리를 자동으로 조절하여 편안하고 안전한 주행을 돕는 기능입니다. HDA 설정 방법은 다음과 같습니다: 계기판 또는 중앙 디스플레이에서 HDA 버튼을 찾아 누르세요. HDA 기능이 켜지면 계기판에 HDA 표시등이 켜집니다. 원하는 차량 속도와 차간거리를 설정할 수 있습니다. 고속도로 주행 중 HDA 기능이 자동으로 작동하여 안전하게 주행할 수 있습니다. HDA 사용 시 주의사항은 다음과 같습니다: 차량 주변 상황을 항상 주시하고 필요 시 직접 브레이크를 작동해야 합니다. 날씨, 도로 상황 등에 따라 HDA 기능이 원활하게 작동하지 않을 수 있습니다. HDA는 보조 기능이므로 운전자의 주의와 판단이 필요합니다. 궁금하신 점이 더 있으시다면 언제든 문의해 주시기 바랍니다."]
     references = ["선루프 초기화 방법은 다음과 같습니다. 시동을 걸거나 차량 전원을 'ON' 상태로 두십시오. 선루프 스위치로 파워 선블라인드와 선루프 글라스를 완전히 닫은 후 손을 떼십시오. 파워 선블라인드와 선루프 글라스가 닫힌 상태에서 스위치를 앞쪽으로 눌러 파워 선블라인드와 글라스가 살짝 한번 움직일 때까지 계속 눌렀다 손을 떼십시오. 파워 선블라인드와 선루프 글라스가 열렸다가 완전히 닫힐 때까지 다시 한번 선루프 스위치를 앞쪽으로 계속 누르십시오. 슬라이드 열림/닫힘 작동이 끝나기 전에는 스위치에서 손을 떼지 마십시오. 도중에 손을 떼면, 처음부터 다시 초기화를 진행해야 합니다. 선루프를 초기화하지 않으면 선루프가 제대로 작동하지 않을 수 있습니다."]
 
-    P, R, F1 = score(candidates, references, lang=lang)
-    
+    P, R, F1 = score_pairs(list(zip(candidates, references)), lang=lang)[0]
+
     return {
-        "precision": round(P.item(), 4),
-        "recall": round(R.item(), 4),
-        "f1": round(F1.item(), 4)
+        "precision": P,
+        "recall": R,
+        "f1": F1
     }
 
 
-result = evaluate_bert_score()
-print(result)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="BERTScore 평가")
+    parser.add_argument("--dataset", help="(question, reference, candidates) JSONL 경로")
+    parser.add_argument("--lang", default="ko")
+    parser.add_argument("--model-type", default=None)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--out", help="시스템별 요약 JSON 저장 경로")
+    args = parser.parse_args()
+
+    if not args.dataset:
+        # 데이터셋 없이 실행하면 기존 단일 예시 평가
+        result = evaluate_bert_score(args.lang)
+        print(result)
+    else:
+        summary = evaluate_dataset(args.dataset, args.lang, args.model_type, args.batch_size, not args.no_cache)
+        print_summary(summary)
+        if args.out:
+            with open(args.out, "w", encoding="utf-8") as f:
+                json.dump(summary, f, ensure_ascii=False, indent=2)
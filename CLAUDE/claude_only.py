@@ -1,11 +1,10 @@
 import os
 from dotenv import load_dotenv
-import anthropic
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # ✅ 공용 모듈(common) 경로
+from common.llm_client import complete
 
 load_dotenv()
-CLAUDE_API_KEY = os.getenv("ANTHROPIC_API_KEY")
-
-client = anthropic.Anthropic(api_key=CLAUDE_API_KEY)
 
 def ask_claude_only(question):
     prompt = f"""
@@ -13,12 +12,13 @@ def ask_claude_only(question):
 아래 질문에 대해 너가 이미 알고 있는 지식을 기반으로만 답변해.
 질문: {question}
 """
-    response = client.messages.create(
+    response = complete(
+        [{"role": "user", "content": prompt}],
         model="claude-3-5-sonnet-20240620",
-        max_tokens=500,
-        messages=[{"role": "user", "content": prompt}]
+        provider="anthropic",
+        max_tokens=500
     )
-    return response.content[0].text.strip()
+    return response["text"].strip()
 
 if __name__ == "__main__":
     q = input("질문 입력: ")
@@ -4,11 +4,15 @@ import re
 import joblib
 import faiss
 import numpy as np
-import fitz  # PyMuPDF
 from sentence_transformers import SentenceTransformer
 from dotenv import load_dotenv
-import anthropic
 import streamlit as st
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # ✅ 공용 모듈(common) 경로
+from common.llm_client import complete, hedge_from_env
+from common.context_packer import pack_context
+from common import reranker, dedup, pdf_extract
+from common.tracing import span, traced, start_metrics_server
 
 # ===============================
 # 1. 상수 정의
@@ -17,21 +21,15 @@ INDEX_FAISS = "index_pymupdf.faiss"
 INDEX_PKL = "index_pymupdf.pkl"
 
 # ===============================
-# 2. Claude API 키 로드
+# 2. 환경변수 로드 (Claude 호출은 common.llm_client)
 # ===============================
 load_dotenv()
-CLAUDE_API_KEY = os.getenv("ANTHROPIC_API_KEY")
-client = anthropic.Anthropic(api_key=CLAUDE_API_KEY)
 
 # ===============================
-# 3. PDF → 텍스트 추출 (PyMuPDF)
+# 3. PDF → 텍스트 추출 (PyMuPDF 우선, 품질 미달 페이지만 느린 추출기/OCR)
 # ===============================
 def extract_pdf_to_text(file):
-    text = ""
-    with fitz.open(stream=file.read(), filetype="pdf") as doc:
-        for page in doc:
-            text += page.get_text()
-    return text
+    return pdf_extract.extract_text(file, separator="")
 
 # ===============================
 # 4. 텍스트 청크 분할 (500단어)
@@ -43,16 +41,29 @@ def chunk_text(text, chunk_size=500):
 # ===============================
 # 5. 인덱스 생성
 # ===============================
+@traced("build_faiss_index")
 def build_faiss_index(pdf_files, embedding_model):
     all_chunks = []
+    sources = []
     for pdf in pdf_files:
-        text = extract_pdf_to_text(pdf)
+        with span("pdf_parse", file=getattr(pdf, "name", "")):
+            text = extract_pdf_to_text(pdf)
         chunks = chunk_text(text)
         all_chunks.extend(chunks)
+        sources.extend([getattr(pdf, "name", "")] * len(chunks))
 
-    st.info(f"총 청크 수: {len(all_chunks)} → 임베딩 계산 중...")
-    embeddings = embedding_model.encode(all_chunks)
+    # ✅ 같은 파일 안에서 거의 같은 청크(반복 경고/안내 문구)는 하나만 임베딩
+    with span("dedup") as sp:
+        all_chunks, dedup_stats = dedup.dedup_texts_per_source(all_chunks, sources)
+        sp.set(**dedup_stats)
+
+    st.info(f"총 청크 수: {dedup_stats['chunks_before']} → 중복 제외 {len(all_chunks)} → 임베딩 계산 중...")
+    with span("embed", chunks=len(all_chunks)):
+        embeddings = embedding_model.encode(all_chunks)
     dim = embeddings.shape[1]
+    if dedup_stats["removed"]:
+        st.caption(f"♻️ 중복 청크 {dedup_stats['removed']}개 제외, "
+                   f"인덱스 {dedup.index_bytes_saved(dedup_stats, dim) // 1024}KB 절감")
 
     index = faiss.IndexFlatL2(dim)
     index.add(np.array(embeddings, dtype=np.float32))
@@ -76,22 +87,29 @@ def load_faiss_index():
 # ===============================
 # 7. Hybrid 검색 (벡터 + 키워드)
 # ===============================
+@traced("search_context")
 def search_context(question, embedding_model, index, chunks, top_k=3):
-    q_emb = embedding_model.encode([question])
-    D, I = index.search(np.array(q_emb, dtype=np.float32), top_k * 2)
-    docs = [chunks[i] for i in I[0]]
-
-    # 키워드 매칭 우선
-    keywords = re.findall(r"[가-힣A-Za-z0-9]+", question)
-    keyword_hits = [doc for doc in docs if any(k in doc for k in keywords)]
-
-    if keyword_hits:
-        return "\n---\n".join(keyword_hits[:top_k])
-    return "\n---\n".join(docs[:top_k])
+    with span("embed_query"):
+        q_emb = embedding_model.encode([question])
+    with span("vector_search"):
+        D, I = index.search(np.array(q_emb, dtype=np.float32), reranker.candidate_count(top_k * 2))
+    docs = [chunks[i] for i in I[0] if i >= 0]
+
+    if reranker.RERANK_ENABLED:
+        # 크로스인코더 재정렬 (키워드 매칭 대신)
+        selected, _ = reranker.rerank(question, docs, top_k)
+    else:
+        # 키워드 매칭 우선
+        keywords = re.findall(r"[가-힣A-Za-z0-9]+", question)
+        keyword_hits = [doc for doc in docs if any(k in doc for k in keywords)]
+        selected = keyword_hits[:top_k] if keyword_hits else docs[:top_k]
+    # 중복 문장 제거 + 토큰 예산 내 관련 문장만 선택 (절감 토큰은 로그로 기록)
+    return pack_context(question, selected, separator="\n---\n")["context"]
 
 # ===============================
 # 8. Claude 응답 (요청한 프롬프트)
 # ===============================
+@traced("ask_claude")
 def ask_claude(question, embedding_model, index, chunks):
     context = search_context(question, embedding_model, index, chunks)
     if not context.strip():
@@ -113,17 +131,20 @@ def ask_claude(question, embedding_model, index, chunks):
 
 반드시 위 설명서 내용만 사용하여 답변하세요.
 """
-    response = client.messages.create(
+    response = complete(
+        [{"role": "user", "content": prompt}],
         model="claude-3-5-sonnet-20240620",
+        provider="anthropic",
         max_tokens=600,
-        messages=[{"role": "user", "content": prompt}]
+        hedge=hedge_from_env()
     )
-    return response.content[0].text.strip()
+    return response["text"].strip()
 
 # ===============================
 # 9. Streamlit UI
 # ===============================
 def main():
+    start_metrics_server()
     st.title("Claude + Owner's Manual (빠른 버전)")
 
     # Step 1: 인덱스 생성
@@ -1,15 +1,18 @@
-import PyPDF2
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # ✅ 공용 모듈(common) 경로
+from common import pdf_extract
 
 pdf_path = "Owner's_Manual.pdf"
 output_path = "manual_text.txt"
 
-with open(pdf_path, "rb") as pdf_file:
-    reader = PyPDF2.PdfReader(pdf_file)
-    text = ""
-    for page in reader.pages:
-        text += page.extract_text() + "\n"
+# ✅ 페이지마다 빠른 추출기부터 시도 (품질 미달 페이지만 느린 추출기/OCR)
+pages = pdf_extract.extract_pages(pdf_path)
+text = "".join(page["text"] + "\n" for page in pages)
 
 with open(output_path, "w", encoding="utf-8") as f:
     f.write(text)
 
 print("PDF 텍스트 추출 완료 -> manual_text.txt")
+print(pdf_extract.summarize(pages))
+print(pdf_extract.get_stats())
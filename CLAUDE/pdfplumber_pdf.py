@@ -1,47 +1,38 @@
 # -*- coding: utf-8 -*-
 import os
-import io
 import re
 import joblib
 import faiss
-import pdfplumber
-import pytesseract
-from pdf2image import convert_from_bytes
 import numpy as np
 from sentence_transformers import SentenceTransformer
 from dotenv import load_dotenv
-import anthropic
 import streamlit as st
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # ✅ 공용 모듈(common) 경로
+from common.llm_client import complete, hedge_from_env
+from common.context_packer import pack_context
+from common import reranker, dedup, pdf_extract
+from common.tracing import span, traced, start_metrics_server
 
 # ===============================
-# 1. Claude API
+# 1. 환경변수 로드 (Claude 호출은 common.llm_client)
 # ===============================
 load_dotenv()
-CLAUDE_API_KEY = os.getenv("ANTHROPIC_API_KEY")
-client = anthropic.Anthropic(api_key=CLAUDE_API_KEY)
 
 # ===============================
-# 2. PDF → 텍스트 추출 (페이지 진행률 + OCR 여부 표시)
+# 2. PDF → 텍스트 추출 (페이지 진행률 + 사용한 추출기 표시)
+#    빠른 추출기부터 시도하고 품질 미달 페이지만 pdfplumber / OCR 실행
 # ===============================
 def extract_pdf_to_text(file):
-    text = ""
-    pdf_bytes = file.read()
-    with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
-        total_pages = len(pdf.pages)
-        page_progress = st.progress(0)
-        for i, page in enumerate(pdf.pages):
-            st.write(f"{file.name} - {i+1}/{total_pages} 페이지 처리 중...")
-            page_text = page.extract_text()
-            if page_text and page_text.strip():
-                text += page_text + "\n"
-            else:
-                st.write(f"페이지 {i+1}: OCR 실행 중...")
-                images = convert_from_bytes(pdf_bytes, first_page=i+1, last_page=i+1)
-                for img in images:
-                    ocr_text = pytesseract.image_to_string(img, lang="kor+eng")
-                    text += ocr_text + "\n"
-            page_progress.progress(int(((i+1) / total_pages) * 100))
-    return text
+    page_progress = st.progress(0)
+
+    def on_page(done, total, page):
+        if page["extractor"] not in (None, "pymupdf", "pypdf"):
+            st.write(f"{file.name} - 페이지 {done}: {page['extractor']} 사용")
+        page_progress.progress(int(done / total * 100))
+
+    pages = pdf_extract.extract_pages(file, on_page=on_page)
+    return "".join(page["text"] + "\n" for page in pages if page["text"].strip())
 
 # ===============================
 # 3. 텍스트 청크 분할 (100단어)
@@ -53,28 +44,41 @@ def chunk_text(text, chunk_size=300):
 # ===============================
 # 4. FAISS Index 생성 & 저장 (전체 진행률 표시)
 # ===============================
+@traced("build_faiss_index")
 def build_faiss_index(pdf_files, embedding_model, index_path="index.faiss", meta_path="index.pkl"):
     all_chunks = []
+    sources = []
     total_files = len(pdf_files)
     overall_progress = st.progress(0)
 
     for file_idx, pdf in enumerate(pdf_files):
         st.write(f"파일 처리 중: {pdf.name} ({file_idx+1}/{total_files})")
-        text = extract_pdf_to_text(pdf)
+        with span("pdf_parse", file=getattr(pdf, "name", "")):
+            text = extract_pdf_to_text(pdf)
         if not text.strip():
             st.warning(f"{pdf.name}에서 텍스트 추출 실패")
             continue
 
         chunks = chunk_text(text)
         all_chunks.extend(chunks)
+        sources.extend([pdf.name] * len(chunks))
 
         overall_progress.progress(int(((file_idx + 1) / total_files) * 100))
 
+    # ✅ 같은 파일 안에서 거의 같은 청크(반복 경고/안내 문구)는 하나만 임베딩
+    with span("dedup") as sp:
+        all_chunks, dedup_stats = dedup.dedup_texts_per_source(all_chunks, sources)
+        sp.set(**dedup_stats)
+
     st.write("임베딩 생성 중...")
-    embeddings = embedding_model.encode(all_chunks)
-    st.write(f"총 청크 수: {len(all_chunks)}")
+    with span("embed", chunks=len(all_chunks)):
+        embeddings = embedding_model.encode(all_chunks)
+    st.write(f"총 청크 수: {dedup_stats['chunks_before']} → 중복 제외 {len(all_chunks)}")
 
     dim = embeddings.shape[1]
+    if dedup_stats["removed"]:
+        st.caption(f"♻️ 중복 청크 {dedup_stats['removed']}개 제외, "
+                   f"인덱스 {dedup.index_bytes_saved(dedup_stats, dim) // 1024}KB 절감")
     index = faiss.IndexFlatL2(dim)
     index.add(np.array(embeddings, dtype=np.float32))
 
@@ -95,15 +99,22 @@ def load_faiss_index(index_path="index.faiss", meta_path="index.pkl"):
 # ===============================
 # 6. 검색
 # ===============================
+@traced("search_context")
 def search_context(question, embedding_model, index, chunks, top_k=3):
-    query_emb = embedding_model.encode([question])
-    D, I = index.search(np.array(query_emb, dtype=np.float32), top_k)
-    results = [chunks[i] for i in I[0]]
-    return "\n---\n".join(results)
+    with span("embed_query"):
+        query_emb = embedding_model.encode([question])
+    with span("vector_search"):
+        D, I = index.search(np.array(query_emb, dtype=np.float32), reranker.candidate_count(top_k))
+    results = [chunks[i] for i in I[0] if i >= 0]
+    if reranker.RERANK_ENABLED:
+        results, _ = reranker.rerank(question, results, top_k)
+    # 중복 문장 제거 + 토큰 예산 내 관련 문장만 선택 (절감 토큰은 로그로 기록)
+    return pack_context(question, results, separator="\n---\n")["context"]
 
 # ===============================
 # 7. Claude 응답 (프롬프트 고정)
 # ===============================
+@traced("ask_claude")
 def ask_claude(question, embedding_model, index, chunks):
     context = search_context(question, embedding_model, index, chunks)
     prompt = f"""
@@ -122,17 +133,20 @@ def ask_claude(question, embedding_model, index, chunks):
 
 반드시 위 설명서 내용만 사용하여 답변하세요.
 """
-    response = client.messages.create(
+    response = complete(
+        [{"role": "user", "content": prompt}],
         model="claude-3-5-sonnet-20240620",
+        provider="anthropic",
         max_tokens=600,
-        messages=[{"role": "user", "content": prompt}]
+        hedge=hedge_from_env()
     )
-    return response.content[0].text.strip()
+    return response["text"].strip()
 
 # ===============================
 # 8. Streamlit UI
 # ===============================
 def main():
+    start_metrics_server()
     st.title("Claude + Owner's Manual (FAISS Index + 진행률 표시)")
 
     uploaded_files = st.file_uploader("PDF 파일 업로드 (최초 1회)", type="pdf", accept_multiple_files=True)
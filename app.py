@@ -1,15 +1,45 @@
+import os
 import gradio as gr
 from version_1.car_error import tab1_ui
 from version_2.model2 import tab2_ui
 from version_3_openAI.tab3 import tab3_ui
+from common.model_worker import worker_from_env
 
-with gr.Blocks() as app:
-    with gr.Tab("석현이네 정비센터"):
-        tab1_ui()
-    with gr.Tab("명우네 정비센터"):
-        tab2_ui()
-    with gr.Tab("OpenAI 정비센터"):
-        tab3_ui()
+# ✅ 로컬 모델(Mistral, Phi-3)은 각각 별도 워커 프로세스에서 실행
+#   → 한 탭의 긴 generate가 다른 탭/Gradio 이벤트 루프와 GIL, torch 스레드를 다투지 않고,
+#     워커가 OOM으로 죽어도 앱은 살아 있고 워커만 재시작됨
+#   MODEL_WORKERS=0 이면 예전처럼 같은 프로세스에서 실행
+#   (모델 메모리 예산 MODEL_MEMORY_BUDGET_GB는 전체 합계 → 워커를 쓰면 워커 수로 나눠서 각 워커에 전달)
+#   워커별 설정 예) MODEL_WORKER_CAR_ERROR_THREADS=4 MODEL_WORKER_CAR_ERROR_CPUS=0-3 MODEL_WORKER_CAR_ERROR_BUDGET_GB=10
+#                  MODEL_WORKER_PHI3_THREADS=4 MODEL_WORKER_PHI3_CPUS=4-7 MODEL_WORKER_PHI3_BUDGET_GB=18
+USE_WORKERS = os.getenv("MODEL_WORKERS", "1") == "1"
 
 
-app.launch()
+def build_app():
+    tab1_kwargs, tab2_kwargs, workers = {}, {}, []
+    if USE_WORKERS:
+        worker_specs = [("car_error", "version_1.car_error"), ("phi3", "version_2.model2")]
+        car_worker, phi3_worker = [worker_from_env(name, module, warmup="load_model", budget_share=len(worker_specs))
+                                   for name, module in worker_specs]
+        workers = [car_worker, phi3_worker]
+        tab1_kwargs["generate"] = car_worker.handler("generate_response", accumulate=False)
+        tab2_kwargs["chat_fn"] = phi3_worker.handler("chat", accumulate=False)
+
+    with gr.Blocks() as app:
+        with gr.Tab("석현이네 정비센터"):
+            tab1_ui(**tab1_kwargs)
+        with gr.Tab("명우네 정비센터"):
+            tab2_ui(**tab2_kwargs)
+        with gr.Tab("OpenAI 정비센터"):
+            tab3_ui()
+    return app, workers
+
+
+# 워커는 spawn 방식이라 이 파일을 다시 import 함 → 앱 생성/실행은 main에서만
+if __name__ == "__main__":
+    app, workers = build_app()
+    for worker in workers:
+        worker.start()  # 모델은 백그라운드에서 로드, UI는 바로 사용 가능
+    # ✅ 비동기 핸들러(OpenAI 탭)가 동시에 처리될 수 있도록 큐 동시성 설정
+    app.queue(default_concurrency_limit=int(os.getenv("GRADIO_CONCURRENCY", "200")))
+    app.launch()
@@ -0,0 +1,221 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import importlib
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(ROOT)
+from common.llm_client import complete
+from common.usage import usage_context
+from common.conversation_log import chunk_ref
+
+# ✅ 대량 질문 일괄 처리 (FAQ 생성, 회귀 테스트, 모델 비교)
+#   - 질문 JSONL → 검색 + 답변 → 결과 JSONL (답변, 출처 청크, 토큰 사용량, 단계별 시간)
+#   - 프로바이더별 동시 실행 수 제한 (--concurrency anthropic=8,openai=16)
+#   - 결과 파일이 곧 체크포인트: 다시 실행하면 성공한 (id, 모델)은 건너뛰고 이어서 처리
+#     (실패한 줄은 다음 실행에서 재시도되어 뒤에 성공 줄이 추가됨 → 같은 (id, 모델)은 마지막 줄 기준)
+#   - 여러 모델 비교: --models claude-3-haiku-20240307,claude-3-5-sonnet-20240620
+#   - --no-retrieval + ANTHROPIC_BASE_URL/OPENAI_BASE_URL 로 목 LLM 서버(common/mock_llm_server.py) 대상 테스트
+#
+# 질문 JSONL 한 줄 예시:
+#   {"id": "q1", "question": "선루프 초기화 방법", "collection": "Owner_s_Manual--8_ea53d30d"}
+#   (collection 생략 시 전체 매뉴얼 검색, id 생략 시 질문 해시)
+#
+# 사용 예)
+#   python bulk_qa.py --input faq.jsonl --output faq_answers.jsonl --backend claude
+#   python bulk_qa.py --input qa.jsonl --output cmp.jsonl --models claude-3-haiku-20240307,claude-3-5-sonnet-20240620
+
+# 검색 백엔드 (./vectorstore 는 앱 디렉토리 기준)
+BACKENDS = {
+    "claude": {"dir": "claude_RAG", "module": "retriever_claude", "retrieve": "retrieve_context_claude"},
+    "openai": {"dir": "openAI_RAG", "module": "retriever", "retrieve": "retrieve_context"},
+}
+DEFAULT_MODELS = {"claude": "claude-3-haiku-20240307", "openai": "gpt-3.5-turbo"}
+DEFAULT_CONCURRENCY = {"anthropic": 8, "openai": 16}
+
+
+def provider_of(model: str) -> str:
+    return "anthropic" if model.startswith("claude") else "openai"
+
+
+def load_questions(path: str, limit: int = None) -> list:
+    questions = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            row = json.loads(line)
+            text = row.get("question") or row.get("title") or row.get("body")
+            if not text:
+                continue
+            questions.append({
+                "id": str(row.get("id") or row.get("request_id") or hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]),
+                "question": text,
+                "collection": row.get("collection"),
+            })
+            if limit and len(questions) >= limit:
+                break
+    return questions
+
+
+# ------------------------ 체크포인트 (결과 파일) ------------------------
+def load_checkpoint(path: str) -> set:
+    """이미 성공한 (id, model) 목록. 비정상 종료로 잘린 마지막 줄은 잘라냄"""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+            data = data[:data.rfind(b"\n") + 1]
+    for line in data.decode("utf-8").splitlines():
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if not row.get("error"):
+            done.add((row["id"], row["model"]))
+    return done
+
+
+class ResultWriter:
+    def __init__(self, path: str, fsync_every: int = 20):
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.fsync_every = fsync_every
+
+    def write(self, record: dict):
+        with self._lock:
+            self._file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            self._file.flush()
+            self._pending += 1
+            if self._pending >= self.fsync_every:
+                os.fsync(self._file.fileno())
+                self._pending = 0
+
+    def close(self):
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+
+
+# ------------------------ 질문 1건 처리 ------------------------
+def load_backend(name: str):
+    spec = BACKENDS[name]
+    app_dir = os.path.join(ROOT, spec["dir"])
+    os.chdir(app_dir)
+    sys.path.insert(0, app_dir)
+    return importlib.import_module(spec["module"]), spec
+
+
+def answer_one(item: dict, model: str, backend, spec: dict, args, run_id: str) -> dict:
+    provider = provider_of(model)
+    record = {"id": item["id"], "question": item["question"], "collection": item["collection"],
+              "provider": provider, "model": model, "ts": time.time()}
+    timings = {}
+    try:
+        with usage_context(session_id=run_id, collection=item["collection"] or "*"):
+            if backend is None:
+                messages = [{"role": "user", "content": item["question"]}]
+                system, sources = None, []
+            else:
+                retrieved = getattr(backend, spec["retrieve"])(item["question"], item["collection"], top_k=args.top_k)
+                timings.update(retrieved["timings"])
+                messages = backend.build_messages(item["question"], retrieved["context"])
+                system = backend.SYSTEM_PROMPT if args.backend == "openai" else None
+                sources = [chunk_ref(doc) for doc in retrieved["docs"]]
+                record["context_tokens"] = retrieved["context_tokens"]
+
+            result = complete(messages, model=model, provider=provider, system=system,
+                              max_tokens=args.max_tokens, temperature=0.0, deadline=args.deadline)
+        timings["llm"] = result["latency"]
+        record.update(answer=result["text"], sources=sources, usage=result["usage"], answered_by=result["model"])
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    record["timings_ms"] = {k: round(v * 1000, 1) for k, v in timings.items()}
+    return record
+
+
+def parse_concurrency(value: str) -> dict:
+    limits = dict(DEFAULT_CONCURRENCY)
+    for part in (value or "").split(","):
+        if "=" in part:
+            provider, _, n = part.partition("=")
+            limits[provider.strip()] = int(n)
+    return limits
+
+
+def run(args) -> dict:
+    questions = load_questions(args.input, args.limit)
+    models = [m.strip() for m in (args.models or DEFAULT_MODELS[args.backend]).split(",") if m.strip()]
+    output = os.path.abspath(args.output)
+    done = load_checkpoint(output)
+    todo = [(q, m) for q in questions for m in models if (q["id"], m) not in done]
+    print(f"질문 {len(questions)}개 × 모델 {len(models)}개, 완료 {len(questions) * len(models) - len(todo)}건, 남은 작업 {len(todo)}건")
+    if not todo:
+        return {"done": 0, "errors": 0}
+
+    backend, spec = (None, None) if args.no_retrieval else load_backend(args.backend)
+    limits = parse_concurrency(args.concurrency)
+    # 프로바이더마다 별도 스레드 풀 → 한쪽이 느려도 다른 쪽 처리량은 유지
+    executors = {p: ThreadPoolExecutor(max_workers=limits.get(p, 4), thread_name_prefix=f"bulk-{p}")
+                 for p in {provider_of(m) for m in models}}
+    run_id = f"bulk-{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    writer = ResultWriter(output)
+    stats = {"done": 0, "errors": 0, "prompt_tokens": 0, "completion_tokens": 0}
+    start = time.perf_counter()
+    try:
+        futures = [executors[provider_of(m)].submit(answer_one, q, m, backend, spec, args, run_id) for q, m in todo]
+        for future in as_completed(futures):
+            record = future.result()
+            writer.write(record)
+            stats["done"] += 1
+            if record.get("error"):
+                stats["errors"] += 1
+            else:
+                stats["prompt_tokens"] += record["usage"]["prompt_tokens"]
+                stats["completion_tokens"] += record["usage"]["completion_tokens"]
+            if stats["done"] % args.progress_every == 0 or stats["done"] == len(todo):
+                elapsed = time.perf_counter() - start
+                print(f"진행 {stats['done']}/{len(todo)} (오류 {stats['errors']}) {stats['done'] / elapsed:.1f}건/s")
+    except KeyboardInterrupt:
+        print("⏹️ 중단됨 - 같은 명령으로 다시 실행하면 이어서 처리합니다.")
+    finally:
+        for executor in executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+        writer.close()
+    stats["seconds"] = round(time.perf_counter() - start, 2)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="대량 질문 일괄 처리")
+    parser.add_argument("--input", required=True, help="질문 JSONL")
+    parser.add_argument("--output", required=True, help="결과 JSONL (체크포인트 겸용)")
+    parser.add_argument("--backend", choices=list(BACKENDS), default="claude")
+    parser.add_argument("--models", help="쉼표로 구분한 모델 목록 (기본: 백엔드 기본 모델)")
+    parser.add_argument("--concurrency", help="프로바이더별 동시 실행 수 (예: anthropic=8,openai=16)")
+    parser.add_argument("--no-retrieval", action="store_true", help="검색 없이 질문만 LLM에 전달")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--max-tokens", type=int, default=1024)
+    parser.add_argument("--deadline", type=float, default=120.0, help="질문당 LLM 마감 시간 (초)")
+    parser.add_argument("--limit", type=int)
+    parser.add_argument("--progress-every", type=int, default=50)
+    args = parser.parse_args()
+
+    stats = run(args)
+    print(f"💾 결과: {args.output} {stats}")
+
+
+if __name__ == "__main__":
+    main()
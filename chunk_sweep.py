@@ -0,0 +1,272 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+import itertools
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(ROOT)
+from common import pdf_extract
+from common.context_packer import pack_context
+from retrieval_benchmark import load_questions, recall_at_k, percentiles
+
+# ✅ 청크 설정 그리드 탐색 (chunk_size × overlap × top_k × 인덱스 종류)
+#   - PDF 텍스트는 페이지 텍스트 캐시(common/page_cache.py)에서 재사용 → 설정마다 다시 파싱하지 않음
+#   - 청크 임베딩은 (모델, 청크 텍스트) 해시로 sqlite에 캐시 → 여러 설정에 같은 청크가 나오면 한 번만 계산
+#   - 임베딩은 메인 프로세스에서 배치로 계산, 인덱스 생성 + 검색은 설정별로 프로세스 풀에서 병렬 실행
+#   - 설정마다 recall@k, 답변당 프롬프트 토큰(컨텍스트 압축 후), 검색 지연 p95, 청크 수를 보고
+#   - recall ↑ / 토큰 ↓ / p95 ↓ 기준으로 다른 설정에 밀리지 않는 점(파레토 최적)을 표시
+#
+# 사용 예)
+#   python chunk_sweep.py --pdf manual.pdf --questions qa.jsonl \
+#       --chunk-sizes 300,500,1000 --overlaps 0,100,200 --top-ks 3,5 --indexes flat,hnsw --out sweep.json
+
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE", "embedding_cache.sqlite")
+INDEX_TYPES = ("exact", "flat", "hnsw", "ivf")
+
+
+def parse_ints(value: str) -> list:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+# ------------------------ 청크 분할 ------------------------
+def split_pages(pages: list, chunk_size: int, overlap: int) -> list:
+    """페이지 텍스트 → [{"text", "page"}] (RAG 앱과 같은 RecursiveCharacterTextSplitter, 없으면 글자 창)"""
+    try:
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+        splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=overlap)
+        split = splitter.split_text
+    except ImportError:
+        step = max(1, chunk_size - overlap)
+        split = lambda text: [text[i:i + chunk_size] for i in range(0, max(len(text) - overlap, 1), step)]
+    chunks = []
+    for page in pages:
+        for text in split(page["text"]):
+            if text.strip():
+                chunks.append({"text": text, "page": page["page"]})
+    return chunks
+
+
+# ------------------------ 임베딩 (캐시) ------------------------
+class EmbeddingCache:
+    def __init__(self, path=EMBED_CACHE_PATH):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)")
+
+    @staticmethod
+    def make_key(model_name, text):
+        return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys):
+        found = {}
+        for i in range(0, len(keys), 500):
+            part = keys[i:i + 500]
+            rows = self.conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part
+            ).fetchall()
+            found.update({k: np.frombuffer(v, dtype=np.float32) for k, v in rows})
+        return found
+
+    def put_many(self, items):
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?)", items)
+
+
+def get_embedder(name: str):
+    """텍스트 목록 → float32 행렬 함수 (openai 또는 sentence-transformers 모델명)"""
+    if name == "openai":
+        from langchain_community.embeddings import OpenAIEmbeddings
+        model = OpenAIEmbeddings()
+        return lambda texts: np.array(model.embed_documents(texts), dtype=np.float32)
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(name)
+    return lambda texts: np.asarray(model.encode(texts, batch_size=64), dtype=np.float32)
+
+
+def embed_texts(texts: list, embedder, model_name: str, cache, batch_size: int = 256) -> tuple:
+    """→ (임베딩 행렬, 새로 계산한 개수)"""
+    keys = [EmbeddingCache.make_key(model_name, t) for t in texts]
+    found = cache.get_many(list(set(keys))) if cache else {}
+    todo = sorted({k: i for i, k in enumerate(keys) if k not in found}.values())
+    for start in range(0, len(todo), batch_size):
+        idx = todo[start:start + batch_size]
+        vectors = embedder([texts[i] for i in idx])
+        items = []
+        for i, vector in zip(idx, vectors):
+            found[keys[i]] = vector
+            items.append((keys[i], vector.astype(np.float32).tobytes()))
+        if cache:
+            cache.put_many(items)
+    return np.stack([found[k] for k in keys]), len(todo)
+
+
+# ------------------------ 인덱스 + 검색 (워커 프로세스) ------------------------
+def _normalize(matrix):
+    return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+
+def build_index(index_type: str, vectors: np.ndarray):
+    """→ search(query 행렬, k) → 청크 인덱스 행렬 (코사인 유사도 기준)"""
+    vectors = _normalize(vectors).astype(np.float32)
+    if index_type == "exact":
+        return lambda queries, k: np.argsort(-(queries @ vectors.T), axis=1)[:, :k]
+
+    import faiss
+    faiss.omp_set_num_threads(1)  # 설정별 프로세스가 코어를 나눠 쓰도록
+    dim = vectors.shape[1]
+    if index_type == "flat":
+        index = faiss.IndexFlatIP(dim)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, 32, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efSearch = 64
+    elif index_type == "ivf":
+        nlist = max(1, int(np.sqrt(len(vectors))))
+        index = faiss.IndexIVFFlat(faiss.IndexFlatIP(dim), dim, nlist, faiss.METRIC_INNER_PRODUCT)
+        index.train(vectors)
+        index.nprobe = min(8, nlist)
+    else:
+        raise ValueError(f"알 수 없는 인덱스 종류: {index_type}")
+    index.add(vectors)
+    return lambda queries, k: index.search(queries, k)[1]
+
+
+def evaluate_config(job: dict) -> list:
+    """(chunk_size, overlap, 인덱스) 하나 → top_k별 결과 행 목록"""
+    chunks, vectors, queries, questions = job["chunks"], job["vectors"], job["queries"], job["questions"]
+    build_start = time.perf_counter()
+    search = build_index(job["index"], vectors)
+    build_seconds = time.perf_counter() - build_start
+    queries = _normalize(queries).astype(np.float32)
+
+    rows = []
+    for top_k in job["top_ks"]:
+        latencies, recalls, tokens = [], [], []
+        for q, query in zip(questions, queries):
+            start = time.perf_counter()
+            ids = search(query[None, :], top_k)[0]
+            latencies.append(time.perf_counter() - start)
+            hits = [{"id": str(i), "text": chunks[i]["text"], "page": chunks[i]["page"]} for i in ids if i >= 0]
+            recall = recall_at_k(hits, q["gold"])
+            if recall is not None:
+                recalls.append(recall)
+            tokens.append(pack_context(q["question"], [h["text"] for h in hits],
+                                       token_budget=job["token_budget"])["packed_tokens"])
+        rows.append({
+            "chunk_size": job["chunk_size"], "overlap": job["overlap"], "top_k": top_k, "index": job["index"],
+            "chunks": len(chunks),
+            "recall": round(float(np.mean(recalls)), 4) if recalls else None,
+            "prompt_tokens": round(float(np.mean(tokens)), 1) if tokens else 0.0,
+            "search_ms": percentiles(latencies),
+            "build_ms": round(build_seconds * 1000, 1),
+        })
+    return rows
+
+
+# ------------------------ 파레토 ------------------------
+def mark_pareto(rows: list):
+    """recall 높을수록, 프롬프트 토큰/검색 p95 낮을수록 좋음 → 다른 점에 모두 밀리지 않으면 pareto=True"""
+    def objectives(row):
+        return (-(row["recall"] or 0.0), row["prompt_tokens"], row["search_ms"].get("p95", 0.0))
+
+    points = [objectives(r) for r in rows]
+    for row, point in zip(rows, points):
+        row["pareto"] = not any(
+            all(o <= p for o, p in zip(other, point)) and other != point for other in points
+        )
+
+
+# ------------------------ 실행 ------------------------
+def run_sweep(args) -> dict:
+    questions = load_questions(args.questions, args.limit)
+    labeled = sum(1 for q in questions if q["gold"])
+    print(f"질문 {len(questions)}개 (정답 라벨 {labeled}개)")
+
+    extract_start = time.perf_counter()
+    pages = []
+    for path in args.pdf:
+        pages.extend(pdf_extract.extract_pages(path))
+    print(f"페이지 {len(pages)}개 텍스트 준비 {time.perf_counter() - extract_start:.2f}s "
+          f"(캐시 {pdf_extract.get_stats().get('cache', {})})")
+
+    embedder = get_embedder(args.embedding)
+    cache = None if args.no_cache else EmbeddingCache()
+    queries, _ = embed_texts([q["question"] for q in questions], embedder, args.embedding, cache)
+
+    grid = [(size, overlap) for size, overlap in itertools.product(args.chunk_sizes, args.overlaps) if overlap < size]
+    jobs = []
+    embed_stats = {"computed": 0, "total": 0}
+    for chunk_size, overlap in grid:
+        chunks = split_pages(pages, chunk_size, overlap)
+        vectors, computed = embed_texts([c["text"] for c in chunks], embedder, args.embedding, cache)
+        embed_stats["computed"] += computed
+        embed_stats["total"] += len(chunks)
+        print(f"chunk_size={chunk_size} overlap={overlap}: 청크 {len(chunks)}개 (새 임베딩 {computed}개)")
+        for index_type in args.indexes:
+            jobs.append({"chunk_size": chunk_size, "overlap": overlap, "index": index_type, "top_ks": args.top_ks,
+                         "chunks": chunks, "vectors": vectors, "queries": queries, "questions": questions,
+                         "token_budget": args.token_budget})
+
+    rows = []
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for result in executor.map(evaluate_config, jobs):
+            rows.extend(result)
+    mark_pareto(rows)
+    rows.sort(key=lambda r: (not r["pareto"], -(r["recall"] or 0.0), r["prompt_tokens"]))
+    return {
+        "config": {k: v for k, v in vars(args).items()},
+        "pages": len(pages),
+        "labeled_questions": labeled,
+        "embeddings": embed_stats,
+        "results": rows,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+def print_table(summary: dict):
+    print(f"{'size':>6}{'ovl':>6}{'k':>4}{'index':>8}{'chunks':>8}{'recall':>8}{'tokens':>9}{'p95(ms)':>10}  pareto")
+    for r in summary["results"]:
+        recall = "-" if r["recall"] is None else f"{r['recall']:.3f}"
+        print(f"{r['chunk_size']:>6}{r['overlap']:>6}{r['top_k']:>4}{r['index']:>8}{r['chunks']:>8}"
+              f"{recall:>8}{r['prompt_tokens']:>9.1f}{r['search_ms'].get('p95', 0.0):>10.3f}  {'★' if r['pareto'] else ''}")
+    if not summary["labeled_questions"]:
+        print("⚠️ 정답 라벨(gold)이 있는 질문이 없어 recall은 계산되지 않았습니다.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="청크 설정 그리드 탐색")
+    parser.add_argument("--pdf", action="append", required=True, help="PDF 경로 (여러 번 지정 가능)")
+    parser.add_argument("--questions", required=True, help="질문 JSONL (gold 라벨 포함)")
+    parser.add_argument("--chunk-sizes", type=parse_ints, default=[300, 500, 1000])
+    parser.add_argument("--overlaps", type=parse_ints, default=[0, 100, 200])
+    parser.add_argument("--top-ks", type=parse_ints, default=[3, 5])
+    parser.add_argument("--indexes", type=lambda v: v.split(","), default=["flat"],
+                        help=f"인덱스 종류 ({','.join(INDEX_TYPES)})")
+    parser.add_argument("--embedding", default="paraphrase-MiniLM-L3-v2",
+                        help="openai 또는 sentence-transformers 모델명")
+    parser.add_argument("--token-budget", type=int, default=1500)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--limit", type=int)
+    parser.add_argument("--no-cache", action="store_true", help="임베딩 캐시 사용 안 함")
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+    unknown = set(args.indexes) - set(INDEX_TYPES)
+    if unknown:
+        parser.error(f"알 수 없는 인덱스 종류: {','.join(sorted(unknown))}")
+
+    summary = run_sweep(args)
+    print_table(summary)
+    out = args.out or f"sweep_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    print(f"💾 결과 저장: {out}")
+
+
+if __name__ == "__main__":
+    main()
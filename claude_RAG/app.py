@@ -1,14 +1,29 @@
 import streamlit as st
 from streamlit_option_menu import option_menu
-import os, re, base64
-from retriever_claude import ingest_pdf, ask_with_context_claude, ask_across_collections_claude
-from utils import get_file_hash, vectorstore_exists
+import os, base64, uuid
+from utils import get_file_hash, vectorstore_exists, list_collections, make_collection_name
+from common import rag_api_client, chroma_bulk
+import chat_worker
+
+# ✅ RAG_API_URL 지정 시 HTTP 서비스(common/rag_server.py)의 얇은 클라이언트로 동작
+USE_API = bool(rag_api_client.RAG_API_URL)
+if not USE_API:
+    from retriever_claude import ingest_pdf
+from common.tracing import span, start_metrics_server, histogram_summary, recent_traces
 from datetime import datetime
 
+# 진행 중인 답변 확인 주기 (초)
+CHAT_POLL_INTERVAL = float(os.getenv("CHAT_POLL_INTERVAL", "0.5"))
+
 # ------------------------ 페이지 설정 ------------------------
 st.set_page_config(page_title="📘 현대차 Claude GPT", layout="wide", page_icon="🚗")
 
+# ✅ METRICS_PORT 지정 시 Prometheus /metrics 엔드포인트 실행 (프로세스당 1회)
+start_metrics_server()
+
 # ------------------------ 이미지 Base64 인코딩 ------------------------
+# ✅ 프로세스당 한 번만 읽고 인코딩 (재실행마다 이미지 인코딩 방지)
+@st.cache_resource(show_spinner=False)
 def get_image_base64(image_path):
     with open(image_path, "rb") as img_file:
         return base64.b64encode(img_file.read()).decode()
@@ -63,9 +78,17 @@ st.markdown(f"""
     </style>
 """, unsafe_allow_html=True)
 
+# ------------------------ 컬렉션 목록 (프로세스 캐시) ------------------------
+# ✅ 업로드 후 clear(), 다른 프로세스/서버에서 추가된 매뉴얼은 ttl 후 반영
+@st.cache_data(ttl=60, show_spinner=False)
+def load_collections():
+    return rag_api_client.list_collections() if USE_API else list_collections()
+
 # ------------------------ 세션 상태 초기화 ------------------------
 if "chat_messages" not in st.session_state:
     st.session_state.chat_messages = []
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex  # 토큰 사용량/예산 집계용
 
 # ------------------------ 사이드 메뉴 ------------------------
 with st.sidebar:
@@ -96,6 +119,17 @@ with st.sidebar:
         }
     )
 
+    # ✅ 단계별 지연시간 디버그 패널 (선택)
+    if st.checkbox("🐞 디버그 패널", value=False):
+        summary = histogram_summary()
+        if summary:
+            st.caption("단계별 평균 지연시간 (ms)")
+            st.table({name: [v["count"], v["mean_ms"], v["errors"]] for name, v in summary.items()})
+        for trace in recent_traces(limit=3):
+            with st.expander(f"trace {trace[0]['trace_id'][:8]}"):
+                for sp in sorted(trace, key=lambda x: x["start"]):
+                    st.text(f"{sp['name']:<32}{sp['duration_ms']:>10.1f} ms")
+
 # ------------------------ 홈 ------------------------
 if selected == "홈":
     st.markdown("<br><br><h1 style='text-align: center; color: #0D47A1;'>🚗 현대차 매뉴얼 기반 Claude GPT</h1>", unsafe_allow_html=True)
@@ -125,19 +159,32 @@ elif selected == "매뉴얼 업로드":
 
     if uploaded:
         with st.spinner("📥 업로드 중..."):
-            with open("temp.pdf", "wb") as f:
-                f.write(uploaded.read())
+            with span("file_write"):
+                with open("temp.pdf", "wb") as f:
+                    f.write(uploaded.read())
 
-            file_hash = get_file_hash("temp.pdf")[:8]
+            with span("hash"):
+                content_hash = get_file_hash("temp.pdf")
             raw_name = os.path.splitext(uploaded.name)[0]
-            clean_name = re.sub(r"[^\x00-\x7F]", "", raw_name)
-            clean_name = re.sub(r"[^a-zA-Z0-9._-]", "_", clean_name).strip("._-")
-            short_name = clean_name[:30] if len(clean_name) >= 3 else f"doc_{file_hash}"
-            collection_name = f"{short_name}_{file_hash}"
+            collection_name = make_collection_name(uploaded.name, content_hash)
 
-            if not vectorstore_exists(collection_name):
+            if USE_API:
+                with st.spinner("🧠 문서 임베딩 중입니다... (RAG 서버)"):
+                    created = rag_api_client.ingest("temp.pdf", uploaded.name)["created"]
+            elif not vectorstore_exists(collection_name):
                 with st.spinner("🧠 문서 임베딩 중입니다..."):
-                    ingest_pdf("temp.pdf", collection_name)
+                    dedup_stats = ingest_pdf("temp.pdf", collection_name, display_name=raw_name, content_hash=content_hash)
+                if dedup_stats and dedup_stats["removed"]:
+                    st.caption(f"♻️ 중복 청크 {dedup_stats['removed']}개 제외: "
+                               f"{dedup_stats['chunks_before']} → {dedup_stats['chunks_after']}개 임베딩")
+                if dedup_stats and dedup_stats.get("load"):
+                    st.caption(chroma_bulk.format_stats(dedup_stats["load"]))
+                created = True
+            else:
+                created = False
+
+            if created:
+                load_collections.clear()
                 st.success(f"✅ 임베딩 완료: {collection_name}")
             else:
                 st.info("📁 이미 등록된 문서입니다.")
@@ -150,49 +197,56 @@ elif selected == "챗봇":
 
     st.header("💬 정비사 Claude 챗봇")
 
-    def list_collections():
-        dirs = [d for d in os.listdir("./vectorstore") if os.path.isdir(os.path.join("./vectorstore", d))]
-        return sorted(dirs)
-
-    collections = list_collections()
-    selected_doc = st.selectbox("📚 매뉴얼 선택 (전체 검색 가능)", ["메뉴얼 선택 필요"] + collections)
+    # ✅ 카탈로그에서 빌드 완료된 컬렉션만 조회 (표시는 원래 파일명)
+    display_names = {c["name"]: c["display_name"] or c["name"] for c in load_collections()}
+    selected_doc = st.selectbox("📚 매뉴얼 선택 (전체 검색 가능)", ["메뉴얼 선택 필요"] + list(display_names),
+                                format_func=lambda name: display_names.get(name, name))
     st.session_state["collection_name"] = None if selected_doc == "메뉴얼 선택 필요" else selected_doc
 
     if st.session_state["collection_name"] is None:
         st.warning("📌 매뉴얼을 선택해주세요. 전체 검색 또는 특정 매뉴얼을 선택해야 질문이 가능합니다.")
-        
 
-    # ✅ 입력값 초기화는 위젯 선언 전에 수행해야 함
-    if "clear_chatbox" in st.session_state and st.session_state["clear_chatbox"]:
-        st.session_state["chatbox"] = ""
-        st.session_state["clear_chatbox"] = False  # 초기화 완료
-
-    # ✅ 텍스트 입력 (입력창 위쪽 배치)
-    user_input = st.text_input("🚘 차량 문제나 궁금한 점을 입력하세요", key="chatbox")
-
-    # ✅ 이전 입력 처리
-    if "pending_input" in st.session_state:
-        pending = st.session_state.pop("pending_input")
-
-        with st.spinner("🔧 답변 중..."):
-            if st.session_state["collection_name"]:
-                result = ask_with_context_claude(pending, st.session_state["collection_name"])
+    # ✅ 채팅 메시지 출력
+    with span("render", messages=len(st.session_state.chat_messages)):
+        for msg in st.session_state.chat_messages:
+            with st.chat_message(msg["role"]):
+                st.markdown(msg["content"])
+
+    # ✅ 진행 중인 답변은 프래그먼트만 주기적으로 다시 그림 (전체 재실행 없음)
+    @st.fragment(run_every=CHAT_POLL_INTERVAL)
+    def render_answer_job():
+        job = st.session_state.get("answer_job")
+        if job is None:
+            return
+        with st.chat_message("user"):
+            st.markdown(job.question)
+        with st.chat_message("assistant"):
+            if job.error:
+                st.error(f"❌ 답변 생성 실패: {job.error}")
             else:
-                result = ask_across_collections_claude(pending)
-
-        st.session_state.chat_messages.append({"role": "user", "content": pending})
-        st.session_state.chat_messages.append({"role": "assistant", "content": result["result"]})
+                st.markdown(job.text() or "🔧 답변 중...")
 
-    # ✅ 채팅 메시지 출력
-    for msg in st.session_state.chat_messages:
-        with st.chat_message(msg["role"]):
-            st.markdown(msg["content"])
+        if job.done():
+            answer = f"❌ 답변 생성 실패: {job.error}" if job.error else job.text()
+            st.session_state.chat_messages.append({"role": "user", "content": job.question})
+            st.session_state.chat_messages.append({"role": "assistant", "content": answer})
+            st.session_state.answer_job = None
+            st.rerun()
 
-    # ✅ 새로운 입력 감지
+    # ✅ 질문 제출은 작업만 등록하고 바로 반환 (검색/생성은 chat_worker 스레드에서)
+    user_input = st.chat_input("🚘 차량 문제나 궁금한 점을 입력하세요")
     if user_input:
-        st.session_state["pending_input"] = user_input
-        st.session_state["clear_chatbox"] = True  # 다음 rerun 시 초기화
-        st.rerun()
+        stale = st.session_state.get("answer_job")
+        if stale is not None and not stale.done():
+            # 이전 질문은 취소 (LLM 스트림도 닫힘)
+            stale.cancel()
+            st.session_state.chat_messages.append({"role": "user", "content": stale.question})
+            st.session_state.chat_messages.append({"role": "assistant", "content": (stale.text() + "\n\n⏹️ 새 질문으로 취소됨").strip()})
+        st.session_state.answer_job = chat_worker.submit(
+            user_input, st.session_state["collection_name"], st.session_state.session_id)
+
+    if st.session_state.get("answer_job") is not None:
+        render_answer_job()
 
 
 # ------------------------ 대화 저장 ------------------------
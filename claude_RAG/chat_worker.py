@@ -0,0 +1,92 @@
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # ✅ 공용 모듈(common) 경로
+from common import rag_api_client
+from common.usage import usage_context
+from common.conversation_log import get_log, chunk_ref
+
+# ✅ Streamlit 스크립트 스레드 밖에서 질문을 처리하는 작업 실행기
+#   - 모듈 전역 스레드 풀이라 프로세스당 한 번만 생성됨 (Streamlit 재실행과 무관)
+#   - 세션마다 진행 중인 AnswerJob 하나를 session_state에 보관하고, 프래그먼트가 주기적으로 확인
+#   - 새 질문이 들어오면 이전 작업은 cancel() → 토큰 스트림을 닫아 LLM 생성도 중단
+
+CHAT_WORKERS = int(os.getenv("CHAT_WORKERS", "8"))
+_executor = ThreadPoolExecutor(max_workers=CHAT_WORKERS, thread_name_prefix="chat")
+
+
+class AnswerJob:
+    def __init__(self, question: str, collection_name: str, session_id: str):
+        self.question = question
+        self.collection_name = collection_name
+        self.session_id = session_id
+        self.parts = []
+        self.sources = []
+        self.result = None
+        self.error = None
+        self.future = None
+        self._cancelled = threading.Event()
+
+    # ------------------------ 워커 스레드 ------------------------
+    def _events(self):
+        if rag_api_client.RAG_API_URL:
+            # 얇은 클라이언트 모드: 서버 SSE 스트림 (서버가 사용량/대화 로그 기록)
+            return rag_api_client.ask_stream(self.question, self.collection_name, self.session_id)
+        from retriever_claude import stream_answer_claude
+        # 세션 id를 넘기면 후속 질문 재작성 + 세션 청크 재사용 + 이전 턴 창 (common/conversation_context)
+        return stream_answer_claude(self.question, self.collection_name, session_id=self.session_id)
+
+    def run(self):
+        with usage_context(session_id=self.session_id):
+            events = self._events()
+            try:
+                for event in events:
+                    if self._cancelled.is_set():
+                        return
+                    if event["type"] == "sources":
+                        self.sources = event["documents"]
+                    elif event["type"] == "token":
+                        self.parts.append(event["text"])
+                    elif event["type"] == "error":
+                        raise RuntimeError(event.get("detail"))
+                    elif event["type"] == "done":
+                        self.result = event
+            finally:
+                events.close()
+
+        if not rag_api_client.RAG_API_URL:
+            # ✅ 대화 로그 (백그라운드 기록, 채팅 지연 없음)
+            get_log().log_turn(
+                self.session_id, self.question, self.result["result"],
+                collection=self.collection_name or "*",
+                chunks=[chunk_ref(doc) for doc in self.sources],
+                timings=self.result.get("timings")
+            )
+
+    def _run_safely(self):
+        try:
+            self.run()
+        except Exception as e:
+            self.error = e
+
+    # ------------------------ 스크립트 스레드 ------------------------
+    def text(self) -> str:
+        return "".join(self.parts)
+
+    def done(self) -> bool:
+        return self.future is not None and self.future.done()
+
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+        if self.future is not None:
+            self.future.cancel()  # 아직 시작 전이면 실행 자체를 건너뜀
+
+
+def submit(question: str, collection_name: str, session_id: str) -> AnswerJob:
+    job = AnswerJob(question, collection_name, session_id)
+    job.future = _executor.submit(job._run_safely)
+    return job
@@ -1,6 +1,8 @@
 import os
 from dotenv import load_dotenv
-import anthropic
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # ✅ 공용 모듈(common) 경로
+from common.llm_client import complete
 
 # ✅ 환경변수 로드
 load_dotenv()
@@ -10,23 +12,17 @@ SYSTEM_PROMPT = (
   ""
 )
 
-# ✅ Claude 클라이언트 설정
-claude_client = anthropic.Anthropic(api_key=os.getenv("CLAUDE_API_KEY"))
-
 # ✅ Claude 호출 함수 정의
 def call_claude(user_question: str) -> str:
-    response = claude_client.messages.create(
+    response = complete(
+        [{"role": "user", "content": user_question}],
         model="claude-3-haiku-20240307",
+        provider="anthropic",
         max_tokens=1024,
         temperature=0.0,
-        system=SYSTEM_PROMPT,  # ✅ system 프롬프트는 별도 파라미터로 전달
-        messages=[
-            {"role": "user", "content": user_question}
-        ]
-        )
-
-
-    return response.content[0].text
+        system=SYSTEM_PROMPT  # ✅ system 프롬프트는 별도 파라미터로 전달
+    )
+    return response["text"]
 
 # ✅ 예시 사용
 if __name__ == "__main__":
@@ -1,12 +1,19 @@
-from langchain_community.document_loaders import PyPDFLoader
 from langchain_community.vectorstores import Chroma
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.schema import SystemMessage, HumanMessage
+from langchain.schema import SystemMessage, HumanMessage, Document
 from langchain_community.embeddings import OpenAIEmbeddings 
-import anthropic
 import os
 from dotenv import load_dotenv
 import uuid
+import time
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # ✅ 공용 모듈(common) 경로
+from common.llm_client import complete, hedge_from_env, stream
+from common.context_packer import pack_context
+from common import reranker, router, dedup, pdf_extract, chroma_bulk, conversation_context
+from common.tracing import span, traced
+from common.usage import usage_context
+from common.catalog import get_catalog
 
 # ✅ 환경변수 로드
 load_dotenv()
@@ -21,92 +28,281 @@ SYSTEM_PROMPT = (
     "해당 내용을 친절하게 설명해 주세요. 잘 모르겠으면 해당 답변은 잘 모르겠습니다라고 말해주세요."
 )
 
-# ✅ Claude 클라이언트 설정
-claude_client = anthropic.Anthropic(api_key=os.getenv("CLAUDE_API_KEY"))
+# ✅ Claude 호출 (공용 LLM 레이어: 커넥션 재사용, 타임아웃/재시도, 선택적 헤징)
+CLAUDE_MODEL = os.getenv("CLAUDE_MODEL", "claude-3-haiku-20240307")
 
 def call_claude(messages: list) -> str:
-    response = claude_client.messages.create(
-        model="claude-3-haiku-20240307",
+    response = complete(
+        messages,
+        model=CLAUDE_MODEL,
+        provider="anthropic",
         max_tokens=1024,
         temperature=0.0,
-        messages=messages
+        hedge=hedge_from_env()
     )
-    return response.content[0].text
+    return response["text"]
 
 # ✅ PDF 임베딩
 
 embedding_function = OpenAIEmbeddings()
 
-def ingest_pdf(pdf_path: str, collection_name: str):
-    loader = PyPDFLoader(pdf_path)
-    documents = loader.load()
+@traced("ingest_pdf")
+def ingest_pdf(pdf_path: str, collection_name: str, display_name: str = None, content_hash: str = None):
+    # ✅ 카탈로그에 빌드 상태 기록 (빌드 중/실패한 컬렉션은 목록에 나오지 않음)
+    catalog = get_catalog()
+    catalog.begin_build(collection_name, content_hash, display_name, embedding_model=embedding_function.model)
+    try:
+        pages, chunk_count, dedup_stats = _build_collection(pdf_path, collection_name)
+    except Exception as e:
+        catalog.fail_build(collection_name, str(e))
+        raise
+    catalog.finish_build(collection_name, pages=pages, chunks=chunk_count)
+    return dedup_stats
 
-    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    chunks = splitter.split_documents(documents)
+def _build_collection(pdf_path: str, collection_name: str):
+    # ✅ 페이지마다 빠른 추출기부터 시도, 품질 미달 페이지만 느린 추출기/OCR로 (PyPDFLoader와 같은 메타데이터)
+    with span("pdf_parse", collection=collection_name) as sp:
+        pages = pdf_extract.extract_pages(pdf_path)
+        documents = [
+            Document(page_content=page["text"], metadata={"source": pdf_path, "page": page["page"],
+                                                          "extractor": page["extractor"]})
+            for page in pages
+        ]
+        sp.set(**pdf_extract.summarize(pages))
 
-    vectordb = Chroma(
-        collection_name=collection_name,
-        persist_directory=f"./vectorstore/{collection_name}",
-        embedding_function=embedding_function
-    )
+    with span("split") as sp:
+        splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+        chunks = splitter.split_documents(documents)
+        sp.set(chunks=len(chunks))
 
-    for i in range(0, len(chunks), 100):
-        batch = chunks[i:i+100]
-        vectordb.add_documents(batch)
+    # ✅ 반복되는 경고/안내 문구 청크는 하나만 임베딩 (대표 청크에 등장 페이지 기록)
+    with span("dedup") as sp:
+        chunks, dedup_stats = dedup.dedup_documents(chunks)
+        sp.set(**dedup_stats)
 
-    vectordb.persist()
+    _vectordbs.pop(os.path.join("./vectorstore", collection_name), None)
+    persist_directory = f"./vectorstore/{collection_name}"
 
-# ✅ 단일 문서 기반 질문
+    # 임베딩 API 호출 + 벡터 저장
+    with span("embed_store", chunks=len(chunks)):
+        if chroma_bulk.CHROMA_BULK_LOAD:
+            # ✅ 임베딩을 먼저 병렬 계산 → 큰 트랜잭션으로 한 번에 쓰고 HNSW는 마지막에 한 번 구성
+            dedup_stats["load"] = chroma_bulk.build_collection(persist_directory, collection_name, chunks, embedding_function)
+            vectordb = Chroma(
+                collection_name=collection_name,
+                persist_directory=persist_directory,
+                embedding_function=embedding_function
+            )
+        else:
+            vectordb = Chroma(
+                collection_name=collection_name,
+                persist_directory=persist_directory,
+                embedding_function=embedding_function
+            )
+            for i in range(0, len(chunks), 100):
+                batch = chunks[i:i+100]
+                vectordb.add_documents(batch)
 
-def ask_with_context_claude(question: str, collection_name: str, top_k: int = 5) -> dict:
-    vectordb = Chroma(
-        collection_name=collection_name,
-        persist_directory=f"./vectorstore/{collection_name}",
-        embedding_function=embedding_function
-    )
-    retriever = vectordb.as_retriever(search_kwargs={"k": top_k})
-    docs = retriever.get_relevant_documents(question)
+            vectordb.persist()
 
-    context = "\n\n".join([doc.page_content for doc in docs])
+    # ✅ 전체 검색 라우팅용 중심 벡터 (청크 임베딩 k-means)
+    with span("centroids"):
+        stored = vectordb.get(include=["embeddings"])["embeddings"]
+        router.build_centroids(f"./vectorstore/{collection_name}", stored)
+    if stored is not None and len(stored):
+        dedup_stats["index_bytes_saved"] = dedup.index_bytes_saved(dedup_stats, len(stored[0]))
 
-    messages = [
-        {"role": "user", "content": f"{SYSTEM_PROMPT}\n\n문서 내용:\n{context}\n\n질문: {question}"}
-    ]
-    answer = call_claude(messages)
+    return len(documents), len(chunks), dedup_stats
 
-    return {
-        "result": answer,
-        "source_documents": docs
-    }
+# ✅ 컬렉션별 Chroma 핸들 재사용 (서버처럼 오래 떠 있는 프로세스에서 매 요청 재생성 방지)
+_vectordbs = {}
 
-# ✅ 전체 문서 검색 질문
+def get_vectordb(collection_name: str, vectorstore_root: str = "./vectorstore"):
+    path = os.path.join(vectorstore_root, collection_name)
+    if path not in _vectordbs:
+        _vectordbs[path] = Chroma(
+            collection_name=collection_name,
+            persist_directory=path,
+            embedding_function=embedding_function
+        )
+    return _vectordbs[path]
 
-def ask_across_collections_claude(question: str, vectorstore_root: str = "./vectorstore", top_k: int = 5) -> dict:
-    all_docs = []
-    for collection_name in os.listdir(vectorstore_root):
-        path = os.path.join(vectorstore_root, collection_name)
-        if os.path.isdir(path):
-            vectordb = Chroma(
-                collection_name=collection_name,
-                persist_directory=path,
-                embedding_function=embedding_function
-            )
-            retriever = vectordb.as_retriever(search_kwargs={"k": top_k})
+# ✅ 검색 → 재정렬 (collection_name이 없으면 전체 매뉴얼 검색)
+
+def _search(question: str, collection_name: str = None, vectorstore_root: str = "./vectorstore",
+            top_k: int = 5, route: bool = None) -> tuple:
+    route = router.ROUTER_ENABLED if route is None else route
+    timings = {}
+    if collection_name:
+        # ✅ 재정렬을 켜면 후보를 넉넉히 가져온 뒤 크로스인코더로 상위 top_k만 선택
+        with span("retrieve", collection=collection_name) as sp:
+            retriever = get_vectordb(collection_name, vectorstore_root).as_retriever(
+                search_kwargs={"k": reranker.candidate_count(top_k)})
             docs = retriever.get_relevant_documents(question)
-            all_docs.extend(docs)
+        timings["retrieve"] = sp.duration
+
+        if reranker.RERANK_ENABLED:
+            with span("rerank", candidates=len(docs)) as sp:
+                docs, _ = reranker.rerank(question, docs, top_k, text_of=lambda d: d.page_content)
+            timings["rerank"] = sp.duration
+    else:
+        # 카탈로그에서 준비 완료(ready)된 컬렉션만 검색
+        names = get_catalog(vectorstore_root).ready_names()
+        # ✅ 질문 임베딩은 한 번만 계산해서 라우팅과 모든 컬렉션 검색에 재사용
+        with span("embed_query") as sp:
+            query_vector = embedding_function.embed_query(question)
+        timings["embed_query"] = sp.duration
+
+        if route:
+            # ✅ 중심 벡터와 비교해 관련 매뉴얼 상위 N개만 검색 (확신이 낮으면 전체 검색)
+            with span("route", collections=len(names)) as sp:
+                names, route_info = router.route(query_vector, names, vectorstore_root)
+                sp.set(**route_info)
+            timings["route"] = sp.duration
 
-    # 중복 제거 및 정렬
-    unique_docs = list({doc.page_content: doc for doc in all_docs}.values())
-    top_docs = sorted(unique_docs, key=lambda d: len(d.page_content), reverse=True)[:top_k]
+        hits = []
+        with span("retrieve", collection="*", collections=len(names)) as sp:
+            k = reranker.candidate_count(top_k, len(names))
+            for name in names:
+                if os.path.isdir(os.path.join(vectorstore_root, name)):
+                    hits.extend(get_vectordb(name, vectorstore_root).similarity_search_by_vector_with_relevance_scores(
+                        query_vector, k=k))
+        timings["retrieve"] = sp.duration
 
-    context = "\n\n".join([doc.page_content for doc in top_docs])
+        # 중복 제거 및 정렬
+        # 모든 컬렉션의 결과를 벡터 거리(작을수록 가까움) 순으로 합쳐서 같은 본문은 가장 가까운 것만 남김
+        unique = {}
+        for doc, _ in sorted(hits, key=lambda hit: hit[1]):
+            unique.setdefault(doc.page_content, doc)
+        unique_docs = list(unique.values())
+        if reranker.RERANK_ENABLED:
+            # 컬렉션 전체 후보를 질문과의 관련도로 재정렬 (가까운 순 RERANK_CANDIDATES개까지만)
+            unique_docs = unique_docs[:reranker.candidate_count(top_k)]
+            with span("rerank", candidates=len(unique_docs)) as sp:
+                docs, _ = reranker.rerank(question, unique_docs, top_k, text_of=lambda d: d.page_content)
+            timings["rerank"] = sp.duration
+        else:
+            docs = sorted(unique_docs, key=lambda d: len(d.page_content), reverse=True)[:top_k]
+    return docs, timings
 
-    messages = [
-        {"role": "user", "content": f"{SYSTEM_PROMPT}\n\n문서 내용:\n{context}\n\n질문: {question}"}
-    ]
-    answer = call_claude(messages)
+# ✅ 대화형 검색 (session_id가 있으면)
+#   후속 질문은 독립 검색어로 재작성 → 세션에 캐시된 청크로 충분하면 검색 생략, 아니면 새 청크만 뒤에 추가
+
+def _search_conversational(question: str, session_id: str, collection_name: str = None,
+                           vectorstore_root: str = "./vectorstore", top_k: int = 5, route: bool = None) -> tuple:
+    store = conversation_context.get_store()
+    with span("rewrite") as sp:
+        query, followup = store.rewrite(session_id, collection_name, question)
+        reused, coverage = store.cached_docs(session_id, collection_name, query, top_k, question) if followup else ([], 0.0)
+        sp.set(followup=followup, cached=len(reused), coverage=round(coverage, 2))
+
+    skipped = bool(reused) and coverage >= conversation_context.REUSE_COVERAGE
+    if skipped:
+        store.skipped_retrieval(session_id, collection_name, reused)
+        docs, timings = reused, {"rewrite": sp.duration}
+    else:
+        fetched, timings = _search(query, collection_name, vectorstore_root, top_k, route)
+        timings["rewrite"] = sp.duration
+        docs = store.merge(session_id, collection_name, reused, fetched)
+
+    info = {"query": query, "followup": followup, "reused": len(reused), "fetched": len(docs) - len(reused),
+            "retrieval_skipped": skipped, "coverage": round(coverage, 2)}
+    return docs, timings, query, info
+
+# ✅ 검색 → 재정렬 → 컨텍스트 압축
+
+def retrieve_context_claude(question: str, collection_name: str = None, vectorstore_root: str = "./vectorstore",
+                            top_k: int = 5, route: bool = None, session_id: str = None) -> dict:
+    history, conversation = [], None
+    if session_id and conversation_context.CONVERSATION_ENABLED:
+        docs, timings, query, conversation = _search_conversational(
+            question, session_id, collection_name, vectorstore_root, top_k, route)
+        history = conversation_context.get_store().history(session_id, collection_name)
+        conversation["history_turns"] = len(history)
+    else:
+        docs, timings = _search(question, collection_name, vectorstore_root, top_k, route)
+        query = question
+
+    # ✅ 겹치는 청크 병합 + 중복 문장 제거 + 토큰 예산 내 관련 문장 선택
+    with span("pack") as sp:
+        packed = pack_context(query, [doc.page_content for doc in docs])
+        sp.set(saved_tokens=packed["saved_tokens"])
+
+    return {
+        "docs": docs,
+        "context": packed["context"],
+        "context_tokens": {k: v for k, v in packed.items() if k != "context"},
+        "timings": timings,
+        "query": query,
+        "history": history,
+        "conversation": conversation
+    }
+
+# history: 이전 턴 창 [{"question", "answer"}] (토큰 예산 안의 최근 턴만)
+def build_messages(question: str, context: str, history: list = None) -> list:
+    messages = []
+    for turn in history or []:
+        if turn["answer"]:
+            messages.append({"role": "user", "content": turn["question"]})
+            messages.append({"role": "assistant", "content": turn["answer"]})
+    messages.append({"role": "user", "content": f"{SYSTEM_PROMPT}\n\n문서 내용:\n{context}\n\n질문: {question}"})
+    return messages
+
+def _remember(session_id: str, collection_name: str, question: str, retrieved: dict, answer: str):
+    if session_id and conversation_context.CONVERSATION_ENABLED:
+        conversation_context.get_store().remember(session_id, collection_name, question, retrieved["query"],
+                                                  answer, retrieved["docs"])
+
+def _answer(question: str, collection_name: str = None, vectorstore_root: str = "./vectorstore", top_k: int = 5,
+            route: bool = None, session_id: str = None) -> dict:
+    retrieved = retrieve_context_claude(question, collection_name, vectorstore_root, top_k, route, session_id)
+    timings = retrieved["timings"]
+    with span("llm") as sp, usage_context(collection=collection_name or "*"):
+        answer = call_claude(build_messages(question, retrieved["context"], retrieved["history"]))
+    timings["llm"] = sp.duration
+    _remember(session_id, collection_name, question, retrieved, answer)
 
     return {
         "result": answer,
-        "source_documents": top_docs
+        "source_documents": retrieved["docs"],
+        "context_tokens": retrieved["context_tokens"],
+        "timings": timings,
+        "conversation": retrieved["conversation"]
     }
+
+# ✅ 단일 문서 기반 질문
+
+@traced("ask_with_context_claude")
+def ask_with_context_claude(question: str, collection_name: str, top_k: int = 5, session_id: str = None) -> dict:
+    return _answer(question, collection_name, top_k=top_k, session_id=session_id)
+
+# ✅ 전체 문서 검색 질문
+
+@traced("ask_across_collections_claude")
+def ask_across_collections_claude(question: str, vectorstore_root: str = "./vectorstore", top_k: int = 5,
+                                  route: bool = None, session_id: str = None) -> dict:
+    """route=None이면 ROUTER_ENABLED 설정을 따르고, False면 항상 전체 컬렉션 검색"""
+    return _answer(question, None, vectorstore_root, top_k, route, session_id)
+
+# ✅ 스트리밍 질문 (HTTP 서비스용)
+#   {"type": "sources"} → {"type": "token"} 반복 → {"type": "done"} 순서로 이벤트를 내보냄
+#   소비 측에서 close()하면 Claude 스트림도 함께 닫혀 생성이 중단됨
+
+def stream_answer_claude(question: str, collection_name: str = None, vectorstore_root: str = "./vectorstore", top_k: int = 5,
+                         session_id: str = None):
+    retrieved = retrieve_context_claude(question, collection_name, vectorstore_root, top_k, session_id=session_id)
+    timings = retrieved["timings"]
+    yield {"type": "sources", "documents": retrieved["docs"], "context_tokens": retrieved["context_tokens"],
+           "conversation": retrieved["conversation"]}
+
+    parts = []
+    start = time.perf_counter()
+    with usage_context(collection=collection_name or "*"):
+        for text in stream(build_messages(question, retrieved["context"], retrieved["history"]), model=CLAUDE_MODEL,
+                           provider="anthropic", max_tokens=1024, temperature=0.0):
+            parts.append(text)
+            yield {"type": "token", "text": text}
+    timings["llm"] = time.perf_counter() - start
+    # 끝까지 생성된 답변만 세션 맥락에 기록 (중간에 close되면 여기까지 오지 않음)
+    _remember(session_id, collection_name, question, retrieved, "".join(parts))
+    yield {"type": "done", "result": "".join(parts), "timings": timings}
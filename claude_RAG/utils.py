@@ -1,9 +1,25 @@
 import hashlib
 import os
+import re
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # ✅ 공용 모듈(common) 경로
+from common.catalog import get_catalog
 
 def get_file_hash(file_path: str) -> str:
     with open(file_path, "rb") as f:
         return hashlib.sha256(f.read()).hexdigest()
 
-def vectorstore_exists(file_hash: str) -> bool:
-    return os.path.exists(f"./vectorstore/{file_hash}")
+# ✅ 업로드 파일명 → 컬렉션 이름 (한글/특수문자 제거, 최대 30자 + 해시 앞 8자리)
+def make_collection_name(filename: str, file_hash: str) -> str:
+    raw_name = os.path.splitext(filename)[0]
+    clean_name = re.sub(r"[^\x00-\x7F]", "", raw_name)
+    clean_name = re.sub(r"[^a-zA-Z0-9._-]", "_", clean_name).strip("._-")
+    short_name = clean_name[:30] if len(clean_name) >= 3 else f"doc_{file_hash[:8]}"
+    return f"{short_name}_{file_hash[:8]}"
+
+# ✅ 디렉토리 존재 여부 대신 카탈로그 조회 (빌드 완료된 컬렉션만 True)
+def vectorstore_exists(collection_name: str) -> bool:
+    return get_catalog("./vectorstore").exists(collection_name)
+
+def list_collections() -> list:
+    return get_catalog("./vectorstore").list_ready()
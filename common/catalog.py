@@ -0,0 +1,192 @@
+import os
+import time
+import shutil
+import logging
+import sqlite3
+import threading
+
+# ✅ 벡터스토어 컬렉션 카탈로그 (SQLite)
+#   ./vectorstore 디렉토리를 매번 스캔하는 대신 컬렉션당 한 행으로 상태를 관리
+#   - status: building → ready / failed (quarantined는 정비 도구가 격리한 컬렉션)
+#   - 목록/존재 확인은 인덱스 조회, 빌드 중이거나 실패한 컬렉션은 선택 목록에 나오지 않음
+#   - 준비 완료가 아닌 컬렉션을 다시 빌드하면 이전 빌드가 남긴 데이터를 먼저 비움
+
+CATALOG_FILE = "_catalog.sqlite"
+
+STATUS_BUILDING = "building"
+STATUS_READY = "ready"
+STATUS_FAILED = "failed"
+STATUS_QUARANTINED = "quarantined"
+
+logger = logging.getLogger(__name__)
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+def dir_size(path: str) -> int:
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except OSError:
+                pass
+    return total
+
+
+class Catalog:
+    def __init__(self, root: str = "./vectorstore"):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(root, CATALOG_FILE), check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS collections (
+                name TEXT PRIMARY KEY,
+                content_hash TEXT,
+                display_name TEXT,
+                pages INTEGER DEFAULT 0,
+                chunks INTEGER DEFAULT 0,
+                embedding_model TEXT,
+                size_bytes INTEGER DEFAULT 0,
+                built_at REAL,
+                status TEXT NOT NULL,
+                error TEXT
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_collections_status ON collections(status)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_collections_hash ON collections(content_hash)")
+        # 예전 마이그레이션이 이름 끝 8자리를 content_hash로 넣은 행 → 전체 해시를 모르므로 NULL
+        self.conn.execute("UPDATE collections SET content_hash = NULL WHERE length(content_hash) < 64")
+        self.conn.commit()
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    # ------------------------ 빌드 상태 ------------------------
+    def _clear_stale(self, name):
+        """실패/중단된 이전 빌드가 남긴 컬렉션 비우기 (그대로 두면 add_documents가 그 위에 덧붙여 청크가 중복됨)"""
+        path = self.path(name)
+        if not os.path.isdir(path):
+            return
+        try:
+            # 같은 프로세스의 chroma 클라이언트가 경로를 캐시하고 있을 수 있어 파일 삭제보다 컬렉션 삭제가 안전
+            import chromadb
+            client = chromadb.PersistentClient(path=path)
+            if name in [getattr(c, "name", c) for c in client.list_collections()]:
+                client.delete_collection(name)
+        except Exception as e:
+            logger.warning("stale collection %s: delete_collection failed (%s), removing directory", name, e)
+            shutil.rmtree(path, ignore_errors=True)
+
+    def begin_build(self, name, content_hash=None, display_name=None, embedding_model=None):
+        existing = self.get(name)
+        if existing and existing["status"] != STATUS_READY:
+            self._clear_stale(name)
+        with self._lock, self.conn:
+            self.conn.execute("""
+                INSERT INTO collections (name, content_hash, display_name, embedding_model, status)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET
+                    content_hash = excluded.content_hash,
+                    display_name = COALESCE(excluded.display_name, collections.display_name),
+                    embedding_model = excluded.embedding_model,
+                    status = excluded.status,
+                    error = NULL
+            """, (name, content_hash, display_name or name, embedding_model, STATUS_BUILDING))
+
+    def finish_build(self, name, pages=0, chunks=0):
+        size = dir_size(self.path(name))
+        with self._lock, self.conn:
+            self.conn.execute(
+                "UPDATE collections SET pages = ?, chunks = ?, size_bytes = ?, built_at = ?, status = ? WHERE name = ?",
+                (pages, chunks, size, time.time(), STATUS_READY, name)
+            )
+
+    def fail_build(self, name, error=""):
+        self.set_status(name, STATUS_FAILED, error)
+
+    def set_status(self, name, status, error=None):
+        with self._lock, self.conn:
+            self.conn.execute("UPDATE collections SET status = ?, error = ? WHERE name = ?", (status, error, name))
+
+    def update(self, name, **fields):
+        if not fields:
+            return
+        columns = ", ".join(f"{key} = ?" for key in fields)
+        with self._lock, self.conn:
+            self.conn.execute(f"UPDATE collections SET {columns} WHERE name = ?", (*fields.values(), name))
+
+    def remove(self, name):
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM collections WHERE name = ?", (name,))
+
+    # ------------------------ 조회 ------------------------
+    def get(self, name):
+        with self._lock:
+            row = self.conn.execute("SELECT * FROM collections WHERE name = ?", (name,)).fetchone()
+        return dict(row) if row else None
+
+    def exists(self, name) -> bool:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM collections WHERE name = ? AND status = ?", (name, STATUS_READY)).fetchone()
+        return row is not None
+
+    def find_by_hash(self, content_hash):
+        """파일 전체 sha256으로 찾기. 해시를 모르는 기존(마이그레이션) 컬렉션은 이름 끝 8자리로 비교"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT * FROM collections WHERE content_hash = ? AND status = ?", (content_hash, STATUS_READY)).fetchone()
+            if row is None and content_hash:
+                row = self.conn.execute(
+                    "SELECT * FROM collections WHERE content_hash IS NULL AND status = ? AND substr(name, -9) = ?",
+                    (STATUS_READY, "_" + content_hash[:8])).fetchone()
+        return dict(row) if row else None
+
+    def list_ready(self) -> list:
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT * FROM collections WHERE status = ? ORDER BY display_name", (STATUS_READY,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def list_all(self) -> list:
+        with self._lock:
+            rows = self.conn.execute("SELECT * FROM collections ORDER BY name").fetchall()
+        return [dict(row) for row in rows]
+
+    def ready_names(self) -> list:
+        return [row["name"] for row in self.list_ready()]
+
+    # ------------------------ 기존 디렉토리 등록 ------------------------
+    def sync_from_disk(self):
+        """카탈로그에 없는 기존 컬렉션 디렉토리를 등록 (최초 1회 마이그레이션용)"""
+        known = {row["name"] for row in self.list_all()}
+        for name in sorted(os.listdir(self.root)):
+            path = self.path(name)
+            if name in known or not os.path.isdir(path) or name.startswith("_"):
+                continue
+            has_sqlite = os.path.exists(os.path.join(path, "chroma.sqlite3"))
+            # 전체 파일 해시는 알 수 없으므로 NULL (이름 끝 8자리가 해시 앞부분 → find_by_hash가 이름으로 비교)
+            with self._lock, self.conn:
+                self.conn.execute(
+                    "INSERT INTO collections (name, content_hash, display_name, size_bytes, built_at, status, error) "
+                    "VALUES (?, NULL, ?, ?, ?, ?, ?)",
+                    (name, name, dir_size(path), os.path.getmtime(path),
+                     STATUS_READY if has_sqlite else STATUS_FAILED,
+                     None if has_sqlite else "chroma.sqlite3 없음")
+                )
+
+
+def get_catalog(root: str = "./vectorstore") -> Catalog:
+    """경로별 카탈로그 (프로세스당 1개, 처음 열 때 기존 디렉토리 등록)"""
+    key = os.path.abspath(root)
+    with _catalogs_lock:
+        if key not in _catalogs:
+            catalog = Catalog(root)
+            catalog.sync_from_disk()
+            _catalogs[key] = catalog
+        return _catalogs[key]
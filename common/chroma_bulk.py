@@ -0,0 +1,132 @@
+import os
+import time
+import uuid
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+from common.tracing import span
+
+# ✅ Chroma 일괄 적재 (컬렉션 새로 만들 때)
+#   - 임베딩을 먼저 큰 배치로 병렬 계산 → 문서/메타데이터/벡터를 한 번에 씀
+#   - chroma.sqlite3를 WAL 모드로 두고 클라이언트 최대 배치 크기(수천 개) 단위 트랜잭션으로 기록
+#     (예전: add_documents 100개마다 트랜잭션 + HNSW 삽입)
+#   - 컬렉션 메타데이터 hnsw:batch_size / hnsw:sync_threshold 를 청크 수로 지정
+#     → 적재 중에는 브루트포스 버퍼에만 쌓이고 HNSW 세그먼트는 마지막에 한 번 구성/저장
+#   - 임베딩 / 저장 단계별 처리량(청크/초) 보고 → 전체 매뉴얼 재구성이 어디서 막히는지 확인
+#   CHROMA_BULK_LOAD=0 이면 기존 add_documents 경로 사용
+#
+# 사용 예)
+#   vectors, embed_stats = embed_texts([c.page_content for c in chunks], embedding_function)
+#   stats = bulk_load("./vectorstore/abc", "abc", chunks, vectors)
+
+CHROMA_BULK_LOAD = os.getenv("CHROMA_BULK_LOAD", "1") == "1"
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "500"))  # 임베딩 API 한 번에 보낼 청크 수
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))  # 동시에 보낼 임베딩 요청 수
+SQLITE_FILE = "chroma.sqlite3"
+MIN_HNSW_BATCH = 2  # chroma가 받는 최소 배치 크기
+
+
+def _rate(count: int, seconds: float) -> float:
+    return round(count / seconds, 1) if seconds > 0 else 0.0
+
+
+def embed_texts(texts: list, embedding_function, batch_size: int = EMBED_BATCH_SIZE,
+                concurrency: int = EMBED_CONCURRENCY) -> tuple:
+    """langchain 임베딩 객체로 텍스트 임베딩 (배치 병렬, 입력 순서 유지) → (벡터 목록, 통계)"""
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    start = time.perf_counter()
+    with span("embed", chunks=len(texts), batches=len(batches)) as sp:
+        if len(batches) <= 1 or concurrency <= 1:
+            results = [embedding_function.embed_documents(batch) for batch in batches]
+        else:
+            with ThreadPoolExecutor(max_workers=min(concurrency, len(batches))) as pool:
+                results = list(pool.map(embedding_function.embed_documents, batches))
+        vectors = [vector for batch in results for vector in batch]
+        seconds = time.perf_counter() - start
+        stats = {"embed_seconds": round(seconds, 2), "embed_chunks_per_sec": _rate(len(texts), seconds)}
+        sp.set(**stats)
+    return vectors, stats
+
+
+def _enable_wal(persist_directory: str):
+    # journal_mode=WAL은 파일에 기록되므로 chroma 내부 연결에도 그대로 적용됨
+    path = os.path.join(persist_directory, SQLITE_FILE)
+    if not os.path.exists(path):
+        return
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+    finally:
+        conn.close()
+
+
+def _max_batch_size(client) -> int:
+    # chromadb 버전에 따라 메서드/속성 이름이 다름 (sqlite 변수 개수 한도에서 계산된 값)
+    if hasattr(client, "get_max_batch_size"):
+        return client.get_max_batch_size()
+    return getattr(client, "max_batch_size", 5000)
+
+
+def bulk_write(persist_directory: str, collection_name: str, ids: list, embeddings: list, texts: list,
+               metadatas: list, collection_metadata: dict = None) -> dict:
+    """id/벡터/본문/메타데이터를 새 컬렉션에 적재 (같은 이름의 기존 컬렉션은 교체) → 통계"""
+    import chromadb
+
+    if not (len(ids) == len(embeddings) == len(texts) == len(metadatas)):
+        raise ValueError(f"id {len(ids)}개, 벡터 {len(embeddings)}개, 본문 {len(texts)}개, "
+                         f"메타데이터 {len(metadatas)}개 개수가 다릅니다.")
+    os.makedirs(persist_directory, exist_ok=True)
+
+    start = time.perf_counter()
+    with span("bulk_load", collection=collection_name, chunks=len(ids)) as sp:
+        client = chromadb.PersistentClient(path=persist_directory)
+        _enable_wal(persist_directory)
+        try:
+            client.delete_collection(collection_name)
+        except Exception:
+            pass
+        hnsw_batch = max(len(ids), MIN_HNSW_BATCH)
+        collection = client.create_collection(
+            collection_name,
+            metadata={**(collection_metadata or {}), "hnsw:batch_size": hnsw_batch, "hnsw:sync_threshold": hnsw_batch}
+        )
+
+        step = _max_batch_size(client)
+        transactions = 0
+        for i in range(0, len(ids), step):
+            collection.add(
+                ids=ids[i:i + step],
+                embeddings=[list(map(float, vector)) for vector in embeddings[i:i + step]],
+                documents=texts[i:i + step],
+                metadatas=[metadata or None for metadata in metadatas[i:i + step]],
+            )
+            transactions += 1
+        seconds = time.perf_counter() - start
+        stats = {"write_seconds": round(seconds, 2), "write_chunks_per_sec": _rate(len(ids), seconds),
+                 "transactions": transactions}
+        sp.set(**stats)
+    return stats
+
+
+def bulk_load(persist_directory: str, collection_name: str, documents: list, embeddings: list,
+              ids: list = None) -> dict:
+    """langchain Document + 미리 계산한 벡터를 새 컬렉션에 적재 → 통계"""
+    if len(documents) != len(embeddings):
+        raise ValueError(f"문서 {len(documents)}개와 벡터 {len(embeddings)}개 개수가 다릅니다.")
+    ids = ids or [str(uuid.uuid4()) for _ in documents]
+    return bulk_write(persist_directory, collection_name, ids, embeddings,
+                      [doc.page_content for doc in documents], [doc.metadata for doc in documents])
+
+
+def build_collection(persist_directory: str, collection_name: str, documents: list, embedding_function) -> dict:
+    """임베딩 → 일괄 적재 → 전체 처리량까지 합친 통계"""
+    vectors, embed_stats = embed_texts([doc.page_content for doc in documents], embedding_function)
+    write_stats = bulk_load(persist_directory, collection_name, documents, vectors)
+    seconds = embed_stats["embed_seconds"] + write_stats["write_seconds"]
+    return {**embed_stats, **write_stats, "chunks": len(documents), "chunks_per_sec": _rate(len(documents), seconds)}
+
+
+def format_stats(stats: dict) -> str:
+    """앱 캡션용 한 줄 요약"""
+    return (f"⚡ 청크 {stats['chunks']}개 적재: 전체 {stats['chunks_per_sec']}개/초 "
+            f"(임베딩 {stats['embed_chunks_per_sec']}개/초, 저장 {stats['write_chunks_per_sec']}개/초)")
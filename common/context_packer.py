@@ -0,0 +1,167 @@
+import os
+import re
+import math
+import logging
+
+# ✅ 검색 결과 → LLM 프롬프트 사이의 컨텍스트 압축 단계
+#   1) 겹치거나 이어지는 청크 병합 (chunk_overlap 중복 제거)
+#   2) 중복 문장 제거 (반복되는 경고/주의 문구)
+#   3) 질문과의 관련도 점수로 문장을 골라 토큰 예산 채우기 (원래 순서 유지)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+MIN_OVERLAP_CHARS = 30
+
+# ✅ 토큰 카운터 (tiktoken 없으면 글자 수 기반 근사치)
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+
+    def count_tokens(text: str) -> int:
+        return len(_encoding.encode(text))
+except Exception:
+    def count_tokens(text: str) -> int:
+        return max(1, len(text) // 2) if text else 0
+
+
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?。])\s+|\n+")
+_WORD = re.compile(r"[가-힣]+|[A-Za-z0-9]+")
+
+
+def split_sentences(text: str) -> list:
+    return [s.strip() for s in _SENTENCE_SPLIT.split(text) if s and s.strip()]
+
+
+# 한글은 조사가 붙어 단어가 달라지므로 2글자 단위(bigram)로 비교
+def _terms(text: str) -> set:
+    terms = set()
+    for word in _WORD.findall(text.lower()):
+        if re.match(r"[가-힣]", word) and len(word) > 2:
+            terms.update(word[i:i + 2] for i in range(len(word) - 1))
+        else:
+            terms.add(word)
+    return terms
+
+
+def _normalize(sentence: str) -> str:
+    return re.sub(r"\s+", "", sentence).lower()
+
+
+# ------------------------ 1) 청크 병합 ------------------------
+def _overlap_length(left: str, right: str) -> int:
+    # left의 끝부분과 right의 시작 부분이 겹치는 길이
+    probe = right[:MIN_OVERLAP_CHARS]
+    if len(probe) < MIN_OVERLAP_CHARS:
+        return 0
+    pos = left.find(probe, max(0, len(left) - len(right) - MIN_OVERLAP_CHARS))
+    while pos != -1:
+        if right.startswith(left[pos:]):
+            return len(left) - pos
+        pos = left.find(probe, pos + 1)
+    return 0
+
+
+def merge_chunks(chunks: list) -> list:
+    """겹치는 청크를 하나로 합침. 입력 순서(관련도 순)는 최대한 유지."""
+    merged = []
+    for text in chunks:
+        text = text.strip()
+        if not text:
+            continue
+        for i, existing in enumerate(merged):
+            if text in existing:
+                break
+            if existing in text:
+                merged[i] = text
+                break
+            overlap = _overlap_length(existing, text)
+            if overlap:
+                merged[i] = existing + text[overlap:]
+                break
+            overlap = _overlap_length(text, existing)
+            if overlap:
+                merged[i] = text + existing[overlap:]
+                break
+        else:
+            merged.append(text)
+    return merged
+
+
+# ------------------------ 2) + 3) 문장 선택 ------------------------
+def _score_sentences(question: str, sentences: list) -> list:
+    q_terms = _terms(question)
+    if not q_terms:
+        return [0.0] * len(sentences)
+
+    # 문장 집합 기준 IDF (흔한 단어의 가중치를 낮춤)
+    sentence_terms = [_terms(s) for s in sentences]
+    df = {}
+    for terms in sentence_terms:
+        for t in terms & q_terms:
+            df[t] = df.get(t, 0) + 1
+    n = len(sentences)
+
+    scores = []
+    for terms in sentence_terms:
+        hit = terms & q_terms
+        score = sum(math.log(1 + n / df[t]) for t in hit)
+        scores.append(score / math.sqrt(len(terms) + 1))
+    return scores
+
+
+def pack_context(question: str, chunks: list, token_budget: int = DEFAULT_TOKEN_BUDGET,
+                 separator: str = "\n\n") -> dict:
+    """청크 목록(관련도 순)을 토큰 예산 안의 컨텍스트 문자열로 압축.
+
+    반환값: {"context", "original_tokens", "packed_tokens", "saved_tokens"}
+    """
+    original_tokens = count_tokens(separator.join(chunks))
+    merged = merge_chunks(chunks)
+
+    # (청크 순번, 문장 순번, 문장) — 중복 문장은 처음 나온 것만 유지
+    seen = set()
+    entries = []
+    for ci, chunk in enumerate(merged):
+        for si, sentence in enumerate(split_sentences(chunk)):
+            key = _normalize(sentence)
+            if key in seen:
+                continue
+            seen.add(key)
+            entries.append((ci, si, sentence))
+
+    scores = _score_sentences(question, [e[2] for e in entries])
+    # 검색 순위가 높은 청크의 문장에 약간의 가산점
+    ranked = sorted(
+        range(len(entries)),
+        key=lambda i: scores[i] + 0.1 / (1 + entries[i][0]),
+        reverse=True
+    )
+
+    selected = []
+    used = 0
+    for i in ranked:
+        tokens = count_tokens(entries[i][2]) + 1
+        if used + tokens > token_budget:
+            continue
+        selected.append(i)
+        used += tokens
+
+    # 원래 문서 순서대로 재조립
+    selected.sort()
+    blocks = {}
+    for i in selected:
+        ci, _, sentence = entries[i]
+        blocks.setdefault(ci, []).append(sentence)
+    context = separator.join(" ".join(blocks[ci]) for ci in sorted(blocks))
+
+    packed_tokens = count_tokens(context)
+    stats = {
+        "context": context,
+        "original_tokens": original_tokens,
+        "packed_tokens": packed_tokens,
+        "saved_tokens": max(0, original_tokens - packed_tokens),
+    }
+    logger.info("context packed: %d → %d tokens (saved %d)",
+                original_tokens, packed_tokens, stats["saved_tokens"])
+    return stats
@@ -0,0 +1,282 @@
+import os
+import re
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+from common.context_packer import count_tokens
+
+# ✅ 대화형 검색 (후속 질문이 이전 턴의 검색 결과와 맥락을 재사용)
+#   1) 질문 재작성: "그럼 어떻게 초기화해?" 같은 후속 질문에 직전 턴의 주제어를 붙여 독립 검색어로 만듦
+#      (로컬 규칙 기반, QUERY_REWRITE_LLM=1 이면 저렴한 모델로 재작성하고 실패 시 로컬 규칙)
+#      (후속 질문이 "와이퍼는?"처럼 자기 대상을 가져오면 주제어를 붙이지 않음)
+#   2) 세션 청크 캐시: 이미 가져온 청크를 세션에 보관 → 질문 자체의 단어(붙인 주제어 제외)가
+#      모두 캐시 청크에 있으면 임베딩/벡터 검색/재정렬을 건너뛰고, 아니면 새로 찾은 청크만 기존 청크 뒤에 붙임
+#   3) 이전 턴 창: 최근 N턴을 토큰 예산 안에서만 LLM에 전달 (턴이 늘어도 프롬프트 크기는 일정)
+#
+# 사용 예)
+#   store = get_store()
+#   query, followup = store.rewrite(session_id, collection, question)
+#   reused, coverage = store.cached_docs(session_id, collection, query, top_k, question)
+#   ...
+#   store.remember(session_id, collection, question, query, answer, docs)
+
+logger = logging.getLogger(__name__)
+
+CONVERSATION_ENABLED = os.getenv("CONVERSATION_ENABLED", "1") == "1"
+HISTORY_TURNS = int(os.getenv("CONVERSATION_HISTORY_TURNS", "3"))  # LLM에 넘기는 최대 이전 턴 수
+HISTORY_TOKENS = int(os.getenv("CONVERSATION_HISTORY_TOKENS", "600"))  # 이전 턴 창 토큰 예산
+ANSWER_CHARS = int(os.getenv("CONVERSATION_ANSWER_CHARS", "400"))  # 이전 답변은 앞부분만
+CACHE_CHUNKS = int(os.getenv("CONVERSATION_CACHE_CHUNKS", "20"))  # 세션당 보관 청크 수
+REUSE_COVERAGE = float(os.getenv("CONVERSATION_REUSE_COVERAGE", "1.0"))  # 질문 단어 중 캐시에 있는 비율이 이 이상이면 검색 생략
+SESSION_TTL = float(os.getenv("CONVERSATION_SESSION_TTL", "1800"))
+MAX_SESSIONS = int(os.getenv("CONVERSATION_MAX_SESSIONS", "1000"))
+QUERY_REWRITE_LLM = os.getenv("QUERY_REWRITE_LLM", "0") == "1"
+REWRITE_MODEL = os.getenv("QUERY_REWRITE_MODEL", "claude-3-haiku-20240307")
+MAX_TOPIC_TERMS = 6
+
+_WORD = re.compile(r"[가-힣]+|[A-Za-z0-9]+")
+# 후속 질문 표지 (문장 앞 접속어 / 지시어)
+_FOLLOWUP_START = re.compile(
+    r"^\s*(그럼|그러면|그렇다면|그런데|근데|그리고|그래서|또|또는|그건|그거|그게|그걸|그것|이건|이거|이게|이걸|"
+    r"저건|저거|거기|여기|then|and|also|what about|how about)(\s|[,?.!]|$)", re.IGNORECASE)
+_PRONOUNS = {"그거", "그것", "그게", "그걸", "그건", "이거", "이것", "이게", "이걸", "이건", "저거", "저것",
+             "거기", "여기", "it", "that", "this", "those", "them"}
+# 주제어에서 뺄 말 (의문사, 요청어)
+_STOPWORDS = {"그럼", "그러면", "그렇다면", "그런데", "근데", "그리고", "그래서", "또", "어떻게", "왜", "뭐", "무엇",
+              "언제", "어디", "어느", "얼마나", "몇", "좀", "혹시", "알려줘", "알려주세요", "방법", "경우", "들어",
+              "들어요", "드나요", "있어", "있어요", "없어", "없어요", "나와", "걸려", "what",
+              "how", "why", "when", "where", "the", "a", "an", "is", "do", "does", "can", "i", "my"}
+# 대상이 아니라 직전 대상에 대한 동작/속성을 묻는 말 ("그럼 어떻게 초기화해?" → 직전 주제 유지)
+_ASPECT_TERMS = {"초기화", "리셋", "교체", "점검", "설정", "해제", "등록", "충전", "수리", "청소", "비용", "가격", "주기",
+                 "위치", "원인", "증상", "시간", "소리", "reset", "replace", "cost", "price", "location"}
+# 조사 / 어미 (긴 것부터 떼어 냄)
+_SUFFIXES = sorted(["은", "는", "이", "가", "을", "를", "에", "에서", "으로", "로", "의", "도", "만", "와", "과",
+                    "하고", "랑", "이랑", "에게", "까지", "부터", "해", "해요", "해야", "하면", "하나요", "하는",
+                    "해서", "하려면", "합니다", "합니까", "인가요", "이에요", "예요", "나요", "까요", "되나요",
+                    "돼요", "돼", "되면", "요"], key=len, reverse=True)
+_VERB_ENDINGS = ("줘", "나요", "까", "죠", "니다", "어요", "아요", "세요", "는지", "ㄴ지")
+
+
+def _stem(word: str) -> str:
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 2:
+            return word[:-len(suffix)]
+    return word
+
+
+def topic_terms(text: str) -> list:
+    """주제어 후보 (조사/어미를 뗀 명사성 단어, 등장 순서 유지)"""
+    terms = []
+    for word in _WORD.findall(text.lower()):
+        if word in _STOPWORDS or word in _PRONOUNS or word.endswith(_VERB_ENDINGS):
+            continue
+        stem = _stem(word)
+        if len(stem) < 2 or stem in _STOPWORDS or stem in terms:
+            continue
+        terms.append(stem)
+    return terms
+
+
+def _bigrams(text: str) -> set:
+    # context_packer와 같은 방식: 한글은 2글자 단위로 비교 (조사가 붙어도 일치)
+    grams = set()
+    for word in _WORD.findall(text.lower()):
+        if re.match(r"[가-힣]", word) and len(word) > 2:
+            grams.update(word[i:i + 2] for i in range(len(word) - 1))
+        elif word not in _STOPWORDS:
+            grams.add(word)
+    return grams
+
+
+def is_followup(question: str) -> bool:
+    if _FOLLOWUP_START.match(question):
+        return True
+    words = _WORD.findall(question.lower())
+    if any(word in _PRONOUNS for word in words):
+        return True
+    # 주제어가 거의 없는 짧은 질문 ("어떻게 초기화해?")
+    return len(topic_terms(question)) <= 1
+
+
+def own_subjects(question: str) -> list:
+    """질문이 스스로 가져온 대상 (동작/속성 단어 제외)"""
+    return [t for t in topic_terms(question) if t not in _ASPECT_TERMS]
+
+
+def rewrite_local(question: str, previous_query: str) -> str:
+    """직전 독립 검색어의 주제어 중 이번 질문에 없는 것을 앞에 붙임 (질문이 새 대상을 가져오면 그대로)"""
+    if own_subjects(question):
+        return question.strip()
+    current = set(topic_terms(question))
+    carried = [t for t in topic_terms(previous_query) if t not in current][:MAX_TOPIC_TERMS]
+    body = _FOLLOWUP_START.sub("", question).strip() or question.strip()
+    return f"{' '.join(carried)} {body}".strip() if carried else question.strip()
+
+
+def rewrite_with_llm(question: str, history: list) -> str:
+    from common.llm_client import complete
+    lines = [f"사용자: {turn['question']}\n정비사: {turn['answer'][:200]}" for turn in history[-2:]]
+    prompt = (
+        "다음 대화 이후의 마지막 질문을, 이전 대화 없이도 이해되는 한 문장짜리 검색어로 바꿔 주세요. "
+        "검색어만 출력하세요.\n\n" + "\n".join(lines) + f"\n\n마지막 질문: {question}"
+    )
+    response = complete([{"role": "user", "content": prompt}], model=REWRITE_MODEL, provider="anthropic",
+                        max_tokens=64, temperature=0.0)
+    return response["text"].strip().splitlines()[0].strip() or question
+
+
+def chunk_key(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class _Session:
+    def __init__(self, collection):
+        self.collection = collection
+        self.turns = []  # [{"question", "query", "answer"}] 최근 HISTORY_TURNS개
+        self.chunks = OrderedDict()  # chunk_key → Document (처음 가져온 순서 = 컨텍스트 순서)
+        self.stats = {"turns": 0, "followups": 0, "retrievals_skipped": 0, "chunks_reused": 0, "chunks_fetched": 0}
+        self.last_access = time.time()
+
+
+class ConversationStore:
+    def __init__(self, idle_ttl: float = SESSION_TTL, max_sessions: int = MAX_SESSIONS):
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, session_id: str, collection) -> _Session:
+        # 호출 측에서 self._lock 보유
+        session = self._sessions.get(session_id)
+        if session is None or session.collection != collection:
+            # 다른 매뉴얼로 바꾸면 이전 청크/맥락은 쓰지 않음
+            session = _Session(collection)
+            self._sessions[session_id] = session
+        self._sessions.move_to_end(session_id)
+        session.last_access = time.time()
+        return session
+
+    def evict_idle(self):
+        now = time.time()
+        with self._lock:
+            while self._sessions:
+                session_id, session = next(iter(self._sessions.items()))
+                if now - session.last_access > self.idle_ttl or len(self._sessions) > self.max_sessions:
+                    del self._sessions[session_id]
+                else:
+                    break
+
+    # ------------------------ 질문 재작성 ------------------------
+    def rewrite(self, session_id: str, collection, question: str) -> tuple:
+        """(독립 검색어, 후속 질문 여부)"""
+        self.evict_idle()
+        with self._lock:
+            session = self._get(session_id, collection)
+            history = list(session.turns)
+        if not history or not is_followup(question):
+            return question.strip(), False
+        query = None
+        if QUERY_REWRITE_LLM:
+            try:
+                query = rewrite_with_llm(question, history)
+            except Exception as e:
+                logger.warning("query rewrite (llm) failed, using local rule: %s", e)
+        query = query or rewrite_local(question, history[-1]["query"])
+        with self._lock:
+            session.stats["followups"] += 1
+        return query, True
+
+    # ------------------------ 청크 캐시 ------------------------
+    def cached_docs(self, session_id: str, collection, query: str, limit: int, question: str = None) -> tuple:
+        """세션 캐시 청크 중 검색어와 겹치는 것 (컨텍스트 순서) + 질문 단어 중 캐시 청크에 있는 비율
+
+        비율은 재작성 전 질문의 단어로만 계산 (검색어에 붙인 직전 주제어는 캐시에 항상 있으므로 제외)"""
+        q_grams = _bigrams(query)
+        with self._lock:
+            session = self._get(session_id, collection)
+            docs = list(session.chunks.values())
+        if not q_grams or not docs:
+            return [], 0.0
+        scored = []
+        for order, doc in enumerate(docs):
+            hit = _bigrams(doc.page_content) & q_grams
+            if hit:
+                scored.append((len(hit), order, doc))
+        best = sorted(scored, key=lambda s: s[0], reverse=True)[:limit]
+        reused = [doc for _, _, doc in sorted(best, key=lambda s: s[1])]
+
+        own = topic_terms(question if question is not None else query)
+        if not own or not reused:
+            return reused, 0.0
+        texts = [doc.page_content.lower() for doc in reused]
+        covered = sum(1 for term in own if any(term in text for text in texts))
+        return reused, covered / len(own)
+
+    def merge(self, session_id: str, collection, reused: list, fetched: list) -> list:
+        """재사용 청크 뒤에 캐시에 없던 새 청크만 붙임"""
+        keys = {chunk_key(doc.page_content) for doc in reused}
+        new = [doc for doc in fetched if chunk_key(doc.page_content) not in keys]
+        with self._lock:
+            session = self._get(session_id, collection)
+            session.stats["chunks_reused"] += len(reused)
+            session.stats["chunks_fetched"] += len(new)
+        return reused + new
+
+    def skipped_retrieval(self, session_id: str, collection, reused: list):
+        with self._lock:
+            session = self._get(session_id, collection)
+            session.stats["retrievals_skipped"] += 1
+            session.stats["chunks_reused"] += len(reused)
+
+    # ------------------------ 턴 기록 / 이전 턴 창 ------------------------
+    def remember(self, session_id: str, collection, question: str, query: str, answer: str, docs: list):
+        with self._lock:
+            session = self._get(session_id, collection)
+            session.turns = (session.turns + [{"question": question, "query": query, "answer": answer}])[-HISTORY_TURNS:]
+            session.stats["turns"] += 1
+            for doc in docs:
+                key = chunk_key(doc.page_content)
+                session.chunks.pop(key, None)
+                session.chunks[key] = doc
+            while len(session.chunks) > CACHE_CHUNKS:
+                session.chunks.popitem(last=False)
+
+    def history(self, session_id: str, collection) -> list:
+        """최근 턴부터 토큰 예산 안에 들어가는 만큼 [{"question", "answer"}] (오래된 것 → 최근 순)"""
+        with self._lock:
+            session = self._get(session_id, collection)
+            turns = list(session.turns)
+        window, used = [], 0
+        for turn in reversed(turns):
+            answer = turn["answer"][:ANSWER_CHARS]
+            tokens = count_tokens(turn["question"]) + count_tokens(answer)
+            if used + tokens > HISTORY_TOKENS:
+                break
+            window.insert(0, {"question": turn["question"], "answer": answer})
+            used += tokens
+        return window
+
+    def stats(self, session_id: str) -> dict:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return dict(session.stats) if session else {}
+
+    def reset(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> ConversationStore:
+    """프로세스 공용 대화 저장소"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ConversationStore()
+        return _store
@@ -0,0 +1,169 @@
+import os
+import gzip
+import json
+import time
+import queue
+import atexit
+import shutil
+import hashlib
+import logging
+import threading
+from datetime import datetime
+
+# ✅ 추가 전용(append-only) 대화 로그 저장소
+#   - 채팅 경로에서는 큐에 넣기만 하고 바로 반환 (지연 없음)
+#   - 백그라운드 스레드가 모아서 JSONL 세그먼트에 쓰고 배치 단위로 fsync
+#   - 세그먼트가 커지면 교체(rotate)하고 이전 세그먼트는 gzip 압축
+#   - 턴마다 검색된 청크 id와 단계별 지연시간을 함께 기록
+#   - iter_turns()로 전체를 메모리에 올리지 않고 한 줄씩 조회
+
+LOG_DIR = os.getenv("CONVERSATION_LOG_DIR", "logs")
+SEGMENT_BYTES = int(os.getenv("CONVERSATION_LOG_SEGMENT_BYTES", str(16 * 1024 * 1024)))
+FLUSH_INTERVAL = float(os.getenv("CONVERSATION_LOG_FLUSH_INTERVAL", "1.0"))
+MAX_QUEUE = 10000
+
+logger = logging.getLogger(__name__)
+
+
+def chunk_ref(doc) -> dict:
+    """langchain Document → 로그에 남길 청크 참조 (내용 해시 + 출처/페이지)"""
+    metadata = getattr(doc, "metadata", {}) or {}
+    return {
+        "id": hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest()[:12],
+        "source": metadata.get("source"),
+        "page": metadata.get("page"),
+        "pages": metadata.get("pages"),  # 중복 제거로 합쳐진 청크가 등장한 모든 페이지
+    }
+
+
+class ConversationLog:
+    def __init__(self, directory=LOG_DIR, segment_bytes=SEGMENT_BYTES, flush_interval=FLUSH_INTERVAL):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=MAX_QUEUE)
+        self._file = None
+        self._stop = threading.Event()
+        os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="conversation-log", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # ------------------------ 쓰기 (채팅 경로) ------------------------
+    def log_turn(self, session_id, question, answer, collection=None, chunks=None, timings=None, **extra):
+        record = {
+            "ts": time.time(),
+            "session_id": session_id,
+            "collection": collection,
+            "question": question,
+            "answer": answer,
+            "chunks": chunks or [],
+            "timings_ms": {k: round(v * 1000, 1) for k, v in (timings or {}).items()},
+        }
+        record.update(extra)
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            # 디스크가 밀려도 채팅은 막지 않음
+            self.dropped += 1
+
+    # ------------------------ 백그라운드 writer ------------------------
+    def _segment_path(self):
+        return os.path.join(self.directory, f"turns_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.jsonl")
+
+    def _open_segment(self):
+        self._file = open(self._segment_path(), "a", encoding="utf-8")
+
+    def _rotate(self):
+        path = self._file.name
+        self._file.close()
+        self._file = None
+        with open(path, "rb") as src, gzip.open(path + ".gz", "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(path)
+
+    def _write_batch(self, batch):
+        if self._file is None:
+            self._open_segment()
+        for record in batch:
+            self._file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())  # 배치당 fsync 1회
+        if self._file.tell() >= self.segment_bytes:
+            self._rotate()
+
+    def _drain(self, first=None):
+        batch = [first] if first is not None else []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                return batch
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            # 잠깐 더 모아서 fsync 횟수를 줄임
+            time.sleep(min(0.05, self.flush_interval))
+            try:
+                self._write_batch(self._drain(first))
+            except Exception as e:
+                logger.warning("대화 로그 기록 실패: %s", e)
+
+    def close(self):
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join(timeout=5)
+        batch = self._drain()
+        if batch:
+            self._write_batch(batch)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+# ------------------------ 조회 ------------------------
+def _segments(directory):
+    if not os.path.isdir(directory):
+        return []
+    names = [n for n in os.listdir(directory) if n.startswith("turns_") and (n.endswith(".jsonl") or n.endswith(".jsonl.gz"))]
+    return [os.path.join(directory, n) for n in sorted(names)]
+
+
+def iter_turns(directory=LOG_DIR, session_id=None, collection=None, since=None):
+    """세그먼트를 순서대로 한 줄씩 읽으며 조건에 맞는 턴만 반환 (since: unix time)"""
+    for path in _segments(directory):
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # 비정상 종료로 잘린 마지막 줄
+                if session_id and record.get("session_id") != session_id:
+                    continue
+                if collection and record.get("collection") != collection:
+                    continue
+                if since and record.get("ts", 0) < since:
+                    continue
+                yield record
+
+
+_log = None
+_log_lock = threading.Lock()
+
+
+def get_log() -> ConversationLog:
+    """프로세스당 하나의 로그 저장소 (Streamlit 재실행에도 유지)"""
+    global _log
+    with _log_lock:
+        if _log is None:
+            _log = ConversationLog()
+        return _log
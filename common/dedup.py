@@ -0,0 +1,172 @@
+import os
+import re
+import zlib
+import logging
+import numpy as np
+
+# ✅ 임베딩 전 거의 같은 청크 제거 (MinHash + LSH)
+#   - 매뉴얼마다 같은 경고/주의/안내 문구가 수십 페이지에 반복 → 거의 같은 청크가 임베딩/저장되고
+#     검색 top-k를 같은 내용으로 채움
+#   - 청크마다 글자 n-gram(shingle) 집합의 MinHash 서명 → LSH 밴드 버킷으로 후보만 비교
+#   - 추정 자카드 유사도가 DEDUP_THRESHOLD 이상이면 먼저 나온 청크(대표)에 합치고,
+#     대표 청크 메타데이터에 등장한 모든 페이지를 기록 (metadata["pages"] = "3,17,42")
+#   - 임베딩 호출 수 / 인덱스 크기 감소량을 로그와 통계 dict로 보고
+
+logger = logging.getLogger(__name__)
+
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "1") == "1"
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.85"))
+SHINGLE_SIZE = int(os.getenv("DEDUP_SHINGLE_SIZE", "5"))
+# 밴드 16개 × 8행 → 자카드 약 0.7 이상이면 후보로 잡힘 (최종 판정은 DEDUP_THRESHOLD)
+NUM_BANDS = 16
+ROWS_PER_BAND = 8
+NUM_PERM = NUM_BANDS * ROWS_PER_BAND
+EMBED_BATCH = 100  # 인덱싱 시 add_documents 배치 크기 (임베딩 API 호출 단위)
+
+_PRIME = (1 << 61) - 1
+_rng = np.random.default_rng(1)
+_A = _rng.integers(1, 1 << 31, NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, 1 << 31, NUM_PERM, dtype=np.uint64)
+_SPACE = re.compile(r"\s+")
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> np.ndarray:
+    """공백 정규화한 글자 n-gram → crc32 해시 배열 (한글은 띄어쓰기가 흔들려도 비슷하게 잡힘)"""
+    text = _SPACE.sub(" ", text).strip().lower()
+    if len(text) <= size:
+        grams = {text}
+    else:
+        grams = {text[i:i + size] for i in range(len(text) - size + 1)}
+    return np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams))
+
+
+def minhash(text: str) -> np.ndarray:
+    hashes = shingles(text)
+    # (a·x + b) mod p 를 순열 수만큼 한 번에 계산 (a, b < 2^31, x < 2^32 → uint64 범위 안)
+    values = (np.outer(hashes, _A) + _B) % _PRIME
+    return values.min(axis=0)
+
+
+def similarity(sig_a: np.ndarray, sig_b: np.ndarray) -> float:
+    """MinHash 서명으로 추정한 자카드 유사도"""
+    return float(np.mean(sig_a == sig_b))
+
+
+def find_duplicates(texts: list, threshold: float = DEDUP_THRESHOLD) -> list:
+    """청크 텍스트 목록 → 각 청크의 대표 인덱스 목록 (대표 청크는 자기 자신)"""
+    buckets = [{} for _ in range(NUM_BANDS)]
+    signatures = []
+    canonical = []
+    for i, text in enumerate(texts):
+        signature = minhash(text)
+        signatures.append(signature)
+        bands = [signature[b * ROWS_PER_BAND:(b + 1) * ROWS_PER_BAND].tobytes() for b in range(NUM_BANDS)]
+
+        candidates = set()
+        for band, key in zip(buckets, bands):
+            candidates.update(band.get(key, ()))
+        best, best_score = None, threshold
+        for j in sorted(candidates):
+            score = similarity(signature, signatures[j])
+            if score >= best_score:
+                best, best_score = j, score
+
+        if best is not None:
+            canonical.append(best)
+            continue
+        canonical.append(i)
+        for band, key in zip(buckets, bands):
+            band.setdefault(key, []).append(i)
+    return canonical
+
+
+def _stats(before: int, after: int, chars_saved: int) -> dict:
+    return {
+        "chunks_before": before,
+        "chunks_after": after,
+        "removed": before - after,
+        "ratio": round((before - after) / before, 4) if before else 0.0,
+        "embed_calls_before": -(-before // EMBED_BATCH),
+        "embed_calls_after": -(-after // EMBED_BATCH),
+        "chars_saved": chars_saved,
+    }
+
+
+def _page_label(metadata: dict):
+    page = metadata.get("page")
+    return None if page is None else str(page)
+
+
+def dedup_documents(documents: list, threshold: float = DEDUP_THRESHOLD) -> tuple:
+    """langchain Document 청크 → (대표 청크 목록, 통계). 대표 청크 metadata에 pages/duplicates 추가"""
+    if not DEDUP_ENABLED or not documents:
+        return documents, _stats(len(documents), len(documents), 0)
+
+    canonical = find_duplicates([doc.page_content for doc in documents], threshold)
+    pages = {}
+    duplicates = {}
+    chars_saved = 0
+    for i, target in enumerate(canonical):
+        label = _page_label(documents[i].metadata)
+        refs = pages.setdefault(target, [])
+        if label is not None and label not in refs:
+            refs.append(label)
+        if target != i:
+            duplicates[target] = duplicates.get(target, 0) + 1
+            chars_saved += len(documents[i].page_content)
+
+    kept = []
+    for i, target in enumerate(canonical):
+        if target != i:
+            continue
+        doc = documents[i]
+        if duplicates.get(i):
+            # Chroma 메타데이터는 리스트를 못 넣으므로 쉼표로 구분한 문자열
+            doc.metadata["pages"] = ",".join(pages[i])
+            doc.metadata["duplicates"] = duplicates[i]
+        kept.append(doc)
+
+    stats = _stats(len(documents), len(kept), chars_saved)
+    logger.info("dedup: %d → %d chunks (removed %d, embed calls %d → %d)", stats["chunks_before"],
+                stats["chunks_after"], stats["removed"], stats["embed_calls_before"], stats["embed_calls_after"])
+    return kept, stats
+
+
+def dedup_texts(texts: list, sources: list = None, threshold: float = DEDUP_THRESHOLD) -> tuple:
+    """문자열 청크 (FAISS 스크립트용) → (대표 청크 목록, 대표별 출처 목록, 통계)"""
+    sources = sources or [None] * len(texts)
+    if not DEDUP_ENABLED or not texts:
+        return texts, [[s] for s in sources], _stats(len(texts), len(texts), 0)
+
+    canonical = find_duplicates(texts, threshold)
+    refs = {}
+    chars_saved = 0
+    for i, target in enumerate(canonical):
+        group = refs.setdefault(target, [])
+        if sources[i] not in group:
+            group.append(sources[i])
+        if target != i:
+            chars_saved += len(texts[i])
+
+    kept = [i for i, target in enumerate(canonical) if target == i]
+    stats = _stats(len(texts), len(kept), chars_saved)
+    logger.info("dedup: %d → %d chunks (removed %d)", stats["chunks_before"], stats["chunks_after"], stats["removed"])
+    return [texts[i] for i in kept], [refs[i] for i in kept], stats
+
+
+def dedup_texts_per_source(texts: list, sources: list, threshold: float = DEDUP_THRESHOLD) -> tuple:
+    """출처(파일)별로 따로 중복 제거 → (대표 청크 목록, 합산 통계). 서로 다른 파일 사이의 같은 문구는 유지"""
+    groups = {}
+    for text, source in zip(texts, sources):
+        groups.setdefault(source, []).append(text)
+    kept, chars_saved = [], 0
+    for group in groups.values():
+        group_kept, _, group_stats = dedup_texts(group, threshold=threshold)
+        kept.extend(group_kept)
+        chars_saved += group_stats["chars_saved"]
+    return kept, _stats(len(texts), len(kept), chars_saved)
+
+
+def index_bytes_saved(stats: dict, dim: int) -> int:
+    """float32 벡터 기준으로 줄어든 인덱스 크기 (바이트)"""
+    return stats["removed"] * dim * 4
@@ -0,0 +1,76 @@
+import os
+import threading
+
+# ✅ 로컬 HF 모델 토큰 스트리밍
+#   - model.generate를 별도 스레드에서 돌리고 TextIteratorStreamer로 디코딩된 조각을 받아 yield
+#   - 제너레이터를 close()하면(중지 버튼, 연결 끊김, 워커 취소) StoppingCriteria가 다음 토큰에서 생성을 멈춤
+#     → 아무도 보지 않는 토큰에 CPU를 쓰지 않음
+#
+# 사용 예)
+#   for piece in stream_generate(model, tokenizer, prompt, max_new_tokens=256):
+#       text += piece
+
+STREAM_TIMEOUT = float(os.getenv("HF_STREAM_TIMEOUT", "300"))  # 토큰 하나를 기다리는 최대 시간 (초)
+
+
+def stream_generate(model, tokenizer, prompt: str, stop_at: str = None, **generate_kwargs):
+    """프롬프트 → 새로 생성된 텍스트 조각 제너레이터. stop_at 문자열이 나오면 그 앞까지만 내보내고 생성 중단"""
+    import torch
+    from transformers import TextIteratorStreamer, StoppingCriteria, StoppingCriteriaList
+
+    stop = threading.Event()
+
+    class _StopOnEvent(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            return torch.full((input_ids.shape[0],), stop.is_set(), dtype=torch.bool, device=input_ids.device)
+
+    inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
+    streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True, timeout=STREAM_TIMEOUT)
+    generate_kwargs.setdefault("pad_token_id", tokenizer.eos_token_id)
+    errors = []
+
+    def run():
+        try:
+            with torch.no_grad():
+                model.generate(**inputs, streamer=streamer,
+                               stopping_criteria=StoppingCriteriaList([_StopOnEvent()]), **generate_kwargs)
+        except Exception as e:
+            errors.append(e)
+            streamer.end()  # 소비 쪽이 타임아웃까지 기다리지 않도록
+
+    thread = threading.Thread(target=run, name="hf-generate", daemon=True)
+    thread.start()
+    pending = ""  # 아직 내보내지 않은 꼬리 (stop_at의 앞부분일 수 있어서 보류 중)
+    try:
+        for piece in streamer:
+            if not piece:
+                continue
+            if not stop_at:
+                yield piece
+                continue
+            pending += piece
+            if stop_at in pending:
+                head = pending.split(stop_at, 1)[0]
+                if head:
+                    yield head
+                return
+            # 조각 경계에 걸친 stop_at이 새지 않도록, stop_at의 앞부분과 겹치는 꼬리는 다음 조각까지 보류
+            keep = _partial_suffix(pending, stop_at)
+            if len(pending) > keep:
+                yield pending[:len(pending) - keep]
+                pending = pending[len(pending) - keep:]
+        if pending:
+            yield pending
+    finally:
+        stop.set()
+        thread.join()
+    if errors:
+        raise errors[0]
+
+
+def _partial_suffix(text: str, marker: str) -> int:
+    """text 끝부분이 marker의 앞부분과 겹치는 최대 길이"""
+    for size in range(min(len(text), len(marker) - 1), 0, -1):
+        if marker.startswith(text[-size:]):
+            return size
+    return 0
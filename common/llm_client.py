@@ -0,0 +1,485 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dotenv import load_dotenv
+from common.tracing import span, open_span, close_span
+from common.usage import record_usage, apply_budget
+
+# ✅ 공용 LLM 호출 레이어
+#   - 프로세스 전체에서 공유하는 장수명 클라이언트 (keep-alive 커넥션 풀 재사용)
+#     풀 크기는 LLM_MAX_CONNECTIONS / LLM_MAX_KEEPALIVE (예전 OPENAI_MAX_CONNECTIONS / OPENAI_MAX_KEEPALIVE도 인식)
+#   - 전체 마감 시간(deadline) 기준 타임아웃 + 지수 백오프/지터 재시도
+#   - 선택적 헤징: 첫 요청이 p95를 넘기면 두 번째 모델/프로바이더로 중복 요청
+#   - stream(): 토큰 단위 스트리밍 (중간 취소 시 HTTP 스트림도 닫힘)
+#   - ANTHROPIC_BASE_URL / OPENAI_BASE_URL 로 로컬 목 서버(mock_llm_server.py) 지정 가능
+
+load_dotenv()
+
+DEFAULT_DEADLINE = float(os.getenv("LLM_DEADLINE", "60"))
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+# p95 계산 전(샘플 부족)에 사용할 헤징 대기 시간
+DEFAULT_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", "8"))
+MIN_LATENCY_SAMPLES = 20
+# 프로바이더별 HTTP 커넥션 풀 (Gradio 동시 요청 수에 맞춰 조정)
+MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", os.getenv("OPENAI_MAX_CONNECTIONS", "200")))
+MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", os.getenv("OPENAI_MAX_KEEPALIVE", "50")))
+KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30"))
+
+_lock = threading.Lock()
+_sync_clients = {}
+_async_clients = {}
+_latencies = {}
+logger = logging.getLogger(__name__)
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("LLM_THREADS", "32")), thread_name_prefix="llm")
+
+
+class LLMError(Exception):
+    pass
+
+
+# ✅ 환경변수 LLM_HEDGE="openai:gpt-3.5-turbo" 형식을 (provider, model)로 변환
+def hedge_from_env():
+    value = os.getenv("LLM_HEDGE", "").strip()
+    if not value:
+        return None
+    provider, _, model = value.partition(":")
+    return (provider, model)
+
+
+def _api_key(provider: str):
+    if provider == "anthropic":
+        return os.getenv("ANTHROPIC_API_KEY") or os.getenv("CLAUDE_API_KEY")
+    return os.getenv("OPENAI_API_KEY")
+
+
+def _http_client(sdk, is_async: bool):
+    """커넥션 한도를 지정한 httpx 클라이언트 (SDK 기본 설정을 유지하도록 SDK의 Default*HttpxClient 사용)"""
+    import httpx
+    limits = httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_KEEPALIVE,
+                          keepalive_expiry=KEEPALIVE_EXPIRY)
+    name = "DefaultAsyncHttpxClient" if is_async else "DefaultHttpxClient"
+    factory = getattr(sdk, name, None) or (httpx.AsyncClient if is_async else httpx.Client)
+    return factory(limits=limits, timeout=DEFAULT_DEADLINE)
+
+
+# ✅ 동기 클라이언트 (프로바이더별 1개, 재시도는 이 레이어에서 직접 처리)
+def get_client(provider: str):
+    with _lock:
+        if provider not in _sync_clients:
+            if provider == "anthropic":
+                import anthropic
+                _sync_clients[provider] = anthropic.Anthropic(
+                    api_key=_api_key(provider), base_url=os.getenv("ANTHROPIC_BASE_URL"),
+                    timeout=DEFAULT_DEADLINE, max_retries=0,
+                    http_client=_http_client(anthropic, False))
+            elif provider == "openai":
+                import openai
+                _sync_clients[provider] = openai.OpenAI(
+                    api_key=_api_key(provider), base_url=os.getenv("OPENAI_BASE_URL"),
+                    timeout=DEFAULT_DEADLINE, max_retries=0,
+                    http_client=_http_client(openai, False))
+            else:
+                raise ValueError(f"지원하지 않는 프로바이더: {provider}")
+        return _sync_clients[provider]
+
+
+# ✅ 비동기 클라이언트 (Gradio async 핸들러용)
+def get_async_client(provider: str):
+    with _lock:
+        if provider not in _async_clients:
+            if provider == "anthropic":
+                import anthropic
+                _async_clients[provider] = anthropic.AsyncAnthropic(
+                    api_key=_api_key(provider), base_url=os.getenv("ANTHROPIC_BASE_URL"),
+                    timeout=DEFAULT_DEADLINE, max_retries=0,
+                    http_client=_http_client(anthropic, True))
+            elif provider == "openai":
+                import openai
+                _async_clients[provider] = openai.AsyncOpenAI(
+                    api_key=_api_key(provider), base_url=os.getenv("OPENAI_BASE_URL"),
+                    timeout=DEFAULT_DEADLINE, max_retries=0,
+                    http_client=_http_client(openai, True))
+            else:
+                raise ValueError(f"지원하지 않는 프로바이더: {provider}")
+        return _async_clients[provider]
+
+
+# ------------------------ 요청/응답 변환 ------------------------
+def _request_kwargs(provider, model, messages, system, max_tokens, temperature, timeout):
+    if provider == "anthropic":
+        # Claude는 system 프롬프트를 별도 파라미터로 받음
+        system_parts = [system] if system else []
+        system_parts += [m["content"] for m in messages if m["role"] == "system"]
+        kwargs = {
+            "model": model,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "messages": [m for m in messages if m["role"] != "system"],
+            "timeout": timeout,
+        }
+        if system_parts:
+            kwargs["system"] = "\n\n".join(system_parts)
+        return kwargs
+
+    if system:
+        messages = [{"role": "system", "content": system}] + list(messages)
+    return {
+        "model": model,
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+        "messages": messages,
+        "timeout": timeout,
+    }
+
+
+def _parse_response(provider, model, response, latency):
+    if provider == "anthropic":
+        text = response.content[0].text
+        usage = {"prompt_tokens": response.usage.input_tokens, "completion_tokens": response.usage.output_tokens}
+    else:
+        text = response.choices[0].message.content
+        usage = {"prompt_tokens": response.usage.prompt_tokens, "completion_tokens": response.usage.completion_tokens}
+    return {"text": text, "provider": provider, "model": model, "usage": usage, "latency": latency}
+
+
+def _is_retryable(error) -> bool:
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    # SDK의 연결/타임아웃 예외 (APIConnectionError, APITimeoutError)
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError")
+
+
+def _backoff(attempt: int) -> float:
+    # 지수 백오프 + full jitter
+    return random.uniform(0, min(8.0, 0.5 * (2 ** attempt)))
+
+
+# ------------------------ 지연시간 통계 (헤징용 p95) ------------------------
+def _record_latency(provider, model, latency):
+    with _lock:
+        _latencies.setdefault((provider, model), deque(maxlen=200)).append(latency)
+
+
+def latency_p95(provider: str, model: str):
+    with _lock:
+        samples = sorted(_latencies.get((provider, model), ()))
+    if len(samples) < MIN_LATENCY_SAMPLES:
+        return None
+    return samples[int(len(samples) * 0.95) - 1]
+
+
+def _hedge_delay(provider, model):
+    p95 = latency_p95(provider, model)
+    return p95 if p95 is not None else DEFAULT_HEDGE_DELAY
+
+
+def _record(result):
+    # 사용량 기록 실패가 답변을 막지 않도록 함
+    try:
+        record_usage(result)
+    except Exception as e:
+        logger.warning("usage 기록 실패: %s", e)
+
+
+# ------------------------ 동기 호출 ------------------------
+def _complete_once(provider, model, messages, system, max_tokens, temperature, deadline_at):
+    with span("llm_call", provider=provider, model=model) as sp:
+        result = _complete_attempts(provider, model, messages, system, max_tokens, temperature, deadline_at)
+        sp.set(**result["usage"])
+    _record(result)
+    return result
+
+
+def _complete_attempts(provider, model, messages, system, max_tokens, temperature, deadline_at):
+    client = get_client(provider)
+    attempt = 0
+    while True:
+        remaining = deadline_at - time.monotonic()
+        if remaining <= 0:
+            raise LLMError(f"{provider}/{model} 마감 시간 초과")
+        start = time.monotonic()
+        try:
+            kwargs = _request_kwargs(provider, model, messages, system, max_tokens, temperature, remaining)
+            if provider == "anthropic":
+                response = client.messages.create(**kwargs)
+            else:
+                response = client.chat.completions.create(**kwargs)
+        except Exception as e:
+            if attempt >= MAX_RETRIES or not _is_retryable(e):
+                raise
+            delay = _backoff(attempt)
+            if time.monotonic() + delay >= deadline_at:
+                raise
+            attempt += 1
+            time.sleep(delay)
+            continue
+
+        latency = time.monotonic() - start
+        _record_latency(provider, model, latency)
+        return _parse_response(provider, model, response, latency)
+
+
+def complete(messages: list, model: str = "claude-3-haiku-20240307", provider: str = "anthropic",
+             system: str = None, max_tokens: int = 1024, temperature: float = 0.0,
+             deadline: float = DEFAULT_DEADLINE, hedge: tuple = None) -> dict:
+    """LLM 호출. hedge=(provider, model)을 주면 첫 요청이 p95를 넘길 때 중복 요청을 보냄.
+
+    반환값: {"text", "provider", "model", "usage", "latency"}
+    """
+    # 세션 토큰 예산 초과 시 모델 교체 / max_tokens 제한
+    model, max_tokens = apply_budget(model, max_tokens)
+    deadline_at = time.monotonic() + deadline
+    if hedge is None:
+        return _complete_once(provider, model, messages, system, max_tokens, temperature, deadline_at)
+
+    # 워커 스레드에서도 같은 trace_id로 스팬이 묶이도록 컨텍스트 복사
+    primary = _executor.submit(contextvars.copy_context().run, _complete_once, provider, model, messages, system, max_tokens, temperature, deadline_at)
+    done, _ = wait([primary], timeout=_hedge_delay(provider, model))
+    if done and primary.exception() is None:
+        return primary.result()
+
+    hedge_provider, hedge_model = hedge
+    secondary = _executor.submit(contextvars.copy_context().run, _complete_once, hedge_provider, hedge_model,
+                                 messages, system, max_tokens, temperature, deadline_at)
+    pending = {primary, secondary}
+    errors = []
+    while pending:
+        done, pending = wait(pending, timeout=max(0.0, deadline_at - time.monotonic()), return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+            errors.append(future.exception())
+    if errors:
+        raise errors[-1]
+    raise LLMError("헤징 요청 모두 마감 시간 초과")
+
+
+# ------------------------ 스트리밍 호출 ------------------------
+def _open_stream(client, provider, kwargs):
+    if provider == "anthropic":
+        manager = client.messages.stream(**kwargs)
+        return manager, manager.__enter__()
+    response = client.chat.completions.create(stream=True, stream_options={"include_usage": True}, **kwargs)
+    return response, response
+
+
+def stream(messages: list, model: str = "claude-3-haiku-20240307", provider: str = "anthropic",
+           system: str = None, max_tokens: int = 1024, temperature: float = 0.0,
+           deadline: float = DEFAULT_DEADLINE):
+    """토큰 단위 스트리밍 제너레이터. 첫 토큰 전까지만 재시도하고, 중간에 close()하면 요청도 끊김.
+
+    사용량은 스트림이 끝난 뒤 complete()와 같은 형식으로 기록됨.
+    """
+    model, max_tokens = apply_budget(model, max_tokens)
+    deadline_at = time.monotonic() + deadline
+    client = get_client(provider)
+    with span("llm_call", provider=provider, model=model, stream=True) as sp:
+        attempt = 0
+        while True:
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                raise LLMError(f"{provider}/{model} 마감 시간 초과")
+            start = time.monotonic()
+            try:
+                kwargs = _request_kwargs(provider, model, messages, system, max_tokens, temperature, remaining)
+                handle, events = _open_stream(client, provider, kwargs)
+                break
+            except Exception as e:
+                if attempt >= MAX_RETRIES or not _is_retryable(e):
+                    raise
+                delay = _backoff(attempt)
+                if time.monotonic() + delay >= deadline_at:
+                    raise
+                attempt += 1
+                time.sleep(delay)
+
+        parts = []
+        usage = {"prompt_tokens": 0, "completion_tokens": 0}
+        try:
+            if provider == "anthropic":
+                for text in events.text_stream:
+                    parts.append(text)
+                    yield text
+                final = events.get_final_message()
+                usage = {"prompt_tokens": final.usage.input_tokens, "completion_tokens": final.usage.output_tokens}
+            else:
+                for chunk in events:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        parts.append(chunk.choices[0].delta.content)
+                        yield chunk.choices[0].delta.content
+                    if getattr(chunk, "usage", None):
+                        usage = {"prompt_tokens": chunk.usage.prompt_tokens,
+                                 "completion_tokens": chunk.usage.completion_tokens}
+        finally:
+            # 정상 종료든 취소(GeneratorExit)든 HTTP 스트림을 닫아 생성을 중단
+            if provider == "anthropic":
+                handle.__exit__(None, None, None)
+            else:
+                handle.close()
+            latency = time.monotonic() - start
+            sp.set(**usage)
+            _record({"text": "".join(parts), "provider": provider, "model": model, "usage": usage, "latency": latency})
+
+
+# ------------------------ 비동기 호출 ------------------------
+async def _acomplete_once(provider, model, messages, system, max_tokens, temperature, deadline_at):
+    with span("llm_call", provider=provider, model=model) as sp:
+        result = await _acomplete_attempts(provider, model, messages, system, max_tokens, temperature, deadline_at)
+        sp.set(**result["usage"])
+    _record(result)
+    return result
+
+
+async def _acomplete_attempts(provider, model, messages, system, max_tokens, temperature, deadline_at):
+    client = get_async_client(provider)
+    loop = asyncio.get_running_loop()
+    attempt = 0
+    while True:
+        remaining = deadline_at - loop.time()
+        if remaining <= 0:
+            raise LLMError(f"{provider}/{model} 마감 시간 초과")
+        start = loop.time()
+        try:
+            kwargs = _request_kwargs(provider, model, messages, system, max_tokens, temperature, remaining)
+            if provider == "anthropic":
+                coro = client.messages.create(**kwargs)
+            else:
+                coro = client.chat.completions.create(**kwargs)
+            response = await asyncio.wait_for(coro, timeout=remaining)
+        except asyncio.TimeoutError:
+            raise LLMError(f"{provider}/{model} 마감 시간 초과")
+        except Exception as e:
+            if attempt >= MAX_RETRIES or not _is_retryable(e):
+                raise
+            delay = _backoff(attempt)
+            if loop.time() + delay >= deadline_at:
+                raise
+            attempt += 1
+            await asyncio.sleep(delay)
+            continue
+
+        latency = loop.time() - start
+        _record_latency(provider, model, latency)
+        return _parse_response(provider, model, response, latency)
+
+
+async def acomplete(messages: list, model: str = "gpt-3.5-turbo", provider: str = "openai",
+                    system: str = None, max_tokens: int = 1024, temperature: float = 0.0,
+                    deadline: float = DEFAULT_DEADLINE, hedge: tuple = None) -> dict:
+    """complete()의 비동기 버전. 태스크가 취소되면 진행 중인 요청도 함께 취소됨."""
+    model, max_tokens = apply_budget(model, max_tokens)
+    deadline_at = asyncio.get_running_loop().time() + deadline
+    primary = asyncio.ensure_future(
+        _acomplete_once(provider, model, messages, system, max_tokens, temperature, deadline_at))
+    if hedge is None:
+        return await primary
+
+    tasks = {primary}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=_hedge_delay(provider, model))
+        if done and primary.exception() is None:
+            return primary.result()
+
+        hedge_provider, hedge_model = hedge
+        tasks.add(asyncio.ensure_future(
+            _acomplete_once(hedge_provider, hedge_model, messages, system, max_tokens, temperature, deadline_at)))
+        pending = {t for t in tasks if not t.done()}
+        errors = [t.exception() for t in tasks if t.done() and t.exception() is not None]
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                errors.append(task.exception())
+        raise errors[-1]
+    finally:
+        # 먼저 끝난 쪽이 있으면 나머지 요청은 취소
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+# ------------------------ 비동기 스트리밍 ------------------------
+async def _aopen_stream(client, provider, kwargs):
+    if provider == "anthropic":
+        manager = client.messages.stream(**kwargs)
+        return manager, await manager.__aenter__()
+    response = await client.chat.completions.create(stream=True, stream_options={"include_usage": True}, **kwargs)
+    return response, response
+
+
+async def astream(messages: list, model: str = "gpt-3.5-turbo", provider: str = "openai",
+                  system: str = None, max_tokens: int = 1024, temperature: float = 0.0,
+                  deadline: float = DEFAULT_DEADLINE):
+    """stream()의 비동기 버전 (async for). 태스크가 취소되거나 aclose()하면 HTTP 스트림도 닫힘."""
+    model, max_tokens = apply_budget(model, max_tokens)
+    loop = asyncio.get_running_loop()
+    deadline_at = loop.time() + deadline
+    client = get_async_client(provider)
+    # span() 컨텍스트 매니저는 contextvar를 yield 너머까지 잡고 있어서, 소비 쪽이 break/취소하면
+    # 다른 Context에서 reset하다 ValueError가 남 → 스팬을 직접 열고 finally에서 기록
+    sp = open_span("llm_call", provider=provider, model=model, stream=True)
+    error = None
+    try:
+        attempt = 0
+        while True:
+            remaining = deadline_at - loop.time()
+            if remaining <= 0:
+                raise LLMError(f"{provider}/{model} 마감 시간 초과")
+            start = loop.time()
+            try:
+                kwargs = _request_kwargs(provider, model, messages, system, max_tokens, temperature, remaining)
+                handle, events = await asyncio.wait_for(_aopen_stream(client, provider, kwargs), timeout=remaining)
+                break
+            except asyncio.TimeoutError:
+                raise LLMError(f"{provider}/{model} 마감 시간 초과")
+            except Exception as e:
+                if attempt >= MAX_RETRIES or not _is_retryable(e):
+                    raise
+                delay = _backoff(attempt)
+                if loop.time() + delay >= deadline_at:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+
+        parts = []
+        usage = {"prompt_tokens": 0, "completion_tokens": 0}
+        try:
+            if provider == "anthropic":
+                async for text in events.text_stream:
+                    parts.append(text)
+                    yield text
+                final = await events.get_final_message()
+                usage = {"prompt_tokens": final.usage.input_tokens, "completion_tokens": final.usage.output_tokens}
+            else:
+                async for chunk in events:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        parts.append(chunk.choices[0].delta.content)
+                        yield chunk.choices[0].delta.content
+                    if getattr(chunk, "usage", None):
+                        usage = {"prompt_tokens": chunk.usage.prompt_tokens,
+                                 "completion_tokens": chunk.usage.completion_tokens}
+        finally:
+            if provider == "anthropic":
+                await handle.__aexit__(None, None, None)
+            else:
+                await handle.close()
+            latency = loop.time() - start
+            sp.set(**usage)
+            _record({"text": "".join(parts), "provider": provider, "model": model, "usage": usage, "latency": latency})
+    except GeneratorExit:
+        raise  # 소비 쪽이 중간에 닫은 것은 오류가 아님
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        close_span(sp, error)
@@ -0,0 +1,167 @@
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# ✅ 로컬 목 LLM 서버 (네트워크 없이 llm_client 테스트용)
+#   - POST /v1/messages          : Anthropic Messages API 형식
+#   - POST /v1/chat/completions  : OpenAI Chat Completions 형식
+#   - 요청에 "stream": true 가 있으면 각 API 형식의 SSE 스트림으로 응답
+#   사용 예) ANTHROPIC_BASE_URL=http://127.0.0.1:8099 OPENAI_BASE_URL=http://127.0.0.1:8099/v1
+
+
+def fake_answer(prompt: str) -> str:
+    # 같은 프롬프트에는 항상 같은 답 (결정적)
+    digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12]
+    return f"[mock:{digest}] {prompt[-80:]}"
+
+
+def split_tokens(text: str) -> list:
+    # 스트리밍 응답용으로 공백 단위로 자름 (공백 포함)
+    pieces = text.split(" ")
+    return [p + " " for p in pieces[:-1]] + pieces[-1:]
+
+
+def _prompt_text(messages) -> str:
+    parts = []
+    for m in messages:
+        content = m.get("content", "")
+        if isinstance(content, list):
+            content = " ".join(c.get("text", "") for c in content if isinstance(c, dict))
+        parts.append(content)
+    return "\n".join(parts)
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive 커넥션 재사용 확인용
+    delay = 0.0
+    jitter = 0.0
+    fail_rate = 0.0
+    token_delay = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        try:
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            # 헤징/취소로 클라이언트가 먼저 연결을 끊은 경우
+            pass
+
+    def _send_events(self, events):
+        # SSE 스트리밍 응답 (Content-Length 없이 보내고 연결 종료)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        try:
+            for event, body in events:
+                prefix = f"event: {event}\n" if event else ""
+                data = body if isinstance(body, str) else json.dumps(body, ensure_ascii=False)
+                self.wfile.write(f"{prefix}data: {data}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                time.sleep(self.token_delay)
+        except (BrokenPipeError, ConnectionResetError):
+            # 클라이언트가 스트림 중간에 취소한 경우
+            pass
+
+    def _anthropic_events(self, model, answer, prompt_tokens, completion_tokens):
+        yield "message_start", {"type": "message_start", "message": {
+            "id": "msg_mock", "type": "message", "role": "assistant", "model": model, "content": [],
+            "stop_reason": None, "stop_sequence": None,
+            "usage": {"input_tokens": prompt_tokens, "output_tokens": 0}}}
+        yield "content_block_start", {"type": "content_block_start", "index": 0,
+                                      "content_block": {"type": "text", "text": ""}}
+        for piece in split_tokens(answer):
+            yield "content_block_delta", {"type": "content_block_delta", "index": 0,
+                                          "delta": {"type": "text_delta", "text": piece}}
+        yield "content_block_stop", {"type": "content_block_stop", "index": 0}
+        yield "message_delta", {"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                                "usage": {"output_tokens": completion_tokens}}
+        yield "message_stop", {"type": "message_stop"}
+
+    def _openai_events(self, model, answer, prompt_tokens, completion_tokens):
+        base = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": int(time.time()), "model": model}
+        for piece in split_tokens(answer):
+            yield None, {**base, "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+        yield None, {**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        yield None, {**base, "choices": [], "usage": {"prompt_tokens": prompt_tokens,
+                                                       "completion_tokens": completion_tokens,
+                                                       "total_tokens": prompt_tokens + completion_tokens}}
+        yield None, "[DONE]"
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+
+        time.sleep(self.delay + random.uniform(0, self.jitter))
+        if random.random() < self.fail_rate:
+            self._send(529 if self.path.endswith("/messages") else 503,
+                       {"type": "error", "error": {"type": "overloaded_error", "message": "mock overload"}})
+            return
+
+        prompt = _prompt_text(payload.get("messages", []))
+        answer = fake_answer(prompt)
+        prompt_tokens = max(1, len(prompt) // 2)
+        completion_tokens = max(1, len(answer) // 2)
+        model = payload.get("model", "mock")
+
+        if payload.get("stream"):
+            if self.path.endswith("/messages"):
+                self._send_events(self._anthropic_events(model, answer, prompt_tokens, completion_tokens))
+            else:
+                self._send_events(self._openai_events(model, answer, prompt_tokens, completion_tokens))
+        elif self.path.endswith("/messages"):
+            self._send(200, {
+                "id": "msg_mock", "type": "message", "role": "assistant", "model": model,
+                "content": [{"type": "text", "text": answer}],
+                "stop_reason": "end_turn", "stop_sequence": None,
+                "usage": {"input_tokens": prompt_tokens, "output_tokens": completion_tokens},
+            })
+        elif self.path.endswith("/chat/completions"):
+            self._send(200, {
+                "id": "chatcmpl-mock", "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": answer}}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                          "total_tokens": prompt_tokens + completion_tokens},
+            })
+        else:
+            self._send(404, {"error": {"message": f"unknown path {self.path}"}})
+
+
+# ✅ 백그라운드 스레드로 서버 시작 (port=0이면 빈 포트 자동 할당)
+def start_mock_server(port: int = 0, delay: float = 0.0, jitter: float = 0.0, fail_rate: float = 0.0,
+                      token_delay: float = 0.0):
+    handler = type("ConfiguredMockHandler", (MockHandler,),
+                   {"delay": delay, "jitter": jitter, "fail_rate": fail_rate, "token_delay": token_delay})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="로컬 목 LLM 서버")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--delay", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--token-delay", type=float, default=0.0, help="스트리밍 토큰 간 지연 (초)")
+    args = parser.parse_args()
+
+    server, url = start_mock_server(args.port, args.delay, args.jitter, args.fail_rate, args.token_delay)
+    print(f"목 LLM 서버 실행 중: {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
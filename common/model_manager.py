@@ -0,0 +1,317 @@
+import os
+import gc
+import time
+import shutil
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from common.tracing import span
+
+# ✅ 메모리 예산 기반 로컬 모델 관리자 (LRU)
+#   - 모델은 처음 요청될 때 로드, 프로세스 전체에서 공유
+#   - 로드된 모델마다 실제 메모리(파라미터 + 버퍼 바이트)를 기록하고 합계가 예산을 넘지 않게 관리
+#   - 새 모델이 예산을 넘으면 가장 오래 안 쓴(사용 중이 아닌) 모델부터 내림
+#       drop    : 메모리에서 해제 (다음 로드는 원래 경로/허브 캐시에서)
+#       offload : 처음 내릴 때 safetensors로 저장해 두고 다음 로드는 mmap으로 빠르게 읽음
+#   - 적중/로드/내림 횟수와 로드 시간 (metrics), 로드 지연은 트레이싱 히스토그램(model_load)에도 기록
+#
+# 사용 예)
+#   with get_manager().use("phi3-mini") as (tokenizer, model):   # 생성 중에는 내려가지 않음
+#       model.generate(...)
+
+logger = logging.getLogger(__name__)
+
+
+def _default_budget() -> int:
+    try:
+        total = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError, AttributeError):
+        total = 16 * 1024 ** 3
+    return int(total * 0.7)
+
+
+MEMORY_BUDGET = int(float(os.getenv("MODEL_MEMORY_BUDGET_GB", "0")) * 1024 ** 3) or _default_budget()
+EVICT_MODE = os.getenv("MODEL_EVICT_MODE", "drop")  # drop | offload
+OFFLOAD_DIR = os.getenv("MODEL_OFFLOAD_DIR", os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".model_offload"))
+
+# 버전별 스크립트에서 쓰는 모델 (params: 로드 전 메모리 추정용 파라미터 수)
+MODEL_SPECS = {
+    "mistral-7b": {"model_id": "mistralai/Mistral-7B-Instruct-v0.1", "params": 7.24e9, "dtype": "float16",
+                   "token_env": "HF_TOKEN", "device_map": "auto"},
+    "phi3-mini": {"model_id": "microsoft/Phi-3-mini-4k-instruct", "params": 3.82e9, "dtype": "float32",
+                  "device": "cpu"},
+    "phi3-medium": {"model_id": "microsoft/Phi-3-medium-4k-instruct", "params": 14.0e9, "dtype": "auto",
+                    "trust_remote_code": True, "device_map": "auto"},
+    "llama3-8b": {"model_id": "meta-llama/Meta-Llama-3-8B-Instruct", "params": 8.03e9, "dtype": "auto",
+                  "device_map": "auto", "tokenizer_kwargs": {"use_fast": True}},
+    "phi-2": {"model_id": "microsoft/phi-2", "params": 2.78e9, "dtype": "float32", "device": "cpu"},
+}
+
+
+class MemoryBudgetError(RuntimeError):
+    pass
+
+
+def _dtype(name: str):
+    import torch
+    if name == "auto":
+        # GPU가 있으면 float16, CPU면 float32 (기존 스크립트와 동일)
+        return torch.float16 if torch.cuda.is_available() else torch.float32
+    return getattr(torch, name)
+
+
+def _bytes_per_param(spec: dict) -> int:
+    dtype = spec.get("dtype", "float32")
+    if dtype == "auto":
+        dtype = str(_dtype("auto")).replace("torch.", "")
+    return 2 if dtype in ("float16", "bfloat16") else 4
+
+
+def model_footprint(model) -> int:
+    """파라미터 + 버퍼 바이트 (같은 텐서를 공유하는 가중치는 한 번만)"""
+    seen, total = set(), 0
+    for tensor in list(model.parameters()) + list(model.buffers()):
+        key = tensor.data_ptr()
+        if key in seen:
+            continue
+        seen.add(key)
+        total += tensor.numel() * tensor.element_size()
+    return total
+
+
+class ModelManager:
+    def __init__(self, budget: int = MEMORY_BUDGET, evict_mode: str = EVICT_MODE, specs: dict = None,
+                 offload_dir: str = OFFLOAD_DIR):
+        self.budget = budget
+        self.evict_mode = evict_mode
+        self.specs = specs or MODEL_SPECS
+        self.offload_dir = offload_dir
+        self._lock = threading.RLock()
+        self._loaded = OrderedDict()  # 이름 → {"tokenizer", "model", "bytes", "in_use", "last_used"} (LRU 순서)
+        self._loading = {}  # 이름 → Event (같은 모델을 동시에 두 번 로드하지 않도록)
+        self._reserved = {}  # 로드 중인 모델 이름 → 예약한 추정 바이트 (동시 로드가 예산을 같이 넘지 않도록)
+        self._evicting = {}  # offload 저장 중인 모델 이름 → {"bytes", "done": Event} (저장이 끝날 때까지 메모리 차지)
+        self._footprints = {}  # 한 번 로드해 본 모델의 실제 크기
+        self._offloaded = set()
+        self.stats = {"hits": 0, "loads": 0, "evictions": 0, "offloads": 0, "load_seconds": 0.0}
+
+    # ------------------------ 조회 ------------------------
+    def _loaded_bytes(self) -> int:
+        return sum(entry["bytes"] for entry in self._loaded.values())
+
+    def used_bytes(self) -> int:
+        """메모리에 올라와 있는 바이트 (offload 저장 중인 모델 포함)"""
+        with self._lock:
+            return self._loaded_bytes() + sum(item["bytes"] for item in self._evicting.values())
+
+    def reserved_bytes(self) -> int:
+        with self._lock:
+            return sum(self._reserved.values())
+
+    def estimate(self, name: str) -> int:
+        if name in self._footprints:
+            return self._footprints[name]
+        spec = self.specs[name]
+        return int(spec.get("params", 0) * _bytes_per_param(spec))
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                **self.stats,
+                "load_seconds": round(self.stats["load_seconds"], 2),
+                "budget_bytes": self.budget,
+                "used_bytes": self.used_bytes(),
+                "reserved_bytes": self.reserved_bytes(),
+                "evict_mode": self.evict_mode,
+                "models": {name: {"bytes": entry["bytes"], "in_use": entry["in_use"],
+                                  "idle_seconds": round(time.time() - entry["last_used"], 1)}
+                           for name, entry in self._loaded.items()},
+                "offloaded": sorted(self._offloaded),
+            }
+
+    # ------------------------ 로드 / 내림 ------------------------
+    def _offload_path(self, name: str) -> str:
+        return os.path.join(self.offload_dir, name)
+
+    def _load(self, name: str) -> tuple:
+        from transformers import AutoTokenizer, AutoModelForCausalLM
+        spec = self.specs[name]
+        source = self._offload_path(name) if name in self._offloaded else spec["model_id"]
+        token = os.getenv(spec["token_env"]) if spec.get("token_env") else None
+        kwargs = {"torch_dtype": _dtype(spec.get("dtype", "float32")), "token": token,
+                  "trust_remote_code": spec.get("trust_remote_code", False)}
+        if spec.get("device_map"):
+            kwargs["device_map"] = spec["device_map"]
+        tokenizer = AutoTokenizer.from_pretrained(source, token=token, trust_remote_code=kwargs["trust_remote_code"],
+                                                  **spec.get("tokenizer_kwargs", {}))
+        model = AutoModelForCausalLM.from_pretrained(source, **kwargs)
+        if spec.get("device"):
+            model = model.to(spec["device"])
+        model.eval()
+        return tokenizer, model
+
+    def _evict_one(self, needed: int, exclude: str = None, to_offload: list = None) -> bool:
+        """_lock 안에서 호출: 사용 중이 아닌 가장 오래된 모델 하나 내림 (exclude는 제외) → 내렸으면 True
+        offload 저장이 필요하면 to_offload에 (이름, entry)를 넣음 → 호출한 쪽이 락 밖에서 _write_offloads()"""
+        for name, entry in self._loaded.items():
+            if entry["in_use"] or name == exclude:
+                continue
+            del self._loaded[name]
+            logger.info("model evict: %s (%.1f GB) to fit %.1f GB", name, entry["bytes"] / 1024 ** 3,
+                        needed / 1024 ** 3)
+            if self.evict_mode == "offload" and name not in self._offloaded and to_offload is not None:
+                # 저장(수 GB)은 락 밖에서 → 그동안 다른 모델의 get()/use()/metrics()가 막히지 않음
+                self._evicting[name] = {"bytes": entry["bytes"], "done": threading.Event()}
+                to_offload.append((name, entry))
+                return True
+            self.stats["evictions"] += 1
+            entry.clear()
+            gc.collect()
+            return True
+        return False
+
+    def _write_offloads(self, to_offload: list):
+        """_lock 밖에서 호출: 내린 모델을 safetensors로 저장한 뒤 메모리에서 해제"""
+        for name, entry in to_offload:
+            saved = False
+            try:
+                # 원본이 허브 캐시/변환 경로여도 다음 로드는 로컬 safetensors mmap
+                path = self._offload_path(name)
+                shutil.rmtree(path, ignore_errors=True)
+                entry["model"].save_pretrained(path, safe_serialization=True)
+                entry["tokenizer"].save_pretrained(path)
+                saved = True
+            except Exception:
+                logger.exception("model offload failed: %s (dropped instead)", name)
+            finally:
+                entry.clear()
+                gc.collect()
+                with self._lock:
+                    if saved:
+                        self._offloaded.add(name)
+                        self.stats["offloads"] += 1
+                    self.stats["evictions"] += 1
+                    self._evicting.pop(name)["done"].set()
+
+    def _make_room(self, name: str, to_offload: list):
+        """_lock 안에서 호출: 예산 안에 name 자리를 만듦 (로드 중인 다른 모델의 예약분 포함)
+        → None이면 to_offload 저장 후 로드 가능, Event면 진행 중인 로드/저장이 끝난 뒤 다시 시도"""
+        needed = self.estimate(name)
+        if needed > self.budget:
+            raise MemoryBudgetError(f"{name} ({needed / 1024 ** 3:.1f}GB)가 메모리 예산 "
+                                    f"({self.budget / 1024 ** 3:.1f}GB)보다 큽니다.")
+        while self._loaded_bytes() + self.reserved_bytes() + needed > self.budget:
+            if self._evict_one(needed, to_offload=to_offload):
+                continue
+            if self._loading:
+                # 다른 모델이 로드 중 → 끝나면(성공이든 실패든) 예약이 풀리거나 내릴 수 있는 모델이 생김
+                return next(iter(self._loading.values()))
+            raise MemoryBudgetError(f"사용 중인 모델 때문에 {name}을(를) 올릴 메모리가 부족합니다.")
+        if not to_offload and self._evicting and self.used_bytes() + self.reserved_bytes() + needed > self.budget:
+            # 다른 스레드가 내린 모델이 아직 저장 중 (메모리를 차지하고 있음)
+            return next(iter(self._evicting.values()))["done"]
+        return None
+
+    def get(self, name: str) -> tuple:
+        """(tokenizer, model) - 없으면 예산 안에서 로드"""
+        while True:
+            to_offload = []
+            with self._lock:
+                entry = self._loaded.get(name)
+                if entry is not None:
+                    self._loaded.move_to_end(name)
+                    entry["last_used"] = time.time()
+                    self.stats["hits"] += 1
+                    return entry["tokenizer"], entry["model"]
+                waiting = self._loading.get(name)
+                if waiting is None:
+                    waiting = self._make_room(name, to_offload)
+                    if waiting is None and not to_offload:
+                        self._reserved[name] = self.estimate(name)
+                        self._loading[name] = threading.Event()
+                        break
+            if to_offload:
+                # 내린 모델 저장이 끝나면 메모리가 비므로 다시 확인
+                self._write_offloads(to_offload)
+                continue
+            waiting.wait()
+
+        try:
+            start = time.perf_counter()
+            with span("model_load", model=name, offloaded=name in self._offloaded):
+                tokenizer, model = self._load(name)
+            elapsed = time.perf_counter() - start
+            size = model_footprint(model)
+            to_offload = []
+            try:
+                with self._lock:
+                    self._reserved.pop(name, None)  # 이제 실제 크기로 _loaded에 잡힘
+                    self._footprints[name] = size
+                    self._loaded[name] = {"tokenizer": tokenizer, "model": model, "bytes": size, "in_use": 0,
+                                          "last_used": time.time()}
+                    self.stats["loads"] += 1
+                    self.stats["load_seconds"] += elapsed
+                    # 추정보다 컸으면 다른 모델을 더 내려서 예산 유지 (방금 올린 모델은 제외)
+                    while (self._loaded_bytes() + self.reserved_bytes() > self.budget
+                           and self._evict_one(0, exclude=name, to_offload=to_offload)):
+                        pass
+                    overflow = self._loaded_bytes() + self.reserved_bytes() > self.budget
+                    if overflow:
+                        # 그래도 넘치면 새 모델을 내리고 실패 처리 (실제 크기는 기록해 두었으므로 다음 추정에 반영)
+                        entry = self._loaded.pop(name)
+            finally:
+                self._write_offloads(to_offload)
+            if overflow:
+                entry.clear()
+                gc.collect()
+                raise MemoryBudgetError(f"{name} 실제 크기({size / 1024 ** 3:.1f}GB)가 추정보다 커서 "
+                                        f"사용 중인 모델과 함께 메모리 예산에 들어가지 않습니다.")
+            logger.info("model load: %s %.1f GB in %.1fs", name, size / 1024 ** 3, elapsed)
+            return tokenizer, model
+        finally:
+            with self._lock:
+                self._reserved.pop(name, None)
+                self._loading.pop(name).set()
+
+    @contextmanager
+    def use(self, name: str):
+        """생성하는 동안 내려가지 않도록 사용 중 표시"""
+        while True:
+            tokenizer, model = self.get(name)
+            with self._lock:
+                entry = self._loaded.get(name)
+                # get() 직후 다른 스레드가 내렸으면 다시 로드
+                if entry is not None and entry["model"] is model:
+                    entry["in_use"] += 1
+                    break
+        try:
+            yield tokenizer, model
+        finally:
+            with self._lock:
+                entry = self._loaded.get(name)
+                if entry:
+                    entry["in_use"] -= 1
+                    entry["last_used"] = time.time()
+
+    def unload(self, name: str):
+        with self._lock:
+            entry = self._loaded.pop(name, None)
+            if entry:
+                entry.clear()
+                gc.collect()
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_manager() -> ModelManager:
+    """프로세스 공용 관리자 (MODEL_MEMORY_BUDGET_GB, MODEL_EVICT_MODE)"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = ModelManager()
+        return _manager
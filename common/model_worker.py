@@ -0,0 +1,302 @@
+import os
+import sys
+import time
+import queue
+import uuid
+import importlib
+import threading
+import multiprocessing as mp
+
+from common.model_manager import MEMORY_BUDGET
+
+# ✅ 모델 백엔드를 별도 프로세스에서 실행 (Gradio 프로세스와 GIL / torch 스레드 풀 / 메모리 분리)
+#   - 워커 프로세스가 모듈(예: version_1.car_error)을 import 하고 요청받은 함수를 실행
+#   - 함수가 제너레이터면 조각마다 토큰 메시지로 전달, 일반 함수면 결과를 한 번에 전달
+#   - 취소 메시지를 받으면 다음 조각에서 제너레이터를 close() → 백엔드가 생성 중단
+#   - 워커별 torch/BLAS 스레드 수와 CPU 코어 고정 (MODEL_WORKER_<이름>_THREADS / _CPUS)
+#   - 워커별 모델 메모리 예산 (MODEL_WORKER_<이름>_BUDGET_GB, 없으면 전체 예산을 워커 수로 나눔)
+#   - 워커가 죽으면(OOM 등) 진행 중 요청은 오류로 끝내고 자동 재시작
+#
+# IPC 메시지 (dict, multiprocessing Queue)
+#   요청  → {"op": "call", "id", "function", "args", "kwargs"} / {"op": "cancel", "id"} / None (종료)
+#   응답  ← {"type": "ready", "pid"} / {"type": "token", "id", "text"} / {"type": "done", "id"}
+#           / {"type": "error", "id", "detail"}
+#
+# 사용 예)
+#   worker = worker_from_env("car_error", "version_1.car_error", warmup="load_model")
+#   worker.start()                                  # 백그라운드에서 모델 로드
+#   for piece in worker.stream("generate_response", "시동이 안 걸려요"): ...
+
+TOKEN_TIMEOUT = float(os.getenv("MODEL_WORKER_TOKEN_TIMEOUT", "600"))
+MAX_RESTARTS = int(os.getenv("MODEL_WORKER_MAX_RESTARTS", "5"))
+RESTART_WINDOW = 300.0  # 이 시간(초) 안에 MAX_RESTARTS번 넘게 죽으면 재시작 중단
+
+_ctx = mp.get_context("spawn")  # fork는 torch/스레드 상태를 복사하므로 사용하지 않음
+_spawn_lock = threading.Lock()  # 자식에게 넘길 환경변수를 잠깐 바꾸는 동안 다른 워커 시작과 겹치지 않도록
+THREAD_ENV_KEYS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+
+
+class WorkerError(RuntimeError):
+    pass
+
+
+def parse_cpus(value: str) -> set:
+    """"0-3,6" → {0, 1, 2, 3, 6}"""
+    cpus = set()
+    for part in (value or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        start, _, end = part.partition("-")
+        cpus.update(range(int(start), int(end or start) + 1))
+    return cpus
+
+
+# ------------------------ 워커 프로세스 ------------------------
+def _configure(threads: int, cpus: set):
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+    if threads:
+        # OMP/MKL 환경변수는 부모가 프로세스 시작 시 넘겨 줌 (_spawn)
+        # spawn은 _worker_main 전에 메인 모듈(app.py)을 다시 import 하므로 여기서 설정하면 이미 늦을 수 있음
+        try:
+            import torch
+            torch.set_num_threads(threads)
+        except ImportError:
+            pass
+
+
+def _run_job(module, job: dict, responses, cancelled: set):
+    job_id = job["id"]
+    if job_id in cancelled:
+        responses.put({"type": "done", "id": job_id})
+        return
+    try:
+        result = getattr(module, job["function"])(*job["args"], **job["kwargs"])
+        if isinstance(result, str) or not hasattr(result, "__next__"):
+            responses.put({"type": "token", "id": job_id, "text": "" if result is None else str(result)})
+        else:
+            try:
+                for piece in result:
+                    if job_id in cancelled:
+                        break
+                    responses.put({"type": "token", "id": job_id, "text": piece})
+            finally:
+                if hasattr(result, "close"):
+                    result.close()  # 백엔드의 생성 스레드/스트리머 정리
+        responses.put({"type": "done", "id": job_id})
+    except Exception as e:
+        responses.put({"type": "error", "id": job_id, "detail": f"{type(e).__name__}: {e}"})
+    finally:
+        cancelled.discard(job_id)
+
+
+def _worker_main(module_name: str, warmup: str, requests, responses, threads: int, cpus: set, sys_path: list):
+    sys.path[:0] = [p for p in sys_path if p not in sys.path]
+    _configure(threads, cpus)
+    module = importlib.import_module(module_name)
+    if warmup:
+        getattr(module, warmup)()
+    responses.put({"type": "ready", "pid": os.getpid()})
+
+    jobs = queue.Queue()
+    cancelled = set()
+
+    def runner():
+        # 모델 하나당 한 번에 한 요청 (CPU 생성은 동시에 돌려도 빨라지지 않음)
+        while True:
+            job = jobs.get()
+            if job is None:
+                return
+            _run_job(module, job, responses, cancelled)
+
+    thread = threading.Thread(target=runner, name="model-runner", daemon=True)
+    thread.start()
+    # 메인 스레드는 요청 수신만 → 생성 중에도 취소 메시지를 바로 처리
+    while True:
+        message = requests.get()
+        if message is None:
+            jobs.put(None)
+            break
+        if message["op"] == "cancel":
+            cancelled.add(message["id"])
+        elif message["op"] == "call":
+            jobs.put(message)
+    thread.join(timeout=5)
+
+
+# ------------------------ 클라이언트 (Gradio 프로세스) ------------------------
+class ModelWorker:
+    def __init__(self, name: str, module: str, warmup: str = None, threads: int = None, cpus: set = None,
+                 budget_gb: float = None, max_restarts: int = MAX_RESTARTS):
+        self.name = name
+        self.module = module
+        self.warmup = warmup
+        self.threads = threads
+        self.cpus = cpus or set()
+        self.budget_gb = budget_gb  # 워커 안 모델 관리자의 MODEL_MEMORY_BUDGET_GB (None이면 그 프로세스 기본값)
+        self.max_restarts = max_restarts
+        self.process = None
+        self.pid = None
+        self.ready = threading.Event()
+        self.restarts = []
+        self.failed = None
+        self._pending = {}  # 요청 id → 응답 큐
+        self._lock = threading.Lock()
+        self._requests = None
+        self._responses = None
+        self._reader = None
+        self._stopping = False
+
+    def start(self):
+        with self._lock:
+            if self.process is not None and self.process.is_alive():
+                return
+            self._spawn()
+        if self._reader is None:
+            self._reader = threading.Thread(target=self._read_loop, name=f"worker-{self.name}", daemon=True)
+            self._reader.start()
+
+    def child_env(self) -> dict:
+        """워커 프로세스가 시작될 때부터 갖고 있어야 하는 환경변수"""
+        env = {}
+        if self.threads:
+            env.update({key: str(self.threads) for key in THREAD_ENV_KEYS})
+        if self.budget_gb:
+            env["MODEL_MEMORY_BUDGET_GB"] = f"{self.budget_gb:.3f}"
+        return env
+
+    def _spawn(self):
+        # 죽은 프로세스가 잡고 있던 큐는 다시 쓰지 않음
+        self._requests = _ctx.Queue()
+        self._responses = _ctx.Queue()
+        self.ready.clear()
+        self.process = _ctx.Process(
+            target=_worker_main, name=f"model-{self.name}", daemon=True,
+            args=(self.module, self.warmup, self._requests, self._responses, self.threads, self.cpus, list(sys.path))
+        )
+        # 자식은 시작 시점의 os.environ을 물려받음 → 메인 모듈 재import(torch 등) 전에 스레드 수가 반영됨
+        env = self.child_env()
+        with _spawn_lock:
+            saved = {key: os.environ.get(key) for key in env}
+            os.environ.update(env)
+            try:
+                self.process.start()
+            finally:
+                for key, value in saved.items():
+                    if value is None:
+                        os.environ.pop(key, None)
+                    else:
+                        os.environ[key] = value
+
+    def _read_loop(self):
+        while not self._stopping:
+            try:
+                message = self._responses.get(timeout=0.5)
+            except queue.Empty:
+                if not self.process.is_alive() and not self._stopping:
+                    self._handle_crash()
+                continue
+            except (EOFError, OSError):
+                self._handle_crash()
+                continue
+            if message["type"] == "ready":
+                self.pid = message["pid"]
+                self.ready.set()
+                continue
+            with self._lock:
+                target = self._pending.get(message["id"])
+            if target is not None:
+                target.put(message)
+
+    def _handle_crash(self):
+        exitcode = self.process.exitcode
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for target in pending.values():
+            target.put({"type": "error", "detail": f"모델 워커 종료 (exit {exitcode}), 재시작 중"})
+
+        now = time.time()
+        self.restarts = [t for t in self.restarts if now - t < RESTART_WINDOW] + [now]
+        if len(self.restarts) > self.max_restarts:
+            self.failed = f"{RESTART_WINDOW:.0f}초 안에 {len(self.restarts)}번 종료되어 재시작 중단 (exit {exitcode})"
+            self._stopping = True
+            return
+        with self._lock:
+            self._spawn()
+
+    def stream(self, function: str, *args, **kwargs):
+        """워커에서 function 실행 → 텍스트 조각 제너레이터. 중간에 close()하면 워커에 취소 전달"""
+        if self.failed:
+            raise WorkerError(self.failed)
+        self.start()
+        job_id = uuid.uuid4().hex
+        responses = queue.Queue()
+        with self._lock:
+            self._pending[job_id] = responses
+            requests = self._requests
+        requests.put({"op": "call", "id": job_id, "function": function, "args": args, "kwargs": kwargs})
+        finished = False
+        try:
+            while True:
+                try:
+                    message = responses.get(timeout=TOKEN_TIMEOUT)
+                except queue.Empty:
+                    raise WorkerError(f"{TOKEN_TIMEOUT:.0f}초 동안 응답 없음")
+                if message["type"] == "token":
+                    yield message["text"]
+                elif message["type"] == "done":
+                    finished = True
+                    return
+                else:
+                    finished = True
+                    raise WorkerError(message["detail"])
+        finally:
+            with self._lock:
+                self._pending.pop(job_id, None)
+            if not finished:
+                try:
+                    requests.put({"op": "cancel", "id": job_id})
+                except (OSError, ValueError):
+                    pass
+
+    def call(self, function: str, *args, **kwargs) -> str:
+        return "".join(self.stream(function, *args, **kwargs))
+
+    def handler(self, function: str, error_prefix: str = "⚠️ ", accumulate: bool = True):
+        """Gradio 핸들러: 지금까지 받은 텍스트를 누적해서 yield (연결이 끊기면 Gradio가 close → 취소)
+        accumulate=False 면 백엔드가 보낸 조각(이미 누적된 화면 텍스트)을 그대로 yield"""
+        def handle(*args):
+            text = ""
+            try:
+                for piece in self.stream(function, *args):
+                    text = text + piece if accumulate else piece
+                    yield text
+            except WorkerError as e:
+                yield f"{text}\n\n{error_prefix}{e}" if text else f"{error_prefix}{e}"
+        return handle
+
+    def status(self) -> dict:
+        return {"name": self.name, "alive": bool(self.process and self.process.is_alive()), "pid": self.pid,
+                "ready": self.ready.is_set(), "inflight": len(self._pending), "restarts": len(self.restarts),
+                "failed": self.failed}
+
+    def stop(self):
+        self._stopping = True
+        if self.process is not None and self.process.is_alive():
+            self._requests.put(None)
+            self.process.join(timeout=10)
+            if self.process.is_alive():
+                self.process.kill()
+
+
+def worker_from_env(name: str, module: str, warmup: str = None, budget_share: int = 1) -> ModelWorker:
+    """MODEL_WORKER_<NAME>_THREADS / _CPUS / _BUDGET_GB 로 워커별 스레드 수 / 코어 / 모델 메모리 예산 지정
+    _BUDGET_GB가 없으면 전체 예산(MODEL_MEMORY_BUDGET_GB 또는 RAM의 70%)을 budget_share(워커 수)로 나눔
+    → 워커마다 RAM의 70%를 따로 잡아서 합계가 물리 메모리를 넘는 일이 없도록"""
+    prefix = f"MODEL_WORKER_{name.upper()}_"
+    threads = os.getenv(prefix + "THREADS")
+    budget = os.getenv(prefix + "BUDGET_GB")
+    budget_gb = float(budget) if budget else MEMORY_BUDGET / max(budget_share, 1) / 1024 ** 3
+    return ModelWorker(name, module, warmup=warmup, threads=int(threads) if threads else None,
+                       cpus=parse_cpus(os.getenv(prefix + "CPUS", "")), budget_gb=budget_gb)
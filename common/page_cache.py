@@ -0,0 +1,141 @@
+import os
+import time
+import zlib
+import sqlite3
+import threading
+
+# ✅ 페이지 텍스트 캐시 (PDF 내용 해시 기준, 모든 인덱싱 경로 공용)
+#   - 키: (PDF sha256, 페이지 번호, 추출기 버전) → zlib 압축 텍스트 + 사용한 추출기
+#   - 청크 크기/임베딩 모델만 바꿔 다시 인덱싱할 때 PDF 파싱과 OCR을 통째로 건너뜀
+#   - 파일 이름/경로와 무관 (같은 PDF면 claude_RAG, openAI_RAG, CLAUDE 스크립트가 함께 사용)
+#   - 전체 크기가 PAGE_CACHE_MAX_MB를 넘으면 가장 오래 안 쓴 문서부터 삭제 (LRU, 문서 단위)
+
+PAGE_CACHE_ENABLED = os.getenv("PAGE_CACHE_ENABLED", "1") == "1"
+PAGE_CACHE_DB = os.getenv("PAGE_CACHE_DB", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                                        "page_text_cache.sqlite"))
+PAGE_CACHE_MAX_MB = float(os.getenv("PAGE_CACHE_MAX_MB", "512"))
+
+
+class PageCache:
+    def __init__(self, path: str = PAGE_CACHE_DB, max_bytes: int = None):
+        self.path = path
+        self.max_bytes = int(PAGE_CACHE_MAX_MB * 1024 * 1024) if max_bytes is None else max_bytes
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            # documents: 문서(해시, 버전)별 전체 페이지 수와 마지막 사용 시각 (LRU 기준)
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS documents (
+                    doc_hash TEXT NOT NULL,
+                    version TEXT NOT NULL,
+                    page_count INTEGER NOT NULL,
+                    size_bytes INTEGER DEFAULT 0,
+                    last_used REAL,
+                    PRIMARY KEY (doc_hash, version)
+                )
+            """)
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS pages (
+                    doc_hash TEXT NOT NULL,
+                    version TEXT NOT NULL,
+                    page INTEGER NOT NULL,
+                    extractor TEXT,
+                    text BLOB NOT NULL,
+                    PRIMARY KEY (doc_hash, version, page)
+                ) WITHOUT ROWID
+            """)
+        self.hits = 0
+        self.misses = 0
+
+    # ------------------------ 조회 ------------------------
+    def get_pages(self, doc_hash: str, version: str) -> dict:
+        """캐시된 페이지 {page: {"page", "text", "extractor"}} (없으면 빈 dict)"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT page, extractor, text FROM pages WHERE doc_hash = ? AND version = ?", (doc_hash, version)
+            ).fetchall()
+            if rows:
+                with self.conn:
+                    self.conn.execute("UPDATE documents SET last_used = ? WHERE doc_hash = ? AND version = ?",
+                                      (time.time(), doc_hash, version))
+        return {page: {"page": page, "text": zlib.decompress(blob).decode("utf-8"), "extractor": extractor}
+                for page, extractor, blob in rows}
+
+    def page_count(self, doc_hash: str, version: str):
+        with self._lock:
+            row = self.conn.execute("SELECT page_count FROM documents WHERE doc_hash = ? AND version = ?",
+                                    (doc_hash, version)).fetchone()
+        return row[0] if row else None
+
+    # ------------------------ 저장 / 정리 ------------------------
+    def put_pages(self, doc_hash: str, version: str, page_count: int, pages: list):
+        rows = [(doc_hash, version, p["page"], p["extractor"], zlib.compress(p["text"].encode("utf-8"), 6))
+                for p in pages]
+        added = sum(len(row[4]) for row in rows)
+        with self._lock, self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?)", rows)
+            self.conn.execute("""
+                INSERT INTO documents (doc_hash, version, page_count, size_bytes, last_used) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (doc_hash, version) DO UPDATE SET
+                    page_count = excluded.page_count,
+                    size_bytes = size_bytes + excluded.size_bytes,
+                    last_used = excluded.last_used
+            """, (doc_hash, version, page_count, added, time.time()))
+        self.evict()
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            return self.conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM documents").fetchone()[0]
+
+    def evict(self, max_bytes: int = None) -> int:
+        """전체 크기가 한도를 넘으면 오래 안 쓴 문서부터 삭제 → 삭제한 문서 수"""
+        limit = self.max_bytes if max_bytes is None else max_bytes
+        evicted = 0
+        with self._lock:
+            total = self.conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM documents").fetchone()[0]
+            if total <= limit:
+                return 0
+            victims = self.conn.execute(
+                "SELECT doc_hash, version, size_bytes FROM documents ORDER BY last_used ASC"
+            ).fetchall()
+            with self.conn:
+                for doc_hash, version, size in victims:
+                    if total <= limit:
+                        break
+                    self.conn.execute("DELETE FROM pages WHERE doc_hash = ? AND version = ?", (doc_hash, version))
+                    self.conn.execute("DELETE FROM documents WHERE doc_hash = ? AND version = ?", (doc_hash, version))
+                    total -= size
+                    evicted += 1
+        return evicted
+
+    def clear(self):
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM pages")
+            self.conn.execute("DELETE FROM documents")
+        with self._lock:
+            self.conn.execute("VACUUM")
+
+    def stats(self) -> dict:
+        with self._lock:
+            documents, pages_total, size = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(page_count), 0), COALESCE(SUM(size_bytes), 0) FROM documents"
+            ).fetchone()
+        return {"documents": documents, "pages": pages_total, "size_bytes": size, "max_bytes": self.max_bytes,
+                "hits": self.hits, "misses": self.misses}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """프로세스 공용 캐시 (PAGE_CACHE_ENABLED=0 이면 None)"""
+    global _cache
+    if not PAGE_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = PageCache()
+        return _cache
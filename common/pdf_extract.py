@@ -0,0 +1,321 @@
+import os
+import io
+import sys
+import re
+import time
+import hashlib
+import threading
+from importlib import metadata
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # ✅ 공용 모듈(common) 경로
+from common.page_cache import get_cache
+
+# ✅ 페이지 단위 적응형 PDF 텍스트 추출
+#   - 페이지마다 빠른 추출기부터 시도: PyMuPDF → pypdf → pdfplumber → OCR(Tesseract)
+#   - 결과 품질(글자 수, 깨진 글리프 비율, 한글 비율/자모 분리)을 검사해서 통과하면 그 결과 사용,
+#     실패한 페이지만 다음(느린) 추출기로 넘김 → pdfplumber/OCR 비용은 필요한 페이지에서만 발생
+#   - 설치 안 된 추출기는 자동으로 건너뜀
+#   - 추출기별 시도/채택 횟수와 소요 시간 통계 (get_stats)
+#   - 추출 결과는 (PDF sha256, 페이지, 추출기 버전) 키로 페이지 텍스트 캐시에 저장 (common/page_cache.py)
+#     → 같은 PDF를 다시 인덱싱하면 파싱/OCR 없이 캐시에서 바로 읽음
+#
+# 사용 예)
+#   pages = extract_pages("manual.pdf")          # [{"page": 0, "text": ..., "extractor": "pymupdf"}, ...]
+#   text = extract_text(uploaded_file.read())
+#   python common/pdf_extract.py manual.pdf      # 페이지별 사용 추출기 + 추출기별 시간/캐시 통계
+#   python common/pdf_extract.py --clear-cache   # 페이지 텍스트 캐시 비우기
+
+MIN_CHARS = int(os.getenv("EXTRACT_MIN_CHARS", "20"))
+# 깨진 글리프(대체 문자, 사용자 정의 영역, (cid:n), 제어 문자) 비율 상한
+MAX_BAD_GLYPH_RATIO = float(os.getenv("EXTRACT_MAX_BAD_GLYPH_RATIO", "0.05"))
+# 한글 매뉴얼이면 0보다 크게 (글자 중 한글 음절 비율이 이보다 낮으면 다음 추출기로)
+MIN_HANGUL_RATIO = float(os.getenv("EXTRACT_MIN_HANGUL_RATIO", "0"))
+# 한글 중 낱자모(ㄱ, ㅏ …) 비율이 이보다 높으면 폰트 매핑이 깨진 것으로 판단
+MAX_JAMO_RATIO = float(os.getenv("EXTRACT_MAX_JAMO_RATIO", "0.3"))
+OCR_LANG = os.getenv("OCR_LANG", "kor+eng")
+OCR_DPI = int(os.getenv("OCR_DPI", "200"))
+
+_CID = re.compile(r"\(cid:\d+\)")
+_BAD_GLYPH = re.compile("[\ufffd\ue000-\uf8ff\x00-\x08\x0b\x0c\x0e-\x1f]")
+_HANGUL = re.compile(r"[가-힣]")
+_JAMO = re.compile(r"[ㄱ-ㆎᄀ-ᇿ]")
+_LETTER = re.compile(r"[^\W\d_]")
+
+
+# ------------------------ 품질 검사 ------------------------
+def check_quality(text: str) -> tuple:
+    """추출 결과 → (통과 여부, 실패 사유)"""
+    stripped = "".join((text or "").split())
+    if len(stripped) < MIN_CHARS:
+        return False, "too_short"
+    bad = len(_BAD_GLYPH.findall(stripped)) + sum(len(m) for m in _CID.findall(stripped))
+    if bad / len(stripped) > MAX_BAD_GLYPH_RATIO:
+        return False, "bad_glyphs"
+    hangul = len(_HANGUL.findall(stripped))
+    jamo = len(_JAMO.findall(stripped))
+    if jamo and jamo / (hangul + jamo) > MAX_JAMO_RATIO:
+        return False, "broken_hangul"
+    if MIN_HANGUL_RATIO > 0:
+        letters = len(_LETTER.findall(stripped))
+        if letters and hangul / letters < MIN_HANGUL_RATIO:
+            return False, "low_hangul"
+    return True, None
+
+
+# ------------------------ 추출기 ------------------------
+class _PyMuPDF:
+    name = "pymupdf"
+
+    def __init__(self, data: bytes):
+        import fitz
+        self.version = f"pymupdf-{fitz.VersionBind}"
+        self.doc = fitz.open(stream=data, filetype="pdf")
+        self.page_count = self.doc.page_count
+
+    def page_text(self, i: int) -> str:
+        return self.doc[i].get_text()
+
+    def close(self):
+        self.doc.close()
+
+
+class _PyPDF:
+    name = "pypdf"
+
+    def __init__(self, data: bytes):
+        try:
+            import pypdf
+        except ImportError:
+            import PyPDF2 as pypdf  # 예전 이름 (pdf_to_text.py)
+        self.version = f"pypdf-{pypdf.__version__}"
+        self.reader = pypdf.PdfReader(io.BytesIO(data))
+        self.page_count = len(self.reader.pages)
+
+    def page_text(self, i: int) -> str:
+        return self.reader.pages[i].extract_text() or ""
+
+    def close(self):
+        pass
+
+
+class _PdfPlumber:
+    name = "pdfplumber"
+
+    def __init__(self, data: bytes):
+        import pdfplumber
+        self.version = f"pdfplumber-{pdfplumber.__version__}"
+        self.pdf = pdfplumber.open(io.BytesIO(data))
+        self.page_count = len(self.pdf.pages)
+
+    def page_text(self, i: int) -> str:
+        page = self.pdf.pages[i]
+        text = page.extract_text() or ""
+        page.flush_cache()  # 페이지 객체 캐시가 커지지 않도록
+        return text
+
+    def close(self):
+        self.pdf.close()
+
+
+class _Tesseract:
+    name = "ocr"
+
+    def __init__(self, data: bytes):
+        import pytesseract
+        from pdf2image import convert_from_bytes
+        self.version = f"tesseract-{pytesseract.get_tesseract_version()}-{OCR_LANG}-{OCR_DPI}"
+        self.data = data
+        self.convert = convert_from_bytes
+        self.ocr = pytesseract.image_to_string
+        self.page_count = None
+
+    def page_text(self, i: int) -> str:
+        images = self.convert(self.data, dpi=OCR_DPI, first_page=i + 1, last_page=i + 1)
+        return "\n".join(self.ocr(img, lang=OCR_LANG) for img in images)
+
+    def close(self):
+        pass
+
+
+EXTRACTORS = [_PyMuPDF, _PyPDF, _PdfPlumber, _Tesseract]
+
+_stats_lock = threading.Lock()
+_stats = {}
+
+
+def _record(name: str, seconds: float, accepted: bool, reason: str = None):
+    with _stats_lock:
+        entry = _stats.setdefault(name, {"attempts": 0, "accepted": 0, "seconds": 0.0, "rejected": {}})
+        entry["attempts"] += 1
+        entry["seconds"] += seconds
+        if accepted:
+            entry["accepted"] += 1
+        elif reason:
+            entry["rejected"][reason] = entry["rejected"].get(reason, 0) + 1
+
+
+def get_stats() -> dict:
+    """추출기별 {attempts, accepted, seconds, avg_ms, rejected: {사유: 횟수}} (프로세스 누적) + 캐시 통계"""
+    with _stats_lock:
+        stats = {
+            name: {**entry, "rejected": dict(entry["rejected"]), "seconds": round(entry["seconds"], 4),
+                   "avg_ms": round(entry["seconds"] / entry["attempts"] * 1000, 3) if entry["attempts"] else 0.0}
+            for name, entry in _stats.items()
+        }
+    cache = get_cache()
+    if cache is not None:
+        stats["cache"] = cache.stats()
+    return stats
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+# ------------------------ 문서 추출 ------------------------
+def _read_source(source) -> bytes:
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    if hasattr(source, "read"):
+        return source.read()
+    with open(source, "rb") as f:
+        return f.read()
+
+
+class _Opened:
+    """문서 하나에 대해 추출기를 필요할 때 한 번만 열어 둠"""
+
+    def __init__(self, data: bytes, extractors):
+        self.data = data
+        self.classes = extractors
+        self.handles = {}
+
+    def get(self, cls):
+        if cls not in self.handles:
+            try:
+                self.handles[cls] = cls(self.data)
+            except Exception:  # 미설치 / 이 문서를 못 여는 추출기
+                self.handles[cls] = None
+        return self.handles[cls]
+
+    def page_count(self) -> int:
+        for cls in self.classes:
+            handle = self.get(cls)
+            if handle is not None and handle.page_count is not None:
+                return handle.page_count
+        raise RuntimeError("PDF를 열 수 있는 추출기가 없습니다. (PyMuPDF / pypdf / pdfplumber 중 하나 필요)")
+
+    def close(self):
+        for handle in self.handles.values():
+            if handle is not None:
+                handle.close()
+
+
+def extract_page(opened: _Opened, i: int) -> dict:
+    """페이지 하나를 빠른 추출기부터 시도, 품질 통과한 첫 결과 (모두 실패하면 가장 긴 결과)"""
+    best = {"page": i, "text": "", "extractor": None}
+    for cls in opened.classes:
+        handle = opened.get(cls)
+        if handle is None:
+            continue
+        start = time.perf_counter()
+        try:
+            text = handle.page_text(i)
+        except Exception:
+            _record(cls.name, time.perf_counter() - start, False, "error")
+            continue
+        ok, reason = check_quality(text)
+        _record(cls.name, time.perf_counter() - start, ok, reason)
+        if ok:
+            return {"page": i, "text": text, "extractor": cls.name}
+        if len(text.strip()) > len(best["text"].strip()):
+            best = {"page": i, "text": text, "extractor": cls.name}
+    return best
+
+
+_PACKAGES = {"pymupdf": ("pymupdf", "PyMuPDF"), "pypdf": ("pypdf", "PyPDF2"), "pdfplumber": ("pdfplumber",),
+             "ocr": ("pytesseract", "pdf2image")}
+
+
+def _package_version(names) -> str:
+    versions = []
+    for name in names:
+        try:
+            versions.append(f"{name}={metadata.version(name)}")
+        except metadata.PackageNotFoundError:
+            pass
+    return ",".join(versions) or "-"
+
+
+def extractor_version(extractors=None) -> str:
+    """캐시 키용 추출기 버전: 추출기 순서 + 설치된 패키지 버전 + 품질 기준 (하나라도 바뀌면 다시 추출)"""
+    parts = [f"{cls.name}:{_package_version(_PACKAGES.get(cls.name, ()))}" for cls in extractors or EXTRACTORS]
+    parts.append(f"q={MIN_CHARS},{MAX_BAD_GLYPH_RATIO},{MIN_HANGUL_RATIO},{MAX_JAMO_RATIO},{OCR_LANG},{OCR_DPI}")
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def extract_pages(source, extractors=None, on_page=None, use_cache: bool = True) -> list:
+    """PDF (경로 / bytes / 파일 객체) → 페이지별 [{"page", "text", "extractor"}]
+    on_page(완료 페이지 수, 전체 페이지 수, 결과) 콜백으로 진행률 표시 가능"""
+    data = _read_source(source)
+    extractors = extractors or EXTRACTORS
+    cache = get_cache() if use_cache else None
+    cached = {}
+    if cache is not None:
+        doc_hash = hashlib.sha256(data).hexdigest()
+        version = extractor_version(extractors)
+        cached = cache.get_pages(doc_hash, version)
+        total = cache.page_count(doc_hash, version)
+        if total is not None and len(cached) == total:
+            # ✅ 전체 페이지 캐시 적중: PDF를 열지 않음
+            cache.hits += total
+            pages = [cached[i] for i in range(total)]
+            if on_page:
+                for i, page in enumerate(pages):
+                    on_page(i + 1, total, page)
+            return pages
+
+    opened = _Opened(data, extractors)
+    pages, extracted = [], []
+    try:
+        total = opened.page_count()
+        for i in range(total):
+            page = cached.get(i)
+            if page is None:
+                page = extract_page(opened, i)
+                extracted.append(page)
+            pages.append(page)
+            if on_page:
+                on_page(i + 1, total, page)
+        return pages
+    finally:
+        opened.close()
+        # 중간에 실패해도 이미 추출한 페이지(특히 OCR)는 저장 → 다음 실행에서 이어서 사용
+        if cache is not None and extracted:
+            cache.hits += len(pages) - len(extracted)
+            cache.misses += len(extracted)
+            cache.put_pages(doc_hash, version, total, extracted)
+
+
+def extract_text(source, separator: str = "\n", **kwargs) -> str:
+    return separator.join(page["text"] for page in extract_pages(source, **kwargs))
+
+
+def summarize(pages: list) -> dict:
+    """문서 하나의 추출 결과 요약: 추출기별 채택 페이지 수"""
+    used = {}
+    for page in pages:
+        used[page["extractor"] or "none"] = used.get(page["extractor"] or "none", 0) + 1
+    return {"pages": len(pages), "extractors": used}
+
+
+if __name__ == "__main__":
+    import json
+    if "--clear-cache" in sys.argv:
+        get_cache().clear()
+    for path in [arg for arg in sys.argv[1:] if not arg.startswith("--")]:
+        start = time.perf_counter()
+        result = extract_pages(path)
+        print(f"{path}: {summarize(result)} {time.perf_counter() - start:.2f}s")
+    print(json.dumps(get_stats(), ensure_ascii=False, indent=2))
@@ -0,0 +1,67 @@
+import os
+import json
+import httpx
+
+# ✅ RAG HTTP 서비스(common/rag_server.py)의 얇은 클라이언트
+#   Streamlit 앱에서 RAG_API_URL 을 지정하면 검색/답변/임베딩을 서버에 맡김
+#   (httpx는 openai/anthropic SDK 의존성이라 별도 설치 불필요)
+
+RAG_API_URL = os.getenv("RAG_API_URL", "").rstrip("/")
+TIMEOUT = float(os.getenv("RAG_API_TIMEOUT", "180"))
+
+_client = None
+
+
+class RagApiError(Exception):
+    pass
+
+
+def _http():
+    global _client
+    if _client is None:
+        _client = httpx.Client(base_url=RAG_API_URL, timeout=TIMEOUT)
+    return _client
+
+
+def _check(response):
+    if response.status_code == 429:
+        raise RagApiError("서버가 혼잡합니다. 잠시 후 다시 시도해 주세요.")
+    if response.status_code >= 400:
+        try:
+            detail = response.json().get("detail")
+        except ValueError:
+            detail = response.text
+        raise RagApiError(f"RAG 서버 오류 ({response.status_code}): {detail}")
+    return response.json()
+
+
+def list_collections() -> list:
+    return _check(_http().get("/collections"))
+
+
+def ingest(pdf_path: str, filename: str) -> dict:
+    """→ {"collection": 이름, "created": 새로 임베딩했는지}"""
+    with open(pdf_path, "rb") as f:
+        return _check(_http().post("/ingest", params={"filename": filename}, content=f.read(),
+                                   headers={"Content-Type": "application/pdf"}))
+
+
+def ask(question: str, collection: str = None, session_id: str = None, top_k: int = 5) -> dict:
+    """retriever의 ask_* 와 같은 형식 (source_documents는 {"id","source","page","content"} dict)"""
+    body = {"question": question, "collection": collection, "session_id": session_id, "top_k": top_k}
+    return _check(_http().post("/ask", json=body))
+
+
+def ask_stream(question: str, collection: str = None, session_id: str = None, top_k: int = 5):
+    """SSE 이벤트를 {"type": ..., ...} dict로 하나씩 반환"""
+    body = {"question": question, "collection": collection, "session_id": session_id, "top_k": top_k}
+    with _http().stream("POST", "/ask/stream", json=body) as response:
+        if response.status_code >= 400:
+            response.read()
+            _check(response)
+        event = None
+        for line in response.iter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                yield {"type": event, **json.loads(line[len("data: "):])}
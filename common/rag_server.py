@@ -0,0 +1,286 @@
+import os
+import sys
+import json
+import asyncio
+import hashlib
+import tempfile
+import importlib
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)  # ✅ 공용 모듈(common) 경로
+from common.catalog import get_catalog
+from common.tracing import start_metrics_server
+from common.usage import usage_context
+from common.conversation_log import get_log, chunk_ref
+
+# ✅ Streamlit과 분리된 질의응답 HTTP 서비스 (ASGI / FastAPI)
+#   - GET  /collections     : 준비 완료된 매뉴얼 목록
+#   - POST /ingest          : PDF 업로드(본문 = PDF 바이트, ?filename=) → 컬렉션 생성
+#   - POST /ask             : 질문 (collection 없으면 전체 매뉴얼 검색)
+#   - POST /ask/stream      : 질문 → SSE (sources → token... → done)
+#   - 검색/답변은 기존 retriever_claude / retriever 함수를 그대로 사용 (프로세스당 모델/DB 핸들 유지)
+#   - 블로킹 작업은 스레드 풀(RAG_MAX_CONCURRENCY)에서 실행, 대기열(RAG_MAX_QUEUE)이 차면 429
+#     (504로 응답해도 스레드 작업이 실제로 끝날 때까지 자리를 차지한 것으로 셈)
+#   - 기본은 로컬에서만 접속 가능 (다른 호스트에 열려면 RAG_SERVER_HOST=0.0.0.0)
+#
+# 실행 예)
+#   RAG_BACKEND=claude RAG_SERVER_WORKERS=2 python common/rag_server.py
+#   RAG_API_URL=http://127.0.0.1:8800 streamlit run app.py   # Streamlit을 얇은 클라이언트로 사용
+
+RAG_BACKEND = os.getenv("RAG_BACKEND", "claude")
+HOST = os.getenv("RAG_SERVER_HOST", "127.0.0.1")
+PORT = int(os.getenv("RAG_SERVER_PORT", "8800"))
+WORKERS = int(os.getenv("RAG_SERVER_WORKERS", "1"))
+REQUEST_TIMEOUT = float(os.getenv("RAG_REQUEST_TIMEOUT", "120"))
+INGEST_TIMEOUT = float(os.getenv("RAG_INGEST_TIMEOUT", "900"))
+MAX_CONCURRENCY = int(os.getenv("RAG_MAX_CONCURRENCY", "8"))
+MAX_QUEUE = int(os.getenv("RAG_MAX_QUEUE", "32"))
+
+# 백엔드별 앱 디렉토리와 함수 이름 (./vectorstore 는 앱 디렉토리 기준)
+BACKENDS = {
+    "claude": {
+        "dir": "claude_RAG", "module": "retriever_claude", "ingest": "ingest_pdf",
+        "ask_one": "ask_with_context_claude", "ask_all": "ask_across_collections_claude",
+        "stream": "stream_answer_claude", "conversational": True,
+    },
+    "openai": {
+        "dir": "openAI_RAG", "module": "retriever", "ingest": "ingest_pdf",
+        "ask_one": "ask_with_context", "ask_all": "ask_across_collections",
+        "stream": "stream_answer",
+    },
+}
+
+
+def _load_backend(name: str) -> dict:
+    spec = BACKENDS[name]
+    app_dir = os.path.join(ROOT, spec["dir"])
+    # Streamlit 앱과 같은 ./vectorstore 를 쓰도록 앱 디렉토리에서 실행
+    os.chdir(app_dir)
+    sys.path.insert(0, app_dir)
+    module = importlib.import_module(spec["module"])
+    utils = importlib.import_module("utils")
+    functions = {key: getattr(module, spec[key]) for key in ("ingest", "ask_one", "ask_all", "stream")}
+    functions["make_collection_name"] = utils.make_collection_name
+    functions["conversational"] = spec.get("conversational", False)
+    return functions
+
+
+backend = _load_backend(RAG_BACKEND)
+_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENCY, thread_name_prefix="rag")
+_inflight = 0  # 실행 중 + 대기 중 요청 수 (워커 프로세스별, 이벤트 루프 1개라 락 불필요)
+
+app = FastAPI(title="차량 매뉴얼 RAG 서비스")
+
+
+class AskRequest(BaseModel):
+    question: str
+    collection: Optional[str] = None
+    session_id: Optional[str] = None
+    top_k: int = 5
+
+
+# ------------------------ 백프레셔 / 실행 ------------------------
+def _admit():
+    global _inflight
+    if _inflight >= MAX_CONCURRENCY + MAX_QUEUE:
+        raise HTTPException(status_code=429, detail="요청이 많습니다. 잠시 후 다시 시도해 주세요.",
+                            headers={"Retry-After": "1"})
+    _inflight += 1
+
+
+def _release():
+    global _inflight
+    _inflight -= 1
+
+
+def _submit(loop, func, *args, cleanup=None):
+    """_admit()으로 받은 자리는 스레드 작업이 실제로 끝날 때 반납 (타임아웃/연결 끊김으로 먼저 응답해도)"""
+    def done(_):
+        try:
+            if cleanup:
+                cleanup()
+        finally:
+            try:
+                loop.call_soon_threadsafe(_release)
+            except RuntimeError:
+                pass  # 서버 종료 중 (루프가 닫힘)
+
+    # 스레드에서도 같은 trace_id/usage 라벨이 이어지도록 컨텍스트 복사
+    future = _executor.submit(contextvars.copy_context().run, func, *args)
+    future.add_done_callback(done)
+    return future
+
+
+async def _run(func, *args, timeout=REQUEST_TIMEOUT, cleanup=None):
+    loop = asyncio.get_running_loop()
+    future = _submit(loop, func, *args, cleanup=cleanup)
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout=timeout)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail=f"{timeout:.0f}초 안에 처리하지 못했습니다.")
+
+
+def _document_json(doc) -> dict:
+    return {**chunk_ref(doc), "content": doc.page_content}
+
+
+def _check_collection(collection):
+    if collection and not get_catalog().exists(collection):
+        raise HTTPException(status_code=404, detail=f"등록되지 않은 매뉴얼: {collection}")
+
+
+# ------------------------ 엔드포인트 ------------------------
+@app.on_event("startup")
+def _startup():
+    start_metrics_server()
+
+
+@app.get("/health")
+def health():
+    return {"status": "ok", "backend": RAG_BACKEND, "inflight": _inflight,
+            "capacity": MAX_CONCURRENCY + MAX_QUEUE}
+
+
+@app.get("/collections")
+def collections():
+    return get_catalog().list_ready()
+
+
+def _remove_file(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+@app.post("/ingest")
+async def ingest(request: Request, filename: str):
+    _admit()
+    submitted = False  # 제출한 뒤에는 자리 반납/임시 파일 삭제를 작업 종료 콜백이 맡음
+    try:
+        data = await request.body()
+        if not data.startswith(b"%PDF"):
+            raise HTTPException(status_code=400, detail="PDF 파일이 아닙니다.")
+        content_hash = hashlib.sha256(data).hexdigest()
+        collection_name = backend["make_collection_name"](filename, content_hash)
+        if get_catalog().exists(collection_name):
+            return {"collection": collection_name, "created": False}
+
+        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+            f.write(data)
+        display_name = os.path.splitext(filename)[0]
+        submitted = True
+        # 504로 먼저 응답해도 수집은 계속 돌 수 있으므로 임시 PDF는 수집이 끝난 뒤에 삭제
+        dedup_stats = await _run(backend["ingest"], f.name, collection_name, display_name, content_hash,
+                                 timeout=INGEST_TIMEOUT, cleanup=lambda: _remove_file(f.name))
+        return {"collection": collection_name, "created": True, "dedup": dedup_stats}
+    finally:
+        if not submitted:
+            _release()
+
+
+def _conversation_kwargs(body: AskRequest) -> dict:
+    # 대화형 검색을 지원하는 백엔드(claude)만 세션 id 전달
+    return {"session_id": body.session_id} if backend["conversational"] and body.session_id else {}
+
+
+def _ask_sync(body: AskRequest) -> dict:
+    with usage_context(session_id=body.session_id):
+        if body.collection:
+            result = backend["ask_one"](body.question, body.collection, body.top_k, **_conversation_kwargs(body))
+        else:
+            result = backend["ask_all"](body.question, top_k=body.top_k, **_conversation_kwargs(body))
+    get_log().log_turn(
+        body.session_id, body.question, result["result"],
+        collection=body.collection or "*",
+        chunks=[chunk_ref(doc) for doc in result["source_documents"]],
+        timings=result.get("timings"), via="api"
+    )
+    return {
+        "result": result["result"],
+        "source_documents": [_document_json(doc) for doc in result["source_documents"]],
+        "context_tokens": result.get("context_tokens"),
+        "timings": result.get("timings"),
+    }
+
+
+@app.post("/ask")
+async def ask(body: AskRequest):
+    _check_collection(body.collection)
+    _admit()
+    return await _run(_ask_sync, body)
+
+
+# ------------------------ 스트리밍 ------------------------
+def _sse(event: str, data) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n".encode("utf-8")
+
+
+def _produce(body: AskRequest, loop, queue: asyncio.Queue, stop: threading.Event):
+    """워커 스레드: 제너레이터 이벤트를 이벤트 루프 큐로 전달. stop이 켜지면 close()로 LLM 스트림 중단"""
+    try:
+        with usage_context(session_id=body.session_id):
+            events = backend["stream"](body.question, body.collection, top_k=body.top_k,
+                                       **_conversation_kwargs(body))
+            for event in events:
+                if stop.is_set():
+                    break
+                if event["type"] == "sources":
+                    sources = event["documents"]
+                    event = {"type": "sources", "documents": [_document_json(d) for d in sources],
+                             "context_tokens": event["context_tokens"]}
+                elif event["type"] == "done":
+                    get_log().log_turn(
+                        body.session_id, body.question, event["result"],
+                        collection=body.collection or "*",
+                        chunks=[chunk_ref(doc) for doc in sources],
+                        timings=event["timings"], via="api-stream"
+                    )
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+            events.close()
+    except Exception as e:
+        loop.call_soon_threadsafe(queue.put_nowait, {"type": "error", "detail": str(e)})
+    finally:
+        loop.call_soon_threadsafe(queue.put_nowait, None)
+
+
+@app.post("/ask/stream")
+async def ask_stream(body: AskRequest):
+    _check_collection(body.collection)
+    _admit()
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    stop = threading.Event()
+    _submit(loop, _produce, body, loop, queue, stop)
+
+    async def event_stream():
+        deadline = loop.time() + REQUEST_TIMEOUT
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=max(0.0, deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    yield _sse("error", {"detail": f"{REQUEST_TIMEOUT:.0f}초 안에 처리하지 못했습니다."})
+                    break
+                if event is None:
+                    break
+                yield _sse(event.pop("type"), event)
+        finally:
+            # 클라이언트 연결 종료/타임아웃 시 워커 스레드에 중단 신호 (자리는 스레드가 끝날 때 반납)
+            stop.set()
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
+if __name__ == "__main__":
+    import uvicorn
+    # 워커 프로세스마다 모델/DB 핸들을 따로 올림 (RAG_SERVER_WORKERS)
+    uvicorn.run("common.rag_server:app", host=HOST, port=PORT, workers=WORKERS, app_dir=ROOT)
@@ -0,0 +1,86 @@
+import os
+import time
+import logging
+import hashlib
+import threading
+from collections import OrderedDict
+
+# ✅ 선택적 재정렬(rerank) 단계
+#   바이인코더로 넉넉히(RERANK_CANDIDATES개) 가져온 후보를
+#   작은 CPU 크로스인코더로 고정 크기 배치(RERANK_BATCH_SIZE) 채점하고 상위 몇 개만 LLM에 전달
+#   (질문, 청크) 쌍 점수는 LRU 캐시에 보관해서 반복 질문은 모델을 다시 돌리지 않음
+
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "0") == "1"
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "50"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "32"))  # 크로스인코더 forward 한 번에 넣는 쌍 수
+CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "20000"))
+
+logger = logging.getLogger(__name__)
+
+_model = None
+_model_lock = threading.Lock()
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def get_model():
+    global _model
+    with _model_lock:
+        if _model is None:
+            from sentence_transformers import CrossEncoder
+            _model = CrossEncoder(RERANK_MODEL, device="cpu", max_length=512)
+        return _model
+
+
+def _pair_key(question: str, text: str) -> str:
+    return hashlib.sha1(f"{question}\0{text}".encode("utf-8")).hexdigest()
+
+
+def score_pairs(question: str, texts: list) -> list:
+    """(질문, 청크) 쌍 점수. 캐시에 없는 쌍만 RERANK_BATCH_SIZE 단위 배치로 계산."""
+    keys = [_pair_key(question, t) for t in texts]
+    scores = [None] * len(texts)
+    missing = []
+    with _cache_lock:
+        for i, key in enumerate(keys):
+            if key in _cache:
+                _cache.move_to_end(key)
+                scores[i] = _cache[key]
+            else:
+                missing.append(i)
+
+    if missing:
+        model = get_model()
+        pairs = [(question, texts[i]) for i in missing]
+        predicted = model.predict(pairs, batch_size=min(RERANK_BATCH_SIZE, len(pairs)), show_progress_bar=False)
+        with _cache_lock:
+            for i, score in zip(missing, predicted):
+                scores[i] = float(score)
+                _cache[keys[i]] = scores[i]
+            while len(_cache) > CACHE_SIZE:
+                _cache.popitem(last=False)
+    return scores
+
+
+def rerank(question: str, items: list, top_k: int, text_of=lambda item: item) -> tuple:
+    """items를 크로스인코더 점수 순으로 정렬해 상위 top_k개 반환.
+
+    반환값: (상위 items, 소요 시간(초))
+    """
+    start = time.perf_counter()
+    if len(items) <= 1:
+        return items[:top_k], 0.0
+    scores = score_pairs(question, [text_of(item) for item in items])
+    order = sorted(range(len(items)), key=lambda i: scores[i], reverse=True)
+    elapsed = time.perf_counter() - start
+    logger.info("rerank: %d candidates → top %d in %.1f ms", len(items), top_k, elapsed * 1000)
+    return [items[i] for i in order[:top_k]], elapsed
+
+
+def candidate_count(top_k: int, collections: int = 1) -> int:
+    # 재정렬을 켠 경우에만 후보를 넉넉히 가져옴
+    # 여러 컬렉션을 검색하면 컬렉션마다 나눠 가져와서 전체 후보가 RERANK_CANDIDATES 근처로 유지되게 함
+    if not RERANK_ENABLED:
+        return top_k
+    return max(top_k, RERANK_CANDIDATES // max(collections, 1))
@@ -0,0 +1,155 @@
+import os
+import argparse
+import threading
+import numpy as np
+
+# ✅ 컬렉션 라우팅 인덱스 (전체 매뉴얼 검색 시 관련 매뉴얼만 골라서 검색)
+#   - 임베딩 시 청크 임베딩을 k-means로 묶어 컬렉션마다 중심 벡터 몇 개를 저장 (<컬렉션>/_centroids.npy)
+#   - 질문 임베딩 1개와 전체 중심 벡터 행렬을 한 번의 행렬곱으로 비교 → 컬렉션별 최고 점수
+#   - 상위 N개 컬렉션만 검색, 1등 점수가 낮거나 탈락 컬렉션과 차이가 작으면 전체 검색으로 대체
+#   - 중심 벡터가 없는 (예전) 컬렉션은 항상 검색 대상에 포함
+#
+# 기존 컬렉션 중심 벡터 생성)
+#   python common/router.py --root claude_RAG/vectorstore
+
+ROUTER_ENABLED = os.getenv("ROUTER_ENABLED", "1") == "1"
+CENTROIDS_PER_COLLECTION = int(os.getenv("ROUTER_CENTROIDS", "8"))
+TOP_N = int(os.getenv("ROUTER_TOP_N", "3"))
+# 1등 컬렉션 점수(코사인)가 이보다 낮으면 전체 검색
+MIN_SCORE = float(os.getenv("ROUTER_MIN_SCORE", "0.2"))
+# 1등과 탈락한 N+1번째의 점수 차가 이보다 작으면 (구분이 안 되면) 전체 검색
+MIN_MARGIN = float(os.getenv("ROUTER_MIN_MARGIN", "0.01"))
+CENTROID_FILE = "_centroids.npy"
+
+_lock = threading.Lock()
+_index = {}  # root → {"names", "matrix", "starts", "routable", "unrouted"}
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def kmeans(vectors, k: int = CENTROIDS_PER_COLLECTION, iterations: int = 20, seed: int = 0) -> np.ndarray:
+    """정규화된 벡터에 대한 구면 k-means (k-means++ 초기화) → (k, dim) 중심 벡터"""
+    data = _normalize(np.asarray(vectors, dtype=np.float32))
+    k = min(k, len(data))
+    rng = np.random.default_rng(seed)
+
+    centroids = [data[rng.integers(len(data))]]
+    for _ in range(1, k):
+        distance = 1.0 - np.max(data @ np.array(centroids).T, axis=1)
+        weights = np.clip(distance, 0, None)
+        if weights.sum() == 0:
+            break
+        centroids.append(data[rng.choice(len(data), p=weights / weights.sum())])
+    centroids = np.array(centroids)
+
+    for _ in range(iterations):
+        assignment = np.argmax(data @ centroids.T, axis=1)
+        updated = np.array([
+            data[assignment == i].mean(axis=0) if np.any(assignment == i) else centroids[i]
+            for i in range(len(centroids))
+        ])
+        updated = _normalize(updated)
+        if np.allclose(updated, centroids, atol=1e-5):
+            break
+        centroids = updated
+    return centroids.astype(np.float32)
+
+
+def build_centroids(collection_path: str, embeddings) -> np.ndarray:
+    """임베딩 직후 호출: 청크 임베딩 → 중심 벡터 저장"""
+    if embeddings is None or len(embeddings) == 0:
+        return None
+    centroids = kmeans(embeddings)
+    np.save(os.path.join(collection_path, CENTROID_FILE), centroids)
+    invalidate()
+    return centroids
+
+
+def invalidate(root: str = None):
+    with _lock:
+        if root is None:
+            _index.clear()
+        else:
+            _index.pop(os.path.abspath(root), None)
+
+
+def _load_index(root: str, names: list) -> dict:
+    key = os.path.abspath(root)
+    with _lock:
+        cached = _index.get(key)
+        if cached is not None and cached["names"] == tuple(names):
+            return cached
+
+    blocks, routable, unrouted = [], [], []
+    for name in names:
+        path = os.path.join(root, name, CENTROID_FILE)
+        if os.path.exists(path):
+            blocks.append(np.load(path))
+            routable.append(name)
+        else:
+            unrouted.append(name)
+
+    if blocks:
+        matrix = _normalize(np.concatenate(blocks).astype(np.float32))
+        starts = np.cumsum([0] + [len(b) for b in blocks[:-1]])
+    else:
+        matrix, starts = None, None
+    index = {"names": tuple(names), "matrix": matrix, "starts": starts,
+             "routable": routable, "unrouted": unrouted}
+    with _lock:
+        _index[key] = index
+    return index
+
+
+def route(query_vector, names: list, root: str = "./vectorstore", top_n: int = TOP_N) -> tuple:
+    """질문 임베딩 → (검색할 컬렉션 목록, 라우팅 정보 dict)"""
+    index = _load_index(root, names)
+    if index["matrix"] is None or len(index["routable"]) <= top_n:
+        return list(names), {"routed": False, "reason": "too_few"}
+
+    query = _normalize(np.asarray(query_vector, dtype=np.float32))
+    # 전체 중심 벡터와 한 번에 비교한 뒤 컬렉션별 최댓값
+    scores = np.maximum.reduceat(index["matrix"] @ query, index["starts"])
+    order = np.argsort(-scores)
+    best, runner_up = scores[order[0]], scores[order[top_n]]
+    if best < MIN_SCORE or best - runner_up < MIN_MARGIN:
+        return list(names), {"routed": False, "reason": "low_confidence", "best": round(float(best), 4)}
+
+    selected = [index["routable"][i] for i in order[:top_n]]
+    return selected + index["unrouted"], {
+        "routed": True, "best": round(float(best), 4), "selected": len(selected) + len(index["unrouted"]),
+        "total": len(names)
+    }
+
+
+# ------------------------ 기존 컬렉션 중심 벡터 생성 ------------------------
+def backfill(root: str, force: bool = False) -> list:
+    import chromadb
+    built = []
+    for name in sorted(os.listdir(root)):
+        path = os.path.join(root, name)
+        if name.startswith("_") or not os.path.exists(os.path.join(path, "chroma.sqlite3")):
+            continue
+        if os.path.exists(os.path.join(path, CENTROID_FILE)) and not force:
+            continue
+        client = chromadb.PersistentClient(path=path)
+        try:
+            collection = client.get_collection(name)
+        except Exception:
+            continue
+        embeddings = collection.get(include=["embeddings"])["embeddings"]
+        if build_centroids(path, embeddings) is not None:
+            built.append(name)
+            print(f"✅ {name}: 청크 {len(embeddings)}개 → 중심 벡터 저장")
+    return built
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="컬렉션 라우팅용 중심 벡터 생성")
+    parser.add_argument("--root", default="./vectorstore")
+    parser.add_argument("--force", action="store_true", help="이미 있는 중심 벡터도 다시 계산")
+    args = parser.parse_args()
+    backfill(args.root, args.force)
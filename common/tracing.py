@@ -0,0 +1,225 @@
+import os
+import json
+import time
+import uuid
+import bisect
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# ✅ 가벼운 단계별 트레이싱
+#   with span("retrieve", collection=name) as sp: ...
+#   - 같은 요청 안의 스팬은 trace_id로 묶임 (contextvars 기반, 스레드/async 모두 지원)
+#   - 끝난 스팬은 메모리 링버퍼 + (TRACE_EXPORT_PATH 지정 시) JSONL 파일로 내보냄
+#   - 스팬 이름별 지연시간 히스토그램을 Prometheus 텍스트 형식으로 노출 (/metrics)
+
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH")
+RECENT_SPANS = int(os.getenv("TRACE_RECENT_SPANS", "2000"))
+# 히스토그램 버킷 (초)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_current = contextvars.ContextVar("current_span", default=None)
+_lock = threading.Lock()
+_recent = deque(maxlen=RECENT_SPANS)
+_histograms = {}
+_export_file = None
+_metrics_server = None
+
+
+class Span:
+    def __init__(self, name, trace_id, parent_id, attrs):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attrs = attrs
+        self.start = time.time()
+        self.duration = 0.0
+        self.error = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": round(self.duration * 1000, 3),
+            "attrs": self.attrs,
+            "error": self.error,
+        }
+
+
+@contextmanager
+def span(name: str, **attrs):
+    parent = _current.get()
+    sp = Span(
+        name,
+        parent.trace_id if parent else uuid.uuid4().hex,
+        parent.span_id if parent else None,
+        attrs
+    )
+    token = _current.set(sp)
+    start = time.perf_counter()
+    try:
+        yield sp
+    except BaseException as e:
+        sp.error = type(e).__name__
+        raise
+    finally:
+        sp.duration = time.perf_counter() - start
+        _current.reset(token)
+        _finish(sp)
+
+
+def open_span(name: str, **attrs) -> Span:
+    """현재 스팬의 자식 스팬을 만들되 contextvar에는 넣지 않음 (yield를 넘나드는 async 제너레이터용)
+    끝낼 때 close_span()을 호출해야 기록됨"""
+    parent = _current.get()
+    sp = Span(
+        name,
+        parent.trace_id if parent else uuid.uuid4().hex,
+        parent.span_id if parent else None,
+        attrs
+    )
+    sp._perf_start = time.perf_counter()
+    return sp
+
+
+def close_span(sp: Span, error: BaseException = None):
+    sp.duration = time.perf_counter() - sp._perf_start
+    if error is not None:
+        sp.error = type(error).__name__
+    _finish(sp)
+
+
+def traced(name: str = None):
+    """함수 전체를 하나의 스팬으로 감싸는 데코레이터"""
+    def decorator(func):
+        span_name = name or func.__name__
+
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        wrapper.__name__ = func.__name__
+        wrapper.__doc__ = func.__doc__
+        return wrapper
+    return decorator
+
+
+def current_trace_id():
+    sp = _current.get()
+    return sp.trace_id if sp else None
+
+
+# ------------------------ 내보내기 / 집계 ------------------------
+def _finish(sp: Span):
+    global _export_file
+    record = sp.to_dict()
+    with _lock:
+        _recent.append(record)
+        hist = _histograms.setdefault(sp.name, {"buckets": [0] * len(BUCKETS), "count": 0, "sum": 0.0, "errors": 0})
+        index = bisect.bisect_left(BUCKETS, sp.duration)
+        if index < len(BUCKETS):
+            hist["buckets"][index] += 1
+        hist["count"] += 1
+        hist["sum"] += sp.duration
+        if sp.error:
+            hist["errors"] += 1
+
+        if TRACE_EXPORT_PATH:
+            if _export_file is None:
+                _export_file = open(TRACE_EXPORT_PATH, "a", encoding="utf-8")
+            _export_file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            _export_file.flush()
+
+
+def recent_spans(limit: int = 200) -> list:
+    with _lock:
+        return list(_recent)[-limit:]
+
+
+def recent_traces(limit: int = 20) -> list:
+    """최근 요청(trace)별로 스팬을 묶어서 반환 (최신순)"""
+    traces = {}
+    for record in recent_spans(RECENT_SPANS):
+        traces.setdefault(record["trace_id"], []).append(record)
+    ordered = sorted(traces.values(), key=lambda spans: min(s["start"] for s in spans), reverse=True)
+    return ordered[:limit]
+
+
+def histogram_summary() -> dict:
+    with _lock:
+        return {
+            name: {"count": h["count"], "mean_ms": round(h["sum"] / h["count"] * 1000, 2) if h["count"] else 0.0,
+                   "errors": h["errors"]}
+            for name, h in _histograms.items()
+        }
+
+
+def render_prometheus() -> str:
+    lines = [
+        "# HELP rag_stage_duration_seconds RAG pipeline stage latency",
+        "# TYPE rag_stage_duration_seconds histogram",
+    ]
+    with _lock:
+        for name, h in sorted(_histograms.items()):
+            cumulative = 0
+            for bound, count in zip(BUCKETS, h["buckets"]):
+                cumulative += count
+                lines.append(f'rag_stage_duration_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'rag_stage_duration_seconds_bucket{{stage="{name}",le="+Inf"}} {h["count"]}')
+            lines.append(f'rag_stage_duration_seconds_sum{{stage="{name}"}} {h["sum"]:.6f}')
+            lines.append(f'rag_stage_duration_seconds_count{{stage="{name}"}} {h["count"]}')
+        lines.append("# HELP rag_stage_errors_total RAG pipeline stage errors")
+        lines.append("# TYPE rag_stage_errors_total counter")
+        for name, h in sorted(_histograms.items()):
+            lines.append(f'rag_stage_errors_total{{stage="{name}"}} {h["errors"]}')
+    return "\n".join(lines) + "\n"
+
+
+# ------------------------ /metrics 엔드포인트 ------------------------
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.startswith("/metrics"):
+            body = render_prometheus().encode("utf-8")
+            content_type = "text/plain; version=0.0.4"
+        elif self.path.startswith("/traces"):
+            body = json.dumps(recent_traces(), ensure_ascii=False, default=str).encode("utf-8")
+            content_type = "application/json"
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_metrics_server(port: int = None, host: str = None):
+    """프로세스당 한 번만 /metrics 서버를 띄움 (METRICS_PORT 미지정 시 비활성)
+    기본은 로컬에서만 접속 가능, 외부 수집기가 가져가야 하면 METRICS_HOST=0.0.0.0"""
+    global _metrics_server
+    port = port or int(os.getenv("METRICS_PORT", "0"))
+    host = host or os.getenv("METRICS_HOST", "127.0.0.1")
+    if not port:
+        return None
+    with _lock:
+        if _metrics_server is None:
+            try:
+                _metrics_server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            except OSError:
+                # 다른 프로세스가 이미 포트를 사용 중
+                return None
+            threading.Thread(target=_metrics_server.serve_forever, daemon=True).start()
+    return _metrics_server
@@ -0,0 +1,209 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+import contextvars
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+
+# ✅ LLM 토큰 사용량 기록 + 세션별 예산
+#   - 모든 프로바이더 호출의 prompt/completion 토큰을 추가 전용(append-only) SQLite에 저장
+#   - 세션/컬렉션 정보는 usage_context()로 호출 구간에 붙임
+#   - 집계: 컬렉션별 / 세션별 / 일별
+#   - 예산: 소프트 한도 초과 시 저렴한 모델로 교체 (대체 모델이 없으면 max_tokens를 USAGE_SOFT_MAX_TOKENS로 제한),
+#           하드 한도 초과 시 max_tokens 제한
+
+USAGE_DB = os.getenv("USAGE_DB", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "usage.sqlite"))
+# 세션당 하루 토큰 한도 (0이면 비활성)
+SOFT_BUDGET = int(os.getenv("USAGE_SOFT_BUDGET", "0"))
+HARD_BUDGET = int(os.getenv("USAGE_HARD_BUDGET", "0"))
+HARD_MAX_TOKENS = int(os.getenv("USAGE_HARD_MAX_TOKENS", "256"))
+SOFT_MAX_TOKENS = int(os.getenv("USAGE_SOFT_MAX_TOKENS", "512"))  # 이미 가장 싼 모델일 때 소프트 한도 조치 (0이면 경고만)
+SESSION_CACHE_SIZE = int(os.getenv("USAGE_SESSION_CACHE_SIZE", "10000"))  # 메모리에 들고 있는 세션 누적값 수
+# 소프트 한도 초과 시 대체 모델
+DOWNGRADE_MODELS = {
+    "claude-3-5-sonnet-20240620": "claude-3-haiku-20240307",
+    "claude-3-opus-20240229": "claude-3-haiku-20240307",
+    "gpt-4": "gpt-3.5-turbo",
+    "gpt-4o": "gpt-4o-mini",
+}
+
+logger = logging.getLogger(__name__)
+
+_context = contextvars.ContextVar("usage_context", default={})
+_lock = threading.Lock()
+_conn = None
+# (session_id, day) → 누적 토큰 (LRU, 오늘 것만 유지 — 빠진 세션은 다음 조회 때 DB에서 다시 합산)
+_session_totals = OrderedDict()
+_totals_day = None
+_soft_warned = set()  # 소프트 한도 경고를 이미 남긴 (session_id, day)
+
+
+@contextmanager
+def usage_context(**labels):
+    """with usage_context(session_id=..., collection=...): 구간 안의 LLM 호출에 라벨을 붙임"""
+    token = _context.set({**_context.get(), **{k: v for k, v in labels.items() if v is not None}})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+def current_labels() -> dict:
+    return dict(_context.get())
+
+
+def _db():
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(USAGE_DB, check_same_thread=False)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("""
+            CREATE TABLE IF NOT EXISTS usage (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                ts REAL NOT NULL,
+                day TEXT NOT NULL,
+                session_id TEXT,
+                collection TEXT,
+                provider TEXT NOT NULL,
+                model TEXT NOT NULL,
+                prompt_tokens INTEGER NOT NULL,
+                completion_tokens INTEGER NOT NULL,
+                latency_ms REAL
+            )
+        """)
+        _conn.execute("CREATE INDEX IF NOT EXISTS idx_usage_session_day ON usage(session_id, day)")
+        _conn.execute("CREATE INDEX IF NOT EXISTS idx_usage_collection ON usage(collection)")
+        _conn.execute("CREATE INDEX IF NOT EXISTS idx_usage_day ON usage(day)")
+    return _conn
+
+
+def _today() -> str:
+    return datetime.now().strftime("%Y-%m-%d")
+
+
+def _cache_total(key: tuple, total: int):
+    """_lock 안에서 호출: 세션 누적값 저장 + 지난 날짜/오래된 세션 정리"""
+    global _totals_day
+    if key[1] != _totals_day:
+        _totals_day = key[1]
+        for old in [k for k in _session_totals if k[1] != _totals_day]:
+            del _session_totals[old]
+        _soft_warned.clear()
+    _session_totals[key] = total
+    _session_totals.move_to_end(key)
+    while len(_session_totals) > SESSION_CACHE_SIZE:
+        _session_totals.popitem(last=False)
+
+
+def record_usage(result: dict):
+    """llm_client 응답 dict({"provider","model","usage","latency"})를 기록"""
+    labels = current_labels()
+    usage = result.get("usage") or {}
+    prompt = int(usage.get("prompt_tokens") or 0)
+    completion = int(usage.get("completion_tokens") or 0)
+    day = _today()
+    with _lock:
+        conn = _db()
+        with conn:
+            conn.execute(
+                "INSERT INTO usage (ts, day, session_id, collection, provider, model, prompt_tokens, completion_tokens, latency_ms) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (time.time(), day, labels.get("session_id"), labels.get("collection"), result["provider"],
+                 result["model"], prompt, completion, round(result.get("latency", 0.0) * 1000, 1))
+            )
+        session_id = labels.get("session_id")
+        key = (session_id, day)
+        if session_id and key in _session_totals:
+            # 캐시에 없으면 다음 session_tokens()가 방금 넣은 행까지 DB에서 합산
+            _cache_total(key, _session_totals[key] + prompt + completion)
+
+
+def session_tokens(session_id: str, day: str = None) -> int:
+    day = day or _today()
+    key = (session_id, day)
+    with _lock:
+        total = _session_totals.get(key)
+        if total is None:
+            row = _db().execute(
+                "SELECT COALESCE(SUM(prompt_tokens + completion_tokens), 0) FROM usage WHERE session_id = ? AND day = ?",
+                (session_id, day)
+            ).fetchone()
+            total = row[0]
+        if day == _today():  # 지난 날짜 조회는 캐시하지 않음
+            _cache_total(key, total)
+        return total
+
+
+def apply_budget(model: str, max_tokens: int) -> tuple:
+    """현재 세션의 사용량에 따라 (model, max_tokens)를 조정"""
+    session_id = current_labels().get("session_id")
+    if not session_id or not (SOFT_BUDGET or HARD_BUDGET):
+        return model, max_tokens
+
+    used = session_tokens(session_id)
+    if HARD_BUDGET and used >= HARD_BUDGET:
+        model = DOWNGRADE_MODELS.get(model, model)
+        max_tokens = min(max_tokens, HARD_MAX_TOKENS)
+    elif SOFT_BUDGET and used >= SOFT_BUDGET:
+        if model in DOWNGRADE_MODELS:
+            model = DOWNGRADE_MODELS[model]
+        elif SOFT_MAX_TOKENS:
+            # 이미 가장 싼 모델(대체 모델 없음) → 답변 길이로 사용량을 줄임
+            max_tokens = min(max_tokens, SOFT_MAX_TOKENS)
+        else:
+            key = (session_id, _today())
+            if key not in _soft_warned:
+                _soft_warned.add(key)
+                logger.warning("usage soft budget exceeded: session %s used %d tokens (model %s has no downgrade)",
+                               session_id, used, model)
+    return model, max_tokens
+
+
+# ------------------------ 집계 쿼리 ------------------------
+def _aggregate(group_by: str, since_day: str = None) -> list:
+    where = "WHERE day >= ?" if since_day else ""
+    params = (since_day,) if since_day else ()
+    with _lock:
+        rows = _db().execute(f"""
+            SELECT {group_by}, COUNT(*), SUM(prompt_tokens), SUM(completion_tokens), AVG(latency_ms)
+            FROM usage {where}
+            GROUP BY {group_by}
+            ORDER BY SUM(prompt_tokens + completion_tokens) DESC
+        """, params).fetchall()
+    return [
+        {group_by: key, "calls": calls, "prompt_tokens": prompt, "completion_tokens": completion,
+         "avg_latency_ms": round(latency or 0.0, 1)}
+        for key, calls, prompt, completion, latency in rows
+    ]
+
+
+def usage_by_collection(since_day: str = None) -> list:
+    return _aggregate("collection", since_day)
+
+
+def usage_by_session(since_day: str = None) -> list:
+    return _aggregate("session_id", since_day)
+
+
+def usage_by_day(since_day: str = None) -> list:
+    return _aggregate("day", since_day)
+
+
+def usage_by_model(since_day: str = None) -> list:
+    return _aggregate("model", since_day)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="LLM 토큰 사용량 집계")
+    parser.add_argument("--by", choices=["collection", "session", "day", "model"], default="day")
+    parser.add_argument("--since", help="YYYY-MM-DD 이후만 집계")
+    args = parser.parse_args()
+
+    query = {"collection": usage_by_collection, "session": usage_by_session,
+             "day": usage_by_day, "model": usage_by_model}[args.by]
+    for row in query(args.since):
+        print(row)
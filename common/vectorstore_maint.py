@@ -0,0 +1,378 @@
+import os
+import sys
+import json
+import time
+import shutil
+import struct
+import sqlite3
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # ✅ 공용 모듈(common) 경로
+from common.catalog import get_catalog, dir_size, STATUS_READY, STATUS_QUARANTINED
+from common import chroma_bulk
+
+# ✅ 벡터스토어 정비 도구 (오프라인 실행)
+#   - 컬렉션마다 chroma.sqlite3 ↔ HNSW 세그먼트 디렉토리 일관성, 임베딩 개수를 검사
+#   - 깨진 컬렉션은 <root>/_quarantine 으로 격리하고 카탈로그 상태를 quarantined로 변경
+#   - HNSW 세그먼트 재구성 (embeddings_queue 로그를 재생해 컬렉션을 다시 적재, 원소 수 확인 후 ready)
+#   - 고아 세그먼트 삭제 + WAL 체크포인트 + VACUUM 으로 공간 회수
+#   - 작업 전/후 크기와 로드 시간을 보고
+#   - 검사만 할 때(--fix/--compact/--rebuild-hnsw 없음)는 아무것도 쓰지 않음
+#     (sqlite는 mode=ro, 카탈로그/chromadb 클라이언트는 열지 않음 → 로드 시간은 sqlite 조회 기준)
+#
+# 사용 예)
+#   python common/vectorstore_maint.py --root claude_RAG/vectorstore              # 검사만
+#   python common/vectorstore_maint.py --root claude_RAG/vectorstore --fix --compact --out report.json
+
+SQLITE_FILE = "chroma.sqlite3"
+QUARANTINE_DIR = "_quarantine"
+HNSW_FILES = ("header.bin", "data_level0.bin", "length.bin", "link_lists.bin")
+VECTOR_SEGMENT_TYPE = "urn:chroma:segment/vector/hnsw-local-persisted"
+LFS_POINTER_PREFIX = b"version https://git-lfs"
+
+
+def _connect(path, readonly=True):
+    if readonly:
+        return sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    return sqlite3.connect(path)
+
+
+def read_hnsw_header(path: str) -> dict:
+    """hnswlib header.bin에서 원소 개수 등 읽기 (깨졌으면 None)
+
+    chroma-hnswlib(0.4/0.5)는 offset_level0(=0)부터 시작하고,
+    chromadb 1.x의 hnswlib는 앞에 int32 포맷 버전이 붙음"""
+    with open(path, "rb") as f:
+        data = f.read(100)
+    if data.startswith(LFS_POINTER_PREFIX) or len(data) < 96:
+        return None
+    offset_level0, max_elements, cur_count, size_per_element = struct.unpack_from("<QQQQ", data, 0)
+    if offset_level0 != 0 and len(data) >= 100:
+        _version, offset_level0, max_elements, cur_count, size_per_element = struct.unpack_from("<iQQQQ", data, 0)
+    if offset_level0 != 0 or cur_count > max_elements:
+        return None
+    return {"max_elements": max_elements, "count": cur_count, "size_per_element": size_per_element}
+
+
+def _check_segment(seg_dir: str, expected: int) -> list:
+    problems = []
+    for name in HNSW_FILES:
+        path = os.path.join(seg_dir, name)
+        if not os.path.exists(path):
+            problems.append(f"{name} 없음")
+            continue
+        with open(path, "rb") as f:
+            if f.read(len(LFS_POINTER_PREFIX)) == LFS_POINTER_PREFIX:
+                problems.append(f"{name}: git-lfs 포인터 파일 (실제 데이터 없음)")
+    if problems:
+        return problems
+
+    header = read_hnsw_header(os.path.join(seg_dir, "header.bin"))
+    if header is None:
+        return ["header.bin 손상"]
+    level0 = os.path.getsize(os.path.join(seg_dir, "data_level0.bin"))
+    if level0 < header["count"] * header["size_per_element"]:
+        problems.append("data_level0.bin 크기가 원소 수보다 작음")
+    if header["count"] != expected:
+        problems.append(f"HNSW 원소 수 {header['count']} ≠ sqlite 임베딩 수 {expected}")
+    return problems
+
+
+def check_collection(path: str) -> dict:
+    """컬렉션 디렉토리 하나 검사 → {"status": ok|warn|broken, "problems": [...], ...}"""
+    name = os.path.basename(path)
+    report = {"name": name, "status": "ok", "problems": [], "warnings": [], "embeddings": None, "queue": None,
+              "vector_segments": [], "orphan_segments": [], "rebuildable": False}
+    sqlite_path = os.path.join(path, SQLITE_FILE)
+    seg_dirs = sorted(d for d in os.listdir(path) if os.path.isdir(os.path.join(path, d)))
+
+    if not os.path.exists(sqlite_path):
+        report["problems"].append(f"{SQLITE_FILE} 없음 (세그먼트 {len(seg_dirs)}개만 존재)")
+        report["status"] = "broken"
+        return report
+
+    try:
+        conn = _connect(sqlite_path)
+        integrity = conn.execute("PRAGMA integrity_check").fetchone()[0]
+        if integrity != "ok":
+            report["problems"].append(f"sqlite 무결성 오류: {integrity}")
+        collections = conn.execute("SELECT id FROM collections").fetchall()
+        segments = conn.execute("SELECT id, type FROM segments").fetchall()
+        report["embeddings"] = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        report["queue"] = conn.execute("SELECT COUNT(*) FROM embeddings_queue").fetchone()[0]
+        conn.close()
+    except sqlite3.DatabaseError as e:
+        report["problems"].append(f"sqlite 열기 실패: {e}")
+        report["status"] = "broken"
+        return report
+
+    if not collections:
+        report["problems"].append("collections 테이블이 비어 있음")
+    if not segments:
+        report["problems"].append("segments 테이블이 비어 있음")
+
+    known = {seg_id for seg_id, _ in segments}
+    report["orphan_segments"] = [d for d in seg_dirs if d not in known]
+    for seg_id, seg_type in segments:
+        if seg_type != VECTOR_SEGMENT_TYPE:
+            continue
+        report["vector_segments"].append(seg_id)
+        seg_dir = os.path.join(path, seg_id)
+        if not os.path.isdir(seg_dir):
+            # 적재량이 sync_threshold 미만이면 아직 디스크에 안 쓰였을 수 있음 (로드 시 큐에서 재생)
+            if report["embeddings"]:
+                report["warnings"].append(f"HNSW 세그먼트 {seg_id[:8]} 미생성 (로드 시 큐에서 재생)")
+            continue
+        report["problems"] += [f"세그먼트 {seg_id[:8]}: {p}" for p in _check_segment(seg_dir, report["embeddings"])]
+
+    if report["orphan_segments"]:
+        report["warnings"].append(f"고아 세그먼트 디렉토리 {len(report['orphan_segments'])}개")
+    if report["embeddings"] == 0:
+        report["warnings"].append("임베딩 0개 (빈 컬렉션)")
+
+    # 큐에 전체 로그가 남아 있어야 HNSW를 다시 만들 수 있음
+    report["rebuildable"] = bool(collections and segments) and (report["queue"] or 0) >= (report["embeddings"] or 0)
+    if report["problems"]:
+        report["status"] = "broken"
+    else:
+        report["status"] = "warn" if report["warnings"] else "ok"
+    return report
+
+
+# ------------------------ 복구 / 압축 ------------------------
+def quarantine(root: str, name: str, reason: str) -> str:
+    target_root = os.path.join(root, QUARANTINE_DIR)
+    os.makedirs(target_root, exist_ok=True)
+    target = os.path.join(target_root, f"{name}_{int(time.time())}")
+    shutil.move(os.path.join(root, name), target)
+    catalog = get_catalog(root)
+    if catalog.get(name):
+        catalog.set_status(name, STATUS_QUARANTINED, reason)
+    return target
+
+
+# embeddings_queue operation 코드 (chromadb.db.mixins.embeddings_queue)
+OP_ADD, OP_UPDATE, OP_UPSERT, OP_DELETE = 0, 1, 2, 3
+DOCUMENT_KEY = "chroma:document"
+
+
+def replay_queue(path: str) -> dict:
+    """embeddings_queue 로그를 처음부터 재생 → {"name", "metadata", "records": {id: (벡터, 본문, 메타데이터)}}"""
+    import numpy as np
+    conn = _connect(os.path.join(path, SQLITE_FILE))
+    try:
+        collection_id, name = conn.execute("SELECT id, name FROM collections").fetchone()
+        metadata = {}
+        for key, str_value, int_value, float_value in conn.execute(
+                "SELECT key, str_value, int_value, float_value FROM collection_metadata WHERE collection_id = ?",
+                (collection_id,)):
+            # 적재 방식 설정(hnsw:batch_size 등)은 재적재 때 다시 정함, 거리 함수(hnsw:space)만 유지
+            if key.startswith("hnsw:") and key != "hnsw:space":
+                continue
+            metadata[key] = next(v for v in (str_value, int_value, float_value) if v is not None)
+        rows = conn.execute(
+            "SELECT operation, id, vector, encoding, metadata FROM embeddings_queue WHERE topic LIKE ? "
+            "ORDER BY seq_id", (f"%{collection_id}",)
+        ).fetchall()
+    finally:
+        conn.close()
+
+    records = {}
+    for operation, record_id, vector, encoding, meta_json in rows:
+        if operation == OP_DELETE:
+            records.pop(record_id, None)
+            continue
+        if vector is not None and encoding not in (None, "FLOAT32"):
+            raise ValueError(f"지원하지 않는 벡터 인코딩: {encoding}")
+        meta = json.loads(meta_json) if meta_json else {}
+        previous = records.get(record_id)
+        if operation == OP_UPDATE:
+            if previous is None:
+                continue
+            merged = {**previous[2], **meta}
+            vec = np.frombuffer(vector, dtype=np.float32) if vector is not None else previous[0]
+        else:
+            # ADD는 이미 있으면 무시 (chromadb와 동일), UPSERT는 덮어씀
+            if operation == OP_ADD and previous is not None:
+                continue
+            merged = meta
+            vec = np.frombuffer(vector, dtype=np.float32) if vector is not None else None
+        merged = {k: v for k, v in merged.items() if v is not None}
+        records[record_id] = (vec, merged.pop(DOCUMENT_KEY, None), merged)
+    return {"name": name, "metadata": metadata, "records": records}
+
+
+def rebuild_hnsw(path: str, report: dict) -> int:
+    """로그 재생 결과로 컬렉션을 다시 적재 (HNSW는 마지막에 한 번 구성/저장) → 적재한 원소 수
+
+    세그먼트 디렉토리만 지우면 chromadb가 '이미 적용한 로그'로 보고 빈 인덱스를 만들기 때문에
+    벡터/본문/메타데이터를 직접 다시 넣음"""
+    log = replay_queue(path)
+    records = {rid: rec for rid, rec in log["records"].items() if rec[0] is not None}
+    for seg_id in report["vector_segments"]:
+        shutil.rmtree(os.path.join(path, seg_id), ignore_errors=True)
+    ids = list(records)
+    chroma_bulk.bulk_write(path, log["name"], ids, [records[i][0] for i in ids], [records[i][1] for i in ids],
+                           [records[i][2] for i in ids], collection_metadata=log["metadata"])
+    return len(ids)
+
+
+def _verify_rebuild(path: str, expected: int) -> list:
+    """재구성 후 sqlite 검사 + HNSW 원소 수가 기대값과 같은지 → 문제 목록 (없으면 정상)"""
+    after = check_collection(path)
+    problems = list(after["problems"])
+    if after["embeddings"] != expected:
+        problems.append(f"재구성 후 임베딩 수 {after['embeddings']} ≠ 기대값 {expected}")
+    for seg_id in after["vector_segments"]:
+        header_path = os.path.join(path, seg_id, "header.bin")
+        header = read_hnsw_header(header_path) if os.path.exists(header_path) else None
+        if expected and (header is None or header["count"] != expected):
+            problems.append(f"재구성 후 HNSW 원소 수 {header['count'] if header else 0} ≠ 기대값 {expected}")
+    return problems
+
+
+def compact(path: str, report: dict):
+    for seg_id in report["orphan_segments"]:
+        shutil.rmtree(os.path.join(path, seg_id), ignore_errors=True)
+    conn = _connect(os.path.join(path, SQLITE_FILE), readonly=False)
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.execute("VACUUM")
+    conn.close()
+
+
+def _sqlite_load_time(path: str) -> float:
+    # 읽기 전용: 임베딩 수 + 로그 한 건 조회
+    start = time.perf_counter()
+    conn = _connect(os.path.join(path, SQLITE_FILE))
+    try:
+        conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        conn.execute("SELECT vector FROM embeddings_queue LIMIT 1").fetchone()
+    finally:
+        conn.close()
+    return time.perf_counter() - start
+
+
+def load_collection(path: str, use_chromadb: bool = True) -> float:
+    """컬렉션 로드 + 1회 조회 시간 (use_chromadb=False 이거나 chromadb 미설치 시 읽기 전용 sqlite 조회 시간)
+
+    chromadb 클라이언트는 열 때 마이그레이션/세그먼트 파일 쓰기를 하므로 수정 작업을 요청했을 때만 사용"""
+    if not use_chromadb:
+        return _sqlite_load_time(path)
+    try:
+        import chromadb
+    except ImportError:
+        return _sqlite_load_time(path)
+
+    start = time.perf_counter()
+
+    client = chromadb.PersistentClient(path=path)
+    for collection in client.list_collections():
+        collection = client.get_collection(getattr(collection, "name", collection))
+        if collection.count():
+            collection.peek(1)
+    return time.perf_counter() - start
+
+
+def _load_time(path: str, use_chromadb: bool):
+    try:
+        return round(load_collection(path, use_chromadb), 3)
+    except Exception:
+        return None
+
+
+def _rebuild(root: str, name: str, path: str, report: dict):
+    """HNSW 재구성 → 원소 수 검증 → 실패하면 격리"""
+    expected = report["embeddings"] or 0
+    try:
+        report["rebuilt_count"] = rebuild_hnsw(path, report)
+        problems = _verify_rebuild(path, expected)
+        if report["rebuilt_count"] != expected:
+            problems.insert(0, f"로그 재생 원소 수 {report['rebuilt_count']} ≠ sqlite 임베딩 수 {expected}")
+    except Exception as e:
+        problems = [f"재구성 실패: {type(e).__name__}: {e}"]
+    report["actions"].append("rebuild_hnsw")
+    report["rebuild_problems"] = problems
+    report["rebuild_verified"] = not problems
+    report["status_after"] = "broken" if problems else check_collection(path)["status"]
+    if problems:
+        report["quarantined_to"] = quarantine(root, name, "; ".join(problems))
+        report["actions"].append("quarantine")
+
+
+def run_maintenance(root: str, fix: bool = False, do_compact: bool = False, rebuild: bool = False) -> dict:
+    # 검사만 할 때는 카탈로그(_catalog.sqlite)도 만들거나 열지 않음
+    modify = fix or do_compact or rebuild
+    catalog = get_catalog(root) if modify else None
+    names = sorted(n for n in os.listdir(root) if os.path.isdir(os.path.join(root, n)) and not n.startswith("_"))
+    results = []
+    for name in names:
+        path = os.path.join(root, name)
+        report = check_collection(path)
+        report["size_before"] = dir_size(path)
+        # 손상된 컬렉션은 로드하지 않음 (chromadb가 빈 sqlite를 새로 만들거나 세그먼트를 덮어쓸 수 있음)
+        report["load_before"] = _load_time(path, modify) if report["status"] != "broken" else None
+        report["actions"] = []
+
+        if fix and report["status"] == "broken":
+            if report["rebuildable"]:
+                _rebuild(root, name, path, report)
+            else:
+                report["quarantined_to"] = quarantine(root, name, "; ".join(report["problems"]))
+                report["actions"].append("quarantine")
+        elif rebuild and report["status"] != "broken" and report["vector_segments"] and report["rebuildable"]:
+            _rebuild(root, name, path, report)
+
+        if do_compact and os.path.isdir(path) and report.get("status_after", report["status"]) != "broken":
+            compact(path, report)
+            report["actions"].append("compact")
+
+        if os.path.isdir(path):
+            report["size_after"] = dir_size(path)
+            broken_after = report.get("status_after", report["status"]) == "broken"
+            report["load_after"] = None if broken_after else _load_time(path, modify)
+            if report["actions"] and catalog is not None and catalog.get(name):
+                catalog.update(name, size_bytes=report["size_after"], chunks=report["embeddings"] or 0)
+                if report.get("rebuild_verified"):
+                    catalog.set_status(name, STATUS_READY)
+        else:
+            report["size_after"] = 0
+            report["load_after"] = None
+        results.append(report)
+
+    return {
+        "root": root,
+        "collections": results,
+        "size_before": sum(r["size_before"] for r in results),
+        "size_after": sum(r["size_after"] for r in results),
+        "broken": sum(1 for r in results if r["status"] == "broken"),
+    }
+
+
+def print_report(summary: dict):
+    print(f"{'collection':<40}{'status':>8}{'emb':>6}{'size(KB)':>18}{'load(s)':>16}  actions")
+    for r in summary["collections"]:
+        size = f"{r['size_before'] // 1024}→{r['size_after'] // 1024}"
+        load = f"{r['load_before']}→{r['load_after']}"
+        status = r["status"] if "status_after" not in r else f"{r['status']}→{r['status_after']}"
+        print(f"{r['name'][:39]:<40}{status:>8}{str(r['embeddings']):>6}{size:>18}{load:>16}  {','.join(r['actions'])}")
+        for problem in r["problems"]:
+            print(f"    ❌ {problem}")
+        for warning in r["warnings"]:
+            print(f"    ⚠️ {warning}")
+    print(f"전체 크기: {summary['size_before'] // 1024}KB → {summary['size_after'] // 1024}KB, 손상 {summary['broken']}개")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="벡터스토어 무결성 검사 및 압축")
+    parser.add_argument("--root", default="./vectorstore")
+    parser.add_argument("--fix", action="store_true", help="손상된 컬렉션 HNSW 재구성, 불가능하면 격리")
+    parser.add_argument("--rebuild-hnsw", action="store_true", help="정상 컬렉션도 HNSW 세그먼트 재구성")
+    parser.add_argument("--compact", action="store_true", help="고아 세그먼트 삭제 + VACUUM")
+    parser.add_argument("--out", help="보고서 JSON 저장 경로")
+    args = parser.parse_args()
+
+    summary = run_maintenance(args.root, args.fix, args.compact, args.rebuild_hnsw)
+    print_report(summary)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
@@ -1,9 +1,17 @@
 import streamlit as st
 import os
-from retriever import ingest_pdf, ask_with_context, ask_across_collections
-from utils import get_file_hash, vectorstore_exists
+import uuid
+from utils import get_file_hash, vectorstore_exists, list_collections, make_collection_name
+from common import rag_api_client, chroma_bulk
+
+# ✅ RAG_API_URL 지정 시 HTTP 서비스(RAG_BACKEND=openai 로 띄운 common/rag_server.py)의 얇은 클라이언트로 동작
+USE_API = bool(rag_api_client.RAG_API_URL)
+if not USE_API:
+    from retriever import ingest_pdf, ask_with_context, ask_across_collections
+from common.tracing import span, start_metrics_server, histogram_summary, recent_traces
+from common.usage import usage_context
+from common.conversation_log import get_log, chunk_ref
 from datetime import datetime
-import re
 
 st.set_page_config(page_title="🚗 차량 매뉴얼 GPT", layout="wide")
 st.markdown("""
@@ -12,20 +20,37 @@ st.markdown("""
     <hr style='border-top: 3px solid #bbb;'>
 """, unsafe_allow_html=True)
 
+# ✅ METRICS_PORT 지정 시 Prometheus /metrics 엔드포인트 실행 (프로세스당 1회)
+start_metrics_server()
+
+# ✅ 단계별 지연시간 디버그 패널 (선택)
+with st.sidebar:
+    if st.checkbox("🐞 디버그 패널", value=False):
+        summary = histogram_summary()
+        if summary:
+            st.caption("단계별 평균 지연시간 (ms)")
+            st.table({name: [v["count"], v["mean_ms"], v["errors"]] for name, v in summary.items()})
+        for trace in recent_traces(limit=3):
+            with st.expander(f"trace {trace[0]['trace_id'][:8]}"):
+                for sp in sorted(trace, key=lambda x: x["start"]):
+                    st.text(f"{sp['name']:<32}{sp['duration_ms']:>10.1f} ms")
+
 # ✅ 상태 초기화
 if "chat_messages" not in st.session_state:
     st.session_state.chat_messages = []
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex  # 토큰 사용량/예산 집계용
 
-# ✅ 벡터 디렉토리 스캔해서 기존 컬렉션 목록 가져오기
-existing_collections = [
-    d for d in os.listdir("./vectorstore") 
-    if os.path.isdir(os.path.join("./vectorstore", d))
-]
+# ✅ 카탈로그에서 빌드 완료된 컬렉션 목록 가져오기 (표시는 원래 파일명)
+display_names = {c["name"]: c["display_name"] or c["name"]
+                 for c in (rag_api_client.list_collections() if USE_API else list_collections())}
+existing_collections = list(display_names)
 
 # ✅ 기존 저장된 벡터 선택 UI (선택 안 해도 가능)
 selected_collection = None
 if existing_collections:
-    selected_collection = st.selectbox("📁 특정 매뉴얼 선택 (선택하지 않으면 전체에서 검색)", ["전체 매뉴얼 검색"] + existing_collections)
+    selected_collection = st.selectbox("📁 특정 매뉴얼 선택 (선택하지 않으면 전체에서 검색)", ["전체 매뉴얼 검색"] + existing_collections,
+                                       format_func=lambda name: display_names.get(name, name))
     if selected_collection != "전체 매뉴얼 검색":
         st.session_state["collection_name"] = selected_collection
     else:
@@ -36,28 +61,32 @@ with st.expander("📄 새로운 차량 매뉴얼 업로드 (선택)"):
     uploaded = st.file_uploader("PDF 파일 선택", type="pdf")
     if uploaded:
         with st.spinner("📥 PDF 업로드 중..."):
-            with open("temp.pdf", "wb") as f:
-                f.write(uploaded.read())
-            file_hash = get_file_hash("temp.pdf")[:8]
+            with span("file_write"):
+                with open("temp.pdf", "wb") as f:
+                    f.write(uploaded.read())
+            with span("hash"):
+                content_hash = get_file_hash("temp.pdf")
 
-            # 1. 파일명에서 확장자 제거 후 특수문자, 한글 제거
+            # 파일명에서 한글/특수문자 제거 후 최대 30자 + 해시 앞 8자리 (utils.make_collection_name)
             raw_name = os.path.splitext(uploaded.name)[0]
+            collection_name = make_collection_name(uploaded.name, content_hash)
 
-            # 2. 한글 및 특수문자 제거 (ASCII 문자만 유지)
-            clean_name = re.sub(r"[^\x00-\x7F]", "", raw_name)       # 한글 등 비ASCII 제거
-            clean_name = re.sub(r"[^a-zA-Z0-9._-]", "_", clean_name)  # 허용 문자만 유지
-            clean_name = clean_name.strip("._-")                     # 시작/끝 문자 정리
-
-            # 3. 길이 제한 (최대 30자)s
-            short_name = clean_name[:30] if len(clean_name) >= 3 else f"doc_{file_hash}"
-
-            # 4. 최종 컬렉션 이름
-            collection_name = f"{short_name}_{file_hash}"
-
-
-            if not vectorstore_exists(collection_name):
+            if USE_API:
+                with st.spinner("🧠 문서 임베딩 중입니다... (RAG 서버)"):
+                    created = rag_api_client.ingest("temp.pdf", uploaded.name)["created"]
+            elif not vectorstore_exists(collection_name):
                 with st.spinner("🧠 문서 임베딩 중입니다..."):
-                    ingest_pdf("temp.pdf", collection_name)
+                    dedup_stats = ingest_pdf("temp.pdf", collection_name, display_name=raw_name, content_hash=content_hash)
+                if dedup_stats and dedup_stats["removed"]:
+                    st.caption(f"♻️ 중복 청크 {dedup_stats['removed']}개 제외: "
+                               f"{dedup_stats['chunks_before']} → {dedup_stats['chunks_after']}개 임베딩")
+                if dedup_stats and dedup_stats.get("load"):
+                    st.caption(chroma_bulk.format_stats(dedup_stats["load"]))
+                created = True
+            else:
+                created = False
+
+            if created:
                 st.success("✅ 문서 임베딩 완료!")
             else:
                 st.info("📁 이미 업로드된 문서입니다. 벡터스토어 불러옵니다.")
@@ -70,8 +99,11 @@ st.markdown("<h3>💬 정비사와의 채팅</h3>", unsafe_allow_html=True)
 user_input = st.chat_input("🚗 궁금한 점이나 고장 증상을 입력해 주세요...")
 
 if user_input:
-    with st.spinner("🔍 정비사 응답 생성 중..."):
-        if st.session_state.get("collection_name"):
+    with st.spinner("🔍 정비사 응답 생성 중..."), usage_context(session_id=st.session_state.session_id):
+        if USE_API:
+            # 서버가 사용량/대화 로그를 기록
+            result = rag_api_client.ask(user_input, st.session_state.get("collection_name"), st.session_state.session_id)
+        elif st.session_state.get("collection_name"):
             result = ask_with_context(user_input, st.session_state["collection_name"])
         else:
             result = ask_across_collections(user_input)
@@ -85,12 +117,22 @@ if user_input:
             "content": result["result"]
         })
 
+        # ✅ 모든 대화를 백그라운드로 기록 (채팅 지연 없음)
+        if not USE_API:
+            get_log().log_turn(
+                st.session_state.session_id, user_input, result["result"],
+                collection=st.session_state.get("collection_name") or "*",
+                chunks=[chunk_ref(doc) for doc in result["source_documents"]],
+                timings=result.get("timings")
+            )
+
 # ✅ 채팅 기록 출력
-for msg in st.session_state.chat_messages:
-    with st.chat_message(msg["role"]):
-        st.markdown(msg["content"])
+with span("render", messages=len(st.session_state.chat_messages)):
+    for msg in st.session_state.chat_messages:
+        with st.chat_message(msg["role"]):
+            st.markdown(msg["content"])
 
-# ✅ 대화 로그 저장
+# ✅ 현재 세션 대화 내보내기 (전체 로그는 logs/turns_*.jsonl[.gz]에 자동 기록됨)
 st.markdown("<hr>", unsafe_allow_html=True)
 if st.button("💾 대화 로그 저장"):
     os.makedirs("logs", exist_ok=True)
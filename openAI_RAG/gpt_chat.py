@@ -1,11 +1,10 @@
 import os
-from openai import OpenAI
 from dotenv import load_dotenv
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # ✅ 공용 모듈(common) 경로
+from common.llm_client import complete
 
 load_dotenv()
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-
-client = OpenAI(api_key=OPENAI_API_KEY)
 
 SYSTEM_PROMPT = (
     "당신은 자동차 시스템 도우미 입니다. "
@@ -23,14 +22,13 @@ questions = [
 responses = []
 
 for question in questions:
-    completion = client.chat.completions.create(
+    completion = complete(
+        [{"role": "user", "content": question}],
         model="gpt-3.5-turbo",
-        messages=[
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": question}
-        ]
+        provider="openai",
+        system=SYSTEM_PROMPT
     )
-    answer = completion.choices[0].message.content
+    answer = completion["text"]
     responses.append(answer)
 
 print(responses)
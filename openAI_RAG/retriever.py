@@ -1,11 +1,19 @@
-from langchain_community.document_loaders import PyPDFLoader
 from langchain_community.vectorstores import Chroma
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from langchain.schema import SystemMessage, HumanMessage
 from langchain.chains import RetrievalQA
+from langchain.schema import Document
 import os
+import time
 from dotenv import load_dotenv
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # ✅ 공용 모듈(common) 경로
+from common.llm_client import complete, hedge_from_env, stream
+from common.context_packer import pack_context
+from common import reranker, router, dedup, pdf_extract, chroma_bulk
+from common.tracing import span, traced
+from common.usage import usage_context
+from common.catalog import get_catalog
 
 # ✅ 환경변수 로드
 load_dotenv()
@@ -21,96 +29,233 @@ SYSTEM_PROMPT = (
     "해당 내용을 친절하게 설명해 주세요. 잘 모르겠으면 해당 답변은 잘 모르겠습니다라고 말해주세요."
 )
 
-# ✅ 1. PDF 임베딩 및 저장 함수
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
 
-def ingest_pdf(pdf_path: str, collection_name: str):
-    loader = PyPDFLoader(pdf_path)
-    documents = loader.load()
+# ✅ GPT 호출 (공용 LLM 레이어: 커넥션 재사용, 타임아웃/재시도, 선택적 헤징)
+def call_gpt(messages: list) -> str:
+    response = complete(
+        messages,
+        model=OPENAI_MODEL,
+        provider="openai",
+        system=SYSTEM_PROMPT,
+        temperature=0,
+        hedge=hedge_from_env()
+    )
+    return response["text"]
 
-    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    chunks = splitter.split_documents(documents)
+# ✅ 1. PDF 임베딩 및 저장 함수
 
-    embeddings = OpenAIEmbeddings(api_key=OPENAI_API_KEY)
-    vectordb = Chroma(
-        collection_name=collection_name,
-        embedding_function=embeddings,
-        persist_directory=f"./vectorstore/{collection_name}"
-    )
+@traced("ingest_pdf")
+def ingest_pdf(pdf_path: str, collection_name: str, display_name: str = None, content_hash: str = None):
+    # ✅ 카탈로그에 빌드 상태 기록 (빌드 중/실패한 컬렉션은 목록에 나오지 않음)
+    catalog = get_catalog()
+    catalog.begin_build(collection_name, content_hash, display_name, embedding_model=OpenAIEmbeddings(api_key=OPENAI_API_KEY).model)
+    try:
+        pages, chunk_count, dedup_stats = _build_collection(pdf_path, collection_name)
+    except Exception as e:
+        catalog.fail_build(collection_name, str(e))
+        raise
+    catalog.finish_build(collection_name, pages=pages, chunks=chunk_count)
+    return dedup_stats
 
-    for i in range(0, len(chunks), 100):
-        batch = chunks[i:i+100]
-        vectordb.add_documents(batch)
+def _build_collection(pdf_path: str, collection_name: str):
+    # ✅ 페이지마다 빠른 추출기부터 시도, 품질 미달 페이지만 느린 추출기/OCR로 (PyPDFLoader와 같은 메타데이터)
+    with span("pdf_parse", collection=collection_name) as sp:
+        pages = pdf_extract.extract_pages(pdf_path)
+        documents = [
+            Document(page_content=page["text"], metadata={"source": pdf_path, "page": page["page"],
+                                                          "extractor": page["extractor"]})
+            for page in pages
+        ]
+        sp.set(**pdf_extract.summarize(pages))
 
-    vectordb.persist()
+    with span("split") as sp:
+        splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+        chunks = splitter.split_documents(documents)
+        sp.set(chunks=len(chunks))
 
-# ✅ 2. 단일 컬렉션 질문 응답
+    # ✅ 반복되는 경고/안내 문구 청크는 하나만 임베딩 (대표 청크에 등장 페이지 기록)
+    with span("dedup") as sp:
+        chunks, dedup_stats = dedup.dedup_documents(chunks)
+        sp.set(**dedup_stats)
 
-def ask_with_context(question: str, collection_name: str, top_k: int = 5) -> dict:
     embeddings = OpenAIEmbeddings(api_key=OPENAI_API_KEY)
-    vectordb = Chroma(
-        collection_name=collection_name,
-        persist_directory=f"./vectorstore/{collection_name}",
-        embedding_function=embeddings
-    )
+    _vectordbs.pop(os.path.join("./vectorstore", collection_name), None)
+    persist_directory = f"./vectorstore/{collection_name}"
 
-    retriever = vectordb.as_retriever(search_kwargs={"k": top_k})
-    docs = retriever.get_relevant_documents(question)
+    # 임베딩 API 호출 + 벡터 저장
+    with span("embed_store", chunks=len(chunks)):
+        if chroma_bulk.CHROMA_BULK_LOAD:
+            # ✅ 임베딩을 먼저 병렬 계산 → 큰 트랜잭션으로 한 번에 쓰고 HNSW는 마지막에 한 번 구성
+            dedup_stats["load"] = chroma_bulk.build_collection(persist_directory, collection_name, chunks, embeddings)
+            vectordb = Chroma(
+                collection_name=collection_name,
+                embedding_function=embeddings,
+                persist_directory=persist_directory
+            )
+        else:
+            vectordb = Chroma(
+                collection_name=collection_name,
+                embedding_function=embeddings,
+                persist_directory=persist_directory
+            )
+            for i in range(0, len(chunks), 100):
+                batch = chunks[i:i+100]
+                vectordb.add_documents(batch)
 
-    context = "\n\n".join([doc.page_content for doc in docs])
+            vectordb.persist()
 
-    messages = [
-        SystemMessage(content=SYSTEM_PROMPT),
-        HumanMessage(content=f"문서 내용:\n{context}"),
-        HumanMessage(content=f"질문: {question}")
-    ]
+    # ✅ 전체 검색 라우팅용 중심 벡터 (청크 임베딩 k-means)
+    with span("centroids"):
+        stored = vectordb.get(include=["embeddings"])["embeddings"]
+        router.build_centroids(f"./vectorstore/{collection_name}", stored)
+    if stored is not None and len(stored):
+        dedup_stats["index_bytes_saved"] = dedup.index_bytes_saved(dedup_stats, len(stored[0]))
 
-    chat = ChatOpenAI(api_key=OPENAI_API_KEY, temperature=0)
-    answer = chat(messages)
+    return len(documents), len(chunks), dedup_stats
 
-    return {
-        "result": answer.content,
-        "source_documents": docs
-    }
+# ✅ 컬렉션별 Chroma 핸들 재사용 (서버처럼 오래 떠 있는 프로세스에서 매 요청 재생성 방지)
+_embeddings = None
+_vectordbs = {}
 
-# ✅ 3. 전체 벡터스토어에서 질문 응답
+def get_embeddings():
+    global _embeddings
+    if _embeddings is None:
+        _embeddings = OpenAIEmbeddings(api_key=OPENAI_API_KEY)
+    return _embeddings
 
-def ask_across_collections(question: str, vectorstore_root: str = "./vectorstore", top_k: int = 5) -> dict:
-    embeddings = OpenAIEmbeddings(api_key=OPENAI_API_KEY)
-    all_docs = []
+def get_vectordb(collection_name: str, vectorstore_root: str = "./vectorstore"):
+    path = os.path.join(vectorstore_root, collection_name)
+    if path not in _vectordbs:
+        _vectordbs[path] = Chroma(
+            collection_name=collection_name,
+            persist_directory=path,
+            embedding_function=get_embeddings()
+        )
+    return _vectordbs[path]
 
-    for collection_name in os.listdir(vectorstore_root):
-        path = os.path.join(vectorstore_root, collection_name)
-        if os.path.isdir(path):
-            vectordb = Chroma(
-                collection_name=collection_name,
-                persist_directory=path,
-                embedding_function=embeddings
-            )
-            retriever = vectordb.as_retriever(search_kwargs={"k": top_k})
+# ✅ 2. 검색 → 재정렬 → 컨텍스트 압축 (collection_name이 없으면 전체 벡터스토어 검색)
+
+def retrieve_context(question: str, collection_name: str = None, vectorstore_root: str = "./vectorstore",
+                     top_k: int = 5, route: bool = None) -> dict:
+    route = router.ROUTER_ENABLED if route is None else route
+    timings = {}
+    if collection_name:
+        # ✅ 재정렬을 켜면 후보를 넉넉히 가져온 뒤 크로스인코더로 상위 top_k만 선택
+        with span("retrieve", collection=collection_name) as sp:
+            retriever = get_vectordb(collection_name, vectorstore_root).as_retriever(
+                search_kwargs={"k": reranker.candidate_count(top_k)})
             docs = retriever.get_relevant_documents(question)
-            all_docs.extend(docs)
+        timings["retrieve"] = sp.duration
+
+        if reranker.RERANK_ENABLED:
+            with span("rerank", candidates=len(docs)) as sp:
+                docs, _ = reranker.rerank(question, docs, top_k, text_of=lambda d: d.page_content)
+            timings["rerank"] = sp.duration
+    else:
+        # 카탈로그에서 준비 완료(ready)된 컬렉션만 검색
+        names = get_catalog(vectorstore_root).ready_names()
+        # ✅ 질문 임베딩은 한 번만 계산해서 라우팅과 모든 컬렉션 검색에 재사용
+        with span("embed_query") as sp:
+            query_vector = get_embeddings().embed_query(question)
+        timings["embed_query"] = sp.duration
+
+        if route:
+            # ✅ 중심 벡터와 비교해 관련 매뉴얼 상위 N개만 검색 (확신이 낮으면 전체 검색)
+            with span("route", collections=len(names)) as sp:
+                names, route_info = router.route(query_vector, names, vectorstore_root)
+                sp.set(**route_info)
+            timings["route"] = sp.duration
+
+        hits = []
+        with span("retrieve", collection="*", collections=len(names)) as sp:
+            k = reranker.candidate_count(top_k, len(names))
+            for name in names:
+                if os.path.isdir(os.path.join(vectorstore_root, name)):
+                    hits.extend(get_vectordb(name, vectorstore_root).similarity_search_by_vector_with_relevance_scores(
+                        query_vector, k=k))
+        timings["retrieve"] = sp.duration
+
+        # 중복 제거 후 가장 유사한 top_k만 추출 (문서 길이로 단순 정렬)
+        # 모든 컬렉션의 결과를 벡터 거리(작을수록 가까움) 순으로 합쳐서 같은 본문은 가장 가까운 것만 남김
+        unique = {}
+        for doc, _ in sorted(hits, key=lambda hit: hit[1]):
+            unique.setdefault(doc.page_content, doc)
+        unique_docs = list(unique.values())
+        if reranker.RERANK_ENABLED:
+            # 컬렉션 전체 후보를 질문과의 관련도로 재정렬 (가까운 순 RERANK_CANDIDATES개까지만)
+            unique_docs = unique_docs[:reranker.candidate_count(top_k)]
+            with span("rerank", candidates=len(unique_docs)) as sp:
+                docs, _ = reranker.rerank(question, unique_docs, top_k, text_of=lambda d: d.page_content)
+            timings["rerank"] = sp.duration
+        else:
+            docs = sorted(unique_docs, key=lambda d: len(d.page_content), reverse=True)[:top_k]
 
-    # 중복 제거 후 가장 유사한 top_k만 추출 (문서 길이로 단순 정렬)
-    unique_docs = list({doc.page_content: doc for doc in all_docs}.values())
-    top_docs = sorted(unique_docs, key=lambda d: len(d.page_content), reverse=True)[:top_k]
+    # ✅ 겹치는 청크 병합 + 중복 문장 제거 + 토큰 예산 내 관련 문장 선택
+    with span("pack") as sp:
+        packed = pack_context(question, [doc.page_content for doc in docs])
+        sp.set(saved_tokens=packed["saved_tokens"])
 
-    context = "\n\n".join([doc.page_content for doc in top_docs])
+    return {
+        "docs": docs,
+        "context": packed["context"],
+        "context_tokens": {k: v for k, v in packed.items() if k != "context"},
+        "timings": timings
+    }
 
-    messages = [
-        SystemMessage(content=SYSTEM_PROMPT),
-        HumanMessage(content=f"문서 내용:\n{context}"),
-        HumanMessage(content=f"질문: {question}")
+def build_messages(question: str, context: str) -> list:
+    return [
+        {"role": "user", "content": f"문서 내용:\n{context}\n\n질문: {question}"}
     ]
 
-    chat = ChatOpenAI(api_key=OPENAI_API_KEY, temperature=0)
-    answer = chat(messages)
+def _answer(question: str, collection_name: str = None, vectorstore_root: str = "./vectorstore", top_k: int = 5,
+            route: bool = None) -> dict:
+    retrieved = retrieve_context(question, collection_name, vectorstore_root, top_k, route)
+    timings = retrieved["timings"]
+    with span("llm") as sp, usage_context(collection=collection_name or "*"):
+        answer = call_gpt(build_messages(question, retrieved["context"]))
+    timings["llm"] = sp.duration
 
     return {
-        "result": answer.content,
-        "source_documents": top_docs
+        "result": answer,
+        "source_documents": retrieved["docs"],
+        "context_tokens": retrieved["context_tokens"],
+        "timings": timings
     }
 
-# ✅ 4. 기존 체인 방식 QA (선택 사항)
+# ✅ 3. 단일 컬렉션 질문 응답
+
+@traced("ask_with_context")
+def ask_with_context(question: str, collection_name: str, top_k: int = 5) -> dict:
+    return _answer(question, collection_name, top_k=top_k)
+
+# ✅ 4. 전체 벡터스토어에서 질문 응답
+
+@traced("ask_across_collections")
+def ask_across_collections(question: str, vectorstore_root: str = "./vectorstore", top_k: int = 5,
+                           route: bool = None) -> dict:
+    """route=None이면 ROUTER_ENABLED 설정을 따르고, False면 항상 전체 컬렉션 검색"""
+    return _answer(question, None, vectorstore_root, top_k, route)
+
+# ✅ 5. 스트리밍 질문 응답 (HTTP 서비스용)
+#   {"type": "sources"} → {"type": "token"} 반복 → {"type": "done"} 순서로 이벤트를 내보냄
+
+def stream_answer(question: str, collection_name: str = None, vectorstore_root: str = "./vectorstore", top_k: int = 5):
+    retrieved = retrieve_context(question, collection_name, vectorstore_root, top_k)
+    timings = retrieved["timings"]
+    yield {"type": "sources", "documents": retrieved["docs"], "context_tokens": retrieved["context_tokens"]}
+
+    parts = []
+    start = time.perf_counter()
+    with usage_context(collection=collection_name or "*"):
+        for text in stream(build_messages(question, retrieved["context"]), model=OPENAI_MODEL,
+                           provider="openai", system=SYSTEM_PROMPT, temperature=0):
+            parts.append(text)
+            yield {"type": "token", "text": text}
+    timings["llm"] = time.perf_counter() - start
+    yield {"type": "done", "result": "".join(parts), "timings": timings}
+
+# ✅ 6. 기존 체인 방식 QA (선택 사항)
 
 def get_qa_chain(collection_name: str):
     embeddings = OpenAIEmbeddings(api_key=OPENAI_API_KEY)
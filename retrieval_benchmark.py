@@ -0,0 +1,277 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+from datetime import datetime
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from common.context_packer import pack_context
+from common.mock_llm_server import fake_answer
+from common import reranker
+
+# ✅ 검색 파이프라인 벤치마크
+#   질문 세트(JSONL)를 Chroma 컬렉션(claude_RAG/vectorstore) 또는 FAISS 인덱스(CLAUDE/)에 재생하고
+#   단계별 지연시간 백분위수, recall@k, 메모리 사용량을 JSON으로 저장 (두 실행 결과 비교 가능)
+#   LLM은 결정적 가짜 응답을 사용하므로 네트워크가 필요 없음
+#
+# 질문 JSONL 한 줄 예시:
+#   {"id": "q1", "question": "선루프 초기화 방법", "gold": ["선루프 스위치를 앞쪽으로"]}
+#   (question이 없으면 title/body 사용, gold는 정답 청크에 포함된 문자열 또는 청크 id 목록)
+#
+# 사용 예)
+#   python retrieval_benchmark.py --questions requests.jsonl --backend faiss --out bench_faiss.json
+#   python retrieval_benchmark.py --questions qa.jsonl --backend chroma --collection Owner_s_Manual--8_ea53d30d
+#   python retrieval_benchmark.py --compare bench_old.json bench_new.json
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_VECTORSTORE = os.path.join(ROOT, "claude_RAG", "vectorstore")
+DEFAULT_FAISS = os.path.join(ROOT, "CLAUDE", "index.faiss")
+DEFAULT_FAISS_META = os.path.join(ROOT, "CLAUDE", "index.pkl")
+PERCENTILES = (50, 90, 95, 99)
+
+
+def max_rss_mb():
+    """프로세스 최대 RSS (MB). resource는 POSIX 전용이라 없으면 psutil, 둘 다 없으면 None"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss 단위: Linux는 KB, macOS는 바이트
+        return round(peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024, 1)
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        # Windows는 최대 작업 집합(peak_wset), 그 외는 현재 RSS
+        return round(getattr(info, "peak_wset", info.rss) / 1024 / 1024, 1)
+    except ImportError:
+        return None
+
+
+def load_questions(path: str, limit: int = None) -> list:
+    questions = []
+    with open(path, encoding="utf-8") as f:
+        for i, line in enumerate(f):
+            line = line.strip()
+            if not line:
+                continue
+            row = json.loads(line)
+            text = row.get("question") or row.get("title") or row.get("body")
+            if not text:
+                continue
+            questions.append({
+                "id": row.get("id") or row.get("request_id") or str(i),
+                "question": text,
+                "gold": row.get("gold", []),
+            })
+            if limit and len(questions) >= limit:
+                break
+    return questions
+
+
+# ------------------------ 백엔드 ------------------------
+class FaissBackend:
+    def __init__(self, index_path, meta_path, model_name):
+        import faiss
+        import joblib
+        from sentence_transformers import SentenceTransformer
+        self.index = faiss.read_index(index_path)
+        self.chunks = joblib.load(meta_path)
+        self.model = SentenceTransformer(model_name)
+
+    def embed(self, question):
+        return np.array(self.model.encode([question]), dtype=np.float32)
+
+    def search(self, query_emb, k):
+        _, I = self.index.search(query_emb, k)
+        return [{"id": str(i), "text": self.chunks[i]} for i in I[0] if i >= 0]
+
+
+class ChromaBackend:
+    def __init__(self, vectorstore_root, collections, embedding):
+        import chromadb
+        self.collections = []
+        names = collections or sorted(
+            d for d in os.listdir(vectorstore_root) if os.path.isdir(os.path.join(vectorstore_root, d)))
+        for name in names:
+            client = chromadb.PersistentClient(path=os.path.join(vectorstore_root, name))
+            try:
+                self.collections.append(client.get_collection(name))
+            except Exception as e:
+                print(f"⚠️ 컬렉션 로드 실패, 건너뜀: {name} ({e})")
+        if embedding == "openai":
+            from langchain_community.embeddings import OpenAIEmbeddings
+            self.embedder = OpenAIEmbeddings().embed_query
+        else:
+            from sentence_transformers import SentenceTransformer
+            model = SentenceTransformer(embedding)
+            self.embedder = lambda q: model.encode([q])[0].tolist()
+
+    def embed(self, question):
+        return self.embedder(question)
+
+    def search(self, query_emb, k):
+        hits = []
+        for collection in self.collections:
+            result = collection.query(query_embeddings=[query_emb], n_results=k)
+            for doc_id, text, dist in zip(result["ids"][0], result["documents"][0], result["distances"][0]):
+                hits.append({"id": f"{collection.name}/{doc_id}", "text": text, "distance": dist})
+        hits.sort(key=lambda h: h["distance"])
+        return hits[:k]
+
+
+# ------------------------ 측정 ------------------------
+def recall_at_k(hits: list, gold: list):
+    if not gold:
+        return None
+    found = sum(
+        1 for g in gold
+        if any(g == h["id"] or g in h["text"] for h in hits)
+    )
+    return found / len(gold)
+
+
+def percentiles(values: list) -> dict:
+    if not values:
+        return {}
+    arr = np.array(values) * 1000
+    summary = {f"p{p}": round(float(np.percentile(arr, p)), 3) for p in PERCENTILES}
+    summary["mean"] = round(float(arr.mean()), 3)
+    return summary
+
+
+def run_benchmark(backend, questions, top_k, token_budget, use_rerank):
+    stages = {"embed": [], "search": [], "rerank": [], "pack": [], "llm": [], "total": []}
+    rows = []
+    recalls = []
+    candidates = reranker.candidate_count(top_k) if use_rerank else top_k
+
+    for q in questions:
+        t0 = time.perf_counter()
+        query_emb = backend.embed(q["question"])
+        t1 = time.perf_counter()
+        hits = backend.search(query_emb, candidates)
+        t2 = time.perf_counter()
+        if use_rerank:
+            hits, _ = reranker.rerank(q["question"], hits, top_k, text_of=lambda h: h["text"])
+        t3 = time.perf_counter()
+        packed = pack_context(q["question"], [h["text"] for h in hits[:top_k]], token_budget=token_budget)
+        t4 = time.perf_counter()
+        answer = fake_answer(f"{packed['context']}\n\n질문: {q['question']}")
+        t5 = time.perf_counter()
+
+        stages["embed"].append(t1 - t0)
+        stages["search"].append(t2 - t1)
+        if use_rerank:
+            stages["rerank"].append(t3 - t2)
+        stages["pack"].append(t4 - t3)
+        stages["llm"].append(t5 - t4)
+        stages["total"].append(t5 - t0)
+
+        recall = recall_at_k(hits[:top_k], q["gold"])
+        if recall is not None:
+            recalls.append(recall)
+        rows.append({
+            "id": q["id"],
+            "hit_ids": [h["id"] for h in hits[:top_k]],
+            f"recall@{top_k}": recall,
+            "prompt_tokens": packed["packed_tokens"],
+            "saved_tokens": packed["saved_tokens"],
+            "answer_len": len(answer),
+            "total_ms": round((t5 - t0) * 1000, 3),
+        })
+
+    return {
+        "latency_ms": {name: percentiles(values) for name, values in stages.items() if values},
+        f"recall@{top_k}": round(float(np.mean(recalls)), 4) if recalls else None,
+        "labeled_questions": len(recalls),
+        "mean_prompt_tokens": round(float(np.mean([r["prompt_tokens"] for r in rows])), 1) if rows else 0,
+        "per_question": rows,
+    }
+
+
+# ------------------------ 결과 비교 ------------------------
+def compare(old_path: str, new_path: str):
+    with open(old_path, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(new_path, encoding="utf-8") as f:
+        new = json.load(f)
+
+    print(f"{'지표':<28}{'이전':>12}{'이후':>12}{'변화':>10}")
+    for stage, summary in new["latency_ms"].items():
+        for key in ("p50", "p95"):
+            before = old["latency_ms"].get(stage, {}).get(key)
+            after = summary.get(key)
+            if before is None or after is None:
+                continue
+            change = (after - before) / before * 100 if before else 0.0
+            print(f"{stage + ' ' + key + ' (ms)':<28}{before:>12.2f}{after:>12.2f}{change:>9.1f}%")
+
+    for key in [k for k in new if k.startswith("recall@")] + ["mean_prompt_tokens"]:
+        print(f"{key:<28}{str(old.get(key)):>12}{str(new.get(key)):>12}")
+    for key in ("peak_python_mb", "max_rss_mb"):
+        print(f"{key:<28}{str(old['memory'].get(key)):>12}{str(new['memory'].get(key)):>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="검색 파이프라인 벤치마크")
+    parser.add_argument("--questions", default=os.path.join(ROOT, "requests.jsonl"))
+    parser.add_argument("--backend", choices=["chroma", "faiss"], default="faiss")
+    parser.add_argument("--vectorstore", default=DEFAULT_VECTORSTORE)
+    parser.add_argument("--collection", action="append", help="Chroma 컬렉션 (여러 번 지정 가능, 생략 시 전체)")
+    parser.add_argument("--embedding", default="openai", help="Chroma 질의 임베딩: openai 또는 sentence-transformers 모델명")
+    parser.add_argument("--faiss-index", default=DEFAULT_FAISS)
+    parser.add_argument("--faiss-meta", default=DEFAULT_FAISS_META)
+    parser.add_argument("--faiss-model", default="paraphrase-MiniLM-L3-v2")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--token-budget", type=int, default=1500)
+    parser.add_argument("--rerank", action="store_true")
+    parser.add_argument("--limit", type=int)
+    parser.add_argument("--out", default=None)
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    questions = load_questions(args.questions, args.limit)
+    print(f"질문 {len(questions)}개 로드: {args.questions}")
+
+    tracemalloc.start()
+    load_start = time.perf_counter()
+    if args.backend == "faiss":
+        backend = FaissBackend(args.faiss_index, args.faiss_meta, args.faiss_model)
+    else:
+        backend = ChromaBackend(args.vectorstore, args.collection, args.embedding)
+    load_seconds = time.perf_counter() - load_start
+
+    result = run_benchmark(backend, questions, args.top_k, args.token_budget, args.rerank)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result["config"] = {k: v for k, v in vars(args).items() if k != "compare"}
+    result["backend_load_ms"] = round(load_seconds * 1000, 1)
+    result["memory"] = {
+        "peak_python_mb": round(peak / 1024 / 1024, 1),
+        "max_rss_mb": max_rss_mb(),
+    }
+    result["created_at"] = datetime.now().isoformat(timespec="seconds")
+
+    out = args.out or f"bench_{args.backend}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+    for stage, summary in result["latency_ms"].items():
+        print(f"{stage:<8} p50={summary['p50']:.2f}ms p95={summary['p95']:.2f}ms")
+    recall_key = f"recall@{args.top_k}"
+    print(f"{recall_key}: {result[recall_key]} (라벨 {result['labeled_questions']}개)")
+    print(f"메모리: {result['memory']}")
+    print(f"💾 결과 저장: {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,19 @@
 import os
+import sys
 import json
 import gradio as gr
-import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # ✅ 공용 모듈(common) 경로
+from common.model_manager import get_manager
+from common.hf_stream import stream_generate
 
-# ✅ 모델 불러오기
-HF_TOKEN = os.getenv("HF_TOKEN")  # Hugging Face access token 필요
-MODEL_NAME = "mistralai/Mistral-7B-Instruct-v0.1"
+# ✅ 모델 불러오기 (메모리 예산 관리자가 처음 사용할 때 로드, 예산을 넘으면 오래 안 쓴 모델부터 내림)
+#   Hugging Face access token 필요 (HF_TOKEN), 모델 설정은 common/model_manager.MODEL_SPECS
+MODEL_KEY = "mistral-7b"
 
-tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME, token=HF_TOKEN)
-model = AutoModelForCausalLM.from_pretrained(
-    MODEL_NAME,
-    token=HF_TOKEN,
-    torch_dtype=torch.float16,
-    device_map="auto"
-)
+def load_model():
+    return get_manager().get(MODEL_KEY)
 
-# ✅ 응답 생성 함수
+# ✅ 응답 생성 함수 (제너레이터: 생성 중 원문을 흘려 보여주고 마지막에 3줄 정리본)
 def generate_response(user_input):
     prompt = f"""
     [INST]
@@ -32,18 +29,21 @@ def generate_response(user_input):
     Do not add extra text, only JSON.
     [/INST]
     """
-    inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
-    with torch.no_grad():
-        outputs = model.generate(
-            **inputs,
+    # 생성하는 동안에는 관리자가 이 모델을 내리지 않음
+    # 토큰이 나오는 대로 화면에 보여주고, 중지/연결 끊김으로 close()되면 생성도 중단
+    response = ""
+    with get_manager().use(MODEL_KEY) as (tokenizer, model):
+        for piece in stream_generate(
+            model, tokenizer, prompt,
             max_new_tokens=256,
             temperature=0.9,
             top_p=0.85,
             top_k=50,
             repetition_penalty=1.2,
-            pad_token_id=tokenizer.eos_token_id,
-        )
-    response = tokenizer.decode(outputs[0], skip_special_tokens=True).replace(prompt, "").strip()
+        ):
+            response += piece
+            yield f"🔧 진단 중...\n{response}"
+    response = response.strip()
 
     try:
         data = json.loads(response)
@@ -64,10 +64,10 @@ def generate_response(user_input):
         quick_fix = item.get("quick_fix", "No suggestion")
         output_lines.append(f"{i}. {cause} → {quick_fix}")
 
-    return "\n".join(output_lines)
+    yield "\n".join(output_lines)
 
-# ✅ 스타일 포함한 탭 함수
-def tab1_ui():
+# ✅ 스타일 포함한 탭 함수 (generate: 모델 워커 핸들러를 넘기면 별도 프로세스에서 실행)
+def tab1_ui(generate=generate_response):
     custom_css = """
     @import url('https://fonts.googleapis.com/css2?family=Roboto:wght@400;700&display=swap');
     body {
@@ -129,8 +129,11 @@ def tab1_ui():
             gr.HTML("<h1>🚗 자동차 상담 챗봇</h1>")
             gr.HTML("<p class='description'>자동차 문제의 3가지 원인과 해결책을 빠르게 안내합니다.</p>")
             user_input = gr.Textbox(lines=4, placeholder="차량 증상을 입력하세요...", label="차량 증상 입력")
-            submit_btn = gr.Button("🔍 진단하기")
+            with gr.Row():
+                submit_btn = gr.Button("🔍 진단하기")
+                stop_btn = gr.Button("⏹ 중지")
             output_box = gr.Textbox(label="진단 결과", elem_classes=["output-box"])
             gr.HTML("<footer>© 2025 Car Diagnosis Bot | Premium Blue Theme</footer>")
-        submit_btn.click(generate_response, inputs=user_input, outputs=output_box)
+        submit_event = submit_btn.click(generate, inputs=user_input, outputs=output_box)
+        stop_btn.click(None, cancels=[submit_event])
     return demo
@@ -1,21 +1,18 @@
+import os
+import sys
 import gradio as gr
-from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # ✅ 공용 모듈(common) 경로
+from common.model_manager import get_manager
+from common.hf_stream import stream_generate
 
-# ✅ 모델 로딩 (한 번만 수행)
-model_id = "microsoft/Phi-3-mini-4k-instruct"
-tokenizer = AutoTokenizer.from_pretrained(model_id)
-model = AutoModelForCausalLM.from_pretrained(model_id)
-model = model.to("cpu")  # 'cuda'로 변경 가능
+# ✅ 모델 로딩 (메모리 예산 관리자가 처음 사용할 때 로드, 예산을 넘으면 오래 안 쓴 모델부터 내림)
+#   CPU 로드 ('cuda'는 common/model_manager.MODEL_SPECS에서 변경)
+MODEL_KEY = "phi3-mini"
 
-# ✅ 텍스트 생성 파이프라인
-chatbot = pipeline(
-    "text-generation",
-    model=model,
-    tokenizer=tokenizer,
-    return_full_text=True
-)
+def load_model():
+    return get_manager().get(MODEL_KEY)
 
-# ✅ 응답 생성 함수
+# ✅ 응답 생성 함수 (제너레이터: 지금까지 생성된 답변을 yield)
 def chat(user_input):
     if len(user_input.strip().split()) <= 4:
         user_input += " Can you help me understand what's going on with my car?"
@@ -30,20 +27,21 @@ def chat(user_input):
         f"### User: {user_input}\n### Assistant:"
     )
 
-    output = chatbot(
-        prompt,
-        max_new_tokens=256,
-        do_sample=False,
-        temperature=0.6,
-        top_p=0.9
-    )
-
-    full_response = output[0]["generated_text"]
-    result = full_response.split("### Assistant:")[-1].strip() if "### Assistant:" in full_response else full_response.strip()
-    return result
+    # ✅ 토큰 스트리밍 (가중치는 관리자가 가진 모델을 그대로 사용, 생성 중에는 내려가지 않음)
+    #   다음 "### User:" 턴을 지어내기 시작하면 거기서 생성 중단
+    result = ""
+    with get_manager().use(MODEL_KEY) as (tokenizer, model):
+        for piece in stream_generate(
+            model, tokenizer, prompt,
+            stop_at="### User:",
+            max_new_tokens=256,
+            do_sample=False
+        ):
+            result += piece
+            yield result.strip()
 
-# ✅ Gradio 탭용 함수
-def tab2_ui():
+# ✅ Gradio 탭용 함수 (chat_fn: 모델 워커 핸들러를 넘기면 별도 프로세스에서 실행)
+def tab2_ui(chat_fn=chat):
     with gr.Blocks() as demo:
         gr.Markdown("## 🚗 Car Repair Expert Chatbot (Phi-3)")
         gr.Markdown("Ask your car-related questions in **English**. Powered by Phi-3 Mini model.")
@@ -66,7 +64,10 @@ def tab2_ui():
             inputs=input_box
         )
 
-        send_btn = gr.Button("🔧 Ask")
-        send_btn.click(fn=chat, inputs=input_box, outputs=output_box)
+        with gr.Row():
+            send_btn = gr.Button("🔧 Ask")
+            stop_btn = gr.Button("⏹ Stop")
+        send_event = send_btn.click(fn=chat_fn, inputs=input_box, outputs=output_box)
+        stop_btn.click(None, cancels=[send_event])
 
     return demo
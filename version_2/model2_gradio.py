@@ -1,14 +1,12 @@
+import os
+import sys
 import gradio as gr
-from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
+from transformers import pipeline
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # ✅ 공용 모듈(common) 경로
+from common.model_manager import get_manager
 
-# 모델 로딩
-model_id = "microsoft/Phi-3-mini-4k-instruct"
-tokenizer = AutoTokenizer.from_pretrained(model_id)
-model = AutoModelForCausalLM.from_pretrained(model_id)
-model = model.to("cpu")
-
-# 텍스트 생성 파이프라인
-chatbot = pipeline("text-generation", model=model, tokenizer=tokenizer)
+# 모델 로딩 (Phi-3 mini, CPU) - 공용 모델 관리자가 처음 사용할 때 로드
+MODEL_KEY = "phi3-mini"
 
 # 챗봇 응답 함수
 def chat(user_input):
@@ -16,12 +14,14 @@ def chat(user_input):
         "당신은 자동차 수리 전문가 챗봇입니다. 차량 관련 문제에만 전문적으로 답변하세요.\n\n"
         f"### 사용자: {user_input}\n### 어시스턴트:"
     )
-    output = chatbot(
-    prompt,
-    max_new_tokens=512,           # 토큰 더 늘리기 (덜 끊기게)
-    do_sample=True,
-    temperature=0.6,              # 조금 더 일관성 있게
-    top_p=0.9)                    # 의미 있는 후보들 중에서만 샘플링
+    with get_manager().use(MODEL_KEY) as (tokenizer, model):
+        chatbot = pipeline("text-generation", model=model, tokenizer=tokenizer)
+        output = chatbot(
+        prompt,
+        max_new_tokens=512,           # 토큰 더 늘리기 (덜 끊기게)
+        do_sample=True,
+        temperature=0.6,              # 조금 더 일관성 있게
+        top_p=0.9)                    # 의미 있는 후보들 중에서만 샘플링
     result = output[0]["generated_text"].split("### 어시스턴트:")[-1].strip()
     return result
 
@@ -1,41 +1,33 @@
+import os
+import sys
 import gradio as gr
-import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # ✅ 공용 모듈(common) 경로
+from common.model_manager import get_manager
+from common.hf_stream import stream_generate
 
-# 모델 ID: 성능 좋은 균형형 모델
-model_id = "microsoft/Phi-3-medium-4k-instruct"
+# 모델: 성능 좋은 균형형 모델 (Phi-3 Medium, GPU 있으면 자동 사용)
+# 로드/메모리 관리는 공용 모델 관리자 (common/model_manager.MODEL_SPECS)
+MODEL_KEY = "phi3-medium"
 
-# 디바이스 설정 (GPU 있으면 자동 사용)
-device = "cuda" if torch.cuda.is_available() else "cpu"
-
-# 모델 및 토크나이저 로드
-tokenizer = AutoTokenizer.from_pretrained(model_id, trust_remote_code=True)
-model = AutoModelForCausalLM.from_pretrained(
-    model_id,
-    torch_dtype=torch.float16 if device == "cuda" else torch.float32,
-    device_map="auto",  # GPU 자동 할당
-    trust_remote_code=True
-)
-
-# 텍스트 생성 파이프라인 생성
-chatbot = pipeline("text-generation", model=model, tokenizer=tokenizer, device=0 if device == "cuda" else -1)
-
-# 응답 생성 함수
+# 응답 생성 함수 (제너레이터: 지금까지 생성된 답변을 yield)
 def chat(user_input):
     prompt = (
         "당신은 자동차 수리 전문가 챗봇입니다. 차량 관련 문제에만 전문적으로 친절하게 답변하세요.\n\n"
         f"### 사용자: {user_input}\n### 어시스턴트:"
     )
-    output = chatbot(
-        prompt,
-        max_new_tokens=512,
-        do_sample=True,
-        temperature=0.6,
-        top_p=0.9
-    )
-    raw_text = output[0]["generated_text"]
-    result = raw_text.replace(prompt, "").strip()
-    return result
+    # 토큰이 나오는 대로 화면에 갱신, 창을 닫거나 중지하면 생성도 중단
+    result = ""
+    with get_manager().use(MODEL_KEY) as (tokenizer, model):
+        for piece in stream_generate(
+            model, tokenizer, prompt,
+            stop_at="### 사용자:",
+            max_new_tokens=512,
+            do_sample=True,
+            temperature=0.6,
+            top_p=0.9
+        ):
+            result += piece
+            yield result.strip()
 
 # Gradio UI 구성
 iface = gr.Interface(
@@ -1,17 +1,18 @@
-from transformers import AutoModelForCausalLM, AutoTokenizer, pipeline
+import os
+import sys
+from transformers import pipeline
 import gradio as gr
-import torch
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # ✅ 공용 모듈(common) 경로
+from common.model_manager import get_manager
 
-model_id = "microsoft/phi-2"
-tokenizer = AutoTokenizer.from_pretrained(model_id)
-model = AutoModelForCausalLM.from_pretrained(model_id).to("cpu")  # CPU 명시
-
-chatbot = pipeline("text-generation", model=model, tokenizer=tokenizer)
+MODEL_KEY = "phi-2"  # CPU 로드 (common/model_manager.MODEL_SPECS)
 
 def car_repair_bot(user_input):
     prompt = f"""### 사용자: {user_input}
 ### 자동차 정비 전문가:"""
-    response = chatbot(prompt, max_new_tokens=256, temperature=0.7)
+    with get_manager().use(MODEL_KEY) as (tokenizer, model):
+        chatbot = pipeline("text-generation", model=model, tokenizer=tokenizer)
+        response = chatbot(prompt, max_new_tokens=256, temperature=0.7)
     return response[0]["generated_text"].split("### 자동차 정비 전문가:")[-1].strip()
 
 iface = gr.Interface(
@@ -1,29 +1,40 @@
-import openai
 import gradio as gr
 
-# 최신 방식: openai.Client 사용
+# 최신 방식: 공용 LLM 레이어(common.llm_client)의 AsyncOpenAI 클라이언트 사용
 
 import os
+import sys
 from dotenv import load_dotenv
 
-load_dotenv()  # .env 파일 자동 로드
-
-api_key = os.getenv("OPENAI_API_KEY")
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # 공용 모듈(common) 경로
+from common.llm_client import acomplete
+from common.usage import usage_context
+from session_memory import SessionMemory
 
-client = openai.OpenAI(api_key=api_key)
+load_dotenv()  # .env 파일 자동 로드
 
-messages = [
-    {"role": "system", "content": "당신은 자동차 정비사로서 고장 원인을 설명해주는 도우미입니다."}
-]
+# 세션별 대화 메모리 (토큰 예산 안에서만 이전 대화 전송)
+memory = SessionMemory(
+    {"role": "system", "content": "당신은 자동차 정비사로서 고장 원인을 설명해주는 도우미입니다."},
+    max_tokens=int(os.getenv("CHAT_MAX_TOKENS", "2000"))
+)
 
-def chat_with_gpt(user_input):
-    messages.append({"role": "user", "content": user_input})
-    response = client.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=messages
-    )
-    bot_reply = response.choices[0].message.content
-    messages.append({"role": "assistant", "content": bot_reply})
+async def chat_with_gpt(user_input, request: gr.Request):
+    session_id = request.session_hash
+    memory.append(session_id, "user", user_input)
+    try:
+        with usage_context(session_id=session_id):
+            response = await acomplete(
+                memory.build_messages(session_id),
+                model="gpt-3.5-turbo",
+                provider="openai"
+            )
+    except BaseException:
+        # 타임아웃/취소/오류 시 답 없는 질문이 기록에 남지 않도록 되돌림
+        memory.pop_last(session_id)
+        raise
+    bot_reply = response["text"]
+    memory.append(session_id, "assistant", bot_reply)
     return bot_reply
 
 demo = gr.Interface(
@@ -34,4 +45,5 @@ demo = gr.Interface(
     description="GPT-3.5 기반 자동차 문제 해결 도우미"
 )
 
+demo.queue(default_concurrency_limit=int(os.getenv("GRADIO_CONCURRENCY", "200")))
 demo.launch(share=True)
@@ -0,0 +1,126 @@
+import threading
+import time
+from collections import OrderedDict
+
+# ✅ 토큰 카운터 (tiktoken 없으면 글자 수 기반 근사치 사용)
+try:
+    import tiktoken
+    _encoding = tiktoken.encoding_for_model("gpt-3.5-turbo")
+
+    def count_tokens(text: str) -> int:
+        return len(_encoding.encode(text))
+except Exception:
+    def count_tokens(text: str) -> int:
+        # 한글(비 ASCII)은 대략 1글자 ≒ 1토큰, 영문(ASCII)은 4글자 ≒ 1토큰
+        wide = sum(1 for ch in text if ord(ch) > 127)
+        return max(1, wide + (len(text) - wide + 3) // 4)
+
+# 메시지 한 개당 role/구분자 오버헤드 (OpenAI 채팅 포맷 기준)
+MESSAGE_OVERHEAD = 4
+
+
+# ✅ 기본 요약 함수: 오래된 턴의 첫 문장만 남겨서 누적
+def summarize_turns(previous_summary: str, turns: list, max_tokens: int) -> str:
+    lines = [previous_summary] if previous_summary else []
+    for msg in turns:
+        first_sentence = msg["content"].strip().split("\n")[0].split(". ")[0][:200]
+        prefix = "사용자" if msg["role"] == "user" else "정비사"
+        lines.append(f"- {prefix}: {first_sentence}")
+
+    # 요약도 예산을 넘지 않도록 오래된 줄부터 버림
+    while len(lines) > 1 and count_tokens("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+class _Session:
+    def __init__(self):
+        self.turns = []          # [{"role", "content", "tokens"}]
+        self.turn_tokens = 0     # turns 전체 토큰 합계 (증분 관리)
+        self.summary = ""
+        self.summary_tokens = 0
+        self.last_access = time.time()
+
+
+# ✅ Gradio 세션별 대화 메모리 (토큰 예산 + 유휴 세션 만료)
+class SessionMemory:
+    def __init__(self, system_prompt: dict, max_tokens: int = 2000, summary_tokens: int = 300,
+                 idle_ttl: float = 1800, max_sessions: int = 1000, summarizer=summarize_turns):
+        self.system_prompt = system_prompt
+        self.system_tokens = count_tokens(system_prompt["content"]) + MESSAGE_OVERHEAD
+        self.max_tokens = max_tokens
+        self.summary_tokens = summary_tokens
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self.summarizer = summarizer
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, session_id: str) -> _Session:
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = _Session()
+            self._sessions[session_id] = session
+        self._sessions.move_to_end(session_id)
+        session.last_access = time.time()
+        return session
+
+    # 유휴 세션 및 최대 세션 수 초과분 제거 (가장 오래 안 쓴 세션부터)
+    def evict_idle(self):
+        now = time.time()
+        with self._lock:
+            while self._sessions:
+                session_id, session = next(iter(self._sessions.items()))
+                if now - session.last_access > self.idle_ttl or len(self._sessions) > self.max_sessions:
+                    del self._sessions[session_id]
+                else:
+                    break
+
+    def _trim(self, session: _Session):
+        budget = self.max_tokens - self.system_tokens - self.summary_tokens
+        dropped = []
+        # 최신 턴은 항상 남기고, 예산을 넘는 오래된 턴부터 잘라냄
+        while len(session.turns) > 1 and session.turn_tokens > budget:
+            msg = session.turns.pop(0)
+            session.turn_tokens -= msg["tokens"]
+            dropped.append(msg)
+
+        if dropped:
+            session.summary = self.summarizer(session.summary, dropped, self.summary_tokens)
+            session.summary_tokens = count_tokens(session.summary) + MESSAGE_OVERHEAD if session.summary else 0
+
+    def append(self, session_id: str, role: str, content: str):
+        with self._lock:
+            session = self._get(session_id)
+            tokens = count_tokens(content) + MESSAGE_OVERHEAD
+            session.turns.append({"role": role, "content": content, "tokens": tokens})
+            session.turn_tokens += tokens
+            self._trim(session)
+        self.evict_idle()
+
+    # OpenAI API로 보낼 메시지 목록 (system + 요약 + 최근 턴)
+    def build_messages(self, session_id: str) -> list:
+        with self._lock:
+            session = self._get(session_id)
+            messages = [self.system_prompt.copy()]
+            if session.summary:
+                messages.append({"role": "system", "content": f"이전 대화 요약:\n{session.summary}"})
+            messages.extend({"role": m["role"], "content": m["content"]} for m in session.turns)
+            return messages
+
+    def token_count(self, session_id: str) -> int:
+        with self._lock:
+            session = self._get(session_id)
+            return self.system_tokens + session.summary_tokens + session.turn_tokens
+
+    # 오류 등으로 답변을 못 받았을 때 마지막 사용자 메시지 되돌리기
+    def pop_last(self, session_id: str):
+        with self._lock:
+            session = self._get(session_id)
+            if session.turns:
+                msg = session.turns.pop()
+                session.turn_tokens -= msg["tokens"]
+
+    def reset(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
@@ -1,4 +1,4 @@
-import openai
+import asyncio
 import gradio as gr
 import sys
 import io
@@ -8,15 +8,12 @@ sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
 
 import os
 from dotenv import load_dotenv
+from .session_memory import SessionMemory
+from common.llm_client import astream, LLMError
+from common.usage import usage_context
 
 load_dotenv()  # .env 파일 자동 로드
 
-api_key = os.getenv("OPENAI_API_KEY")
-
-
-# ✅ OpenAI Client
-client = openai.OpenAI(api_key=api_key)  # API 키는 보안상 생략 권장
-
 # ✅ 시스템 프롬프트
 SYSTEM_PROMPT = {
     "role": "system",
@@ -28,35 +25,72 @@ SYSTEM_PROMPT = {
     )
 }
 
-# ✅ 메시지 초기화
-messages = [SYSTEM_PROMPT.copy()]
+# ✅ 세션별 대화 메모리 (토큰 예산 초과 시 오래된 턴은 요약으로 대체)
+memory = SessionMemory(
+    SYSTEM_PROMPT,
+    max_tokens=int(os.getenv("CHAT_MAX_TOKENS", "2000")),
+    idle_ttl=float(os.getenv("CHAT_SESSION_TTL", "1800"))
+)
+
+# ✅ 스트림 펌프: astream 전체를 태스크 하나에서 소비 (usage_context / 트레이싱 span이 yield 사이에 끊기지 않도록)
+async def _pump(session_id, messages, pieces: asyncio.Queue):
+    try:
+        with usage_context(session_id=session_id):
+            async for piece in astream(messages, model="gpt-3.5-turbo", provider="openai"):
+                await pieces.put(piece)
+        await pieces.put(None)
+    except Exception as e:
+        await pieces.put(e)
 
-# ✅ 응답 생성 함수
-def respond(user_input, chat_history):
+# ✅ 응답 생성 함수 (비동기 제너레이터: 토큰이 올 때마다 마지막 말풍선을 갱신)
+async def respond(user_input, chat_history, request: gr.Request):
     if not user_input.strip():
-        return "", chat_history
+        yield "", chat_history
+        return
 
-    messages.append({"role": "user", "content": user_input})
+    session_id = request.session_hash
+    memory.append(session_id, "user", user_input)
+    chat_history = chat_history + [(user_input, "")]
+    assistant_reply = ""
 
+    # ✅ 중지 버튼 / 브라우저 연결 끊김 → Gradio가 태스크를 취소 → 펌프 취소 → HTTP 스트림 닫힘 (과금 토큰 중단)
+    pieces = asyncio.Queue()
+    pump = asyncio.create_task(_pump(session_id, memory.build_messages(session_id), pieces))
     try:
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=messages
-        )
-        assistant_reply = response.choices[0].message.content.strip()
-        assistant_reply = assistant_reply.encode('utf-8', errors='ignore').decode('utf-8')
-        messages.append({"role": "assistant", "content": assistant_reply})
-        chat_history.append((user_input, assistant_reply))
-        return "", chat_history
+        while True:
+            piece = await pieces.get()
+            if piece is None:
+                break
+            if isinstance(piece, Exception):
+                raise piece
+            assistant_reply += piece.encode('utf-8', errors='ignore').decode('utf-8')
+            chat_history[-1] = (user_input, assistant_reply)
+            yield "", chat_history
+        memory.append(session_id, "assistant", assistant_reply.strip())
+        chat_history[-1] = (user_input, assistant_reply.strip())
+        yield "", chat_history
+    except asyncio.CancelledError:
+        # 화면에 남은 부분 답변은 메모리에도 남겨 다음 질문의 맥락으로 사용
+        if assistant_reply.strip():
+            memory.append(session_id, "assistant", assistant_reply.strip())
+        else:
+            memory.pop_last(session_id)
+        raise
+    except LLMError:
+        memory.pop_last(session_id)
+        chat_history[-1] = (user_input, "⚠️ 응답 시간이 초과되었습니다. 다시 시도해 주세요.")
+        yield "", chat_history
     except Exception as e:
+        memory.pop_last(session_id)
         error_msg = f"⚠️ 오류 발생: {str(e)}"
-        chat_history.append((user_input, error_msg))
-        return "", chat_history
+        chat_history[-1] = (user_input, error_msg)
+        yield "", chat_history
+    finally:
+        pump.cancel()
 
 # ✅ 대화 초기화 함수
-def clear_history():
-    global messages
-    messages = [SYSTEM_PROMPT.copy()]
+def clear_history(request: gr.Request):
+    memory.reset(request.session_hash)
     return []
 
 # ✅ 함수로 Wrapping
@@ -75,10 +109,12 @@ def tab3_ui():
             with gr.Row():
                 msg = gr.Textbox(placeholder="고장 증상을 입력하세요", label="증상 입력", scale=5)
                 send_btn = gr.Button("📤 전송", scale=1)
+                stop_btn = gr.Button("⏹ 중지", scale=1)
                 clear_btn = gr.Button("🧹 새 상담", scale=1)
 
-            msg.submit(respond, [msg, chatbot], [msg, chatbot])
-            send_btn.click(respond, [msg, chatbot], [msg, chatbot])
+            submit_event = msg.submit(respond, [msg, chatbot], [msg, chatbot])
+            click_event = send_btn.click(respond, [msg, chatbot], [msg, chatbot])
+            stop_btn.click(None, cancels=[submit_event, click_event])
             clear_btn.click(clear_history, outputs=chatbot)
 
     return demo